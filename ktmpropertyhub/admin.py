@@ -1,11 +1,15 @@
 from django.contrib import admin
 from django import forms
-from .models import PropertyListing, Facility, PropertyImage
+from .models import PropertyListing, Facility, ArchivedListing, ImageAsset, Job
+from . import archive, image_dedup, jobs, tasks
 from multiupload.fields import MultiMediaField
+from django.conf import settings
 from django.utils.text import slugify
 from django.utils.html import format_html
-import cloudinary.uploader
+from django.utils import timezone
+import os
 import time
+import uuid
 
 @admin.register(Facility)
 class FacilityAdmin(admin.ModelAdmin):
@@ -106,28 +110,49 @@ class PropertyListingAdmin(admin.ModelAdmin):
             prop_title_slug = slugify(obj.title)
             # 1. Define the target folder path cleanly.
             folder_path = f"property_images/{obj.id}-{prop_title_slug}"
+            # Only hand uploads to the job queue where a worker shares the
+            # spool directory; elsewhere (e.g. Vercel) upload them right away.
+            spool = bool(settings.JOB_SPOOL_DIR)
+            if spool:
+                os.makedirs(settings.JOB_SPOOL_DIR, exist_ok=True)
 
+            reused = queued = 0
             for image_file in files:
                 # 2. Define the desired filename (without extension).
                 original_filename = image_file.name.split('.')[0]
                 timestamp = int(time.time())
                 file_name = f"{original_filename}-{timestamp}"
-                
-                # 3. Call the uploader with the explicit 'folder' and 'public_id' parameters.
-                upload_result = cloudinary.uploader.upload(
-                    image_file,
-                    folder=folder_path,
-                    public_id=file_name,
-                    overwrite=True,
-                    resource_type="image"
-                )
-                
-                # 4. Save the full public_id (folder/filename) that Cloudinary returns.
-                # This remains the correct approach.
-                PropertyImage.objects.create(
-                    property_listing=obj,
-                    image=upload_result['public_id'] 
+
+                if not spool:
+                    # 3. Upload it (unless the same picture is already
+                    # stored) with the explicit 'folder' and 'public_id'.
+                    tasks.store_listing_image(obj.id, image_file, image_dedup.hash_upload(image_file), folder_path, file_name)
+                    continue
+
+                # 3. Keep a local copy for the worker; the request's upload
+                # is gone once the response is sent. Hashed on the way, so
+                # a file that is already stored is attached right away.
+                spooled_file = f"{uuid.uuid4().hex}-{os.path.basename(image_file.name)}"
+                sha256 = image_dedup.spool_upload(image_file, tasks.spool_path(spooled_file))
+                asset = image_dedup.find_exact(sha256)
+                if asset is not None and image_dedup.attach(obj.id, asset, image_file.size):
+                    os.remove(tasks.spool_path(spooled_file))
+                    reused += 1
+                    continue
+
+                # 4. The worker uploads it to Cloudinary with the explicit
+                # 'folder' and 'public_id' and saves the returned public_id.
+                jobs.enqueue(
+                    tasks.upload_listing_image,
+                    {'listing_id': obj.id, 'spooled_file': spooled_file, 'folder': folder_path, 'public_id': file_name, 'sha256': sha256},
+                    key=f"upload:{obj.id}:{spooled_file}",
                 )
+                queued += 1
+
+            if reused:
+                self.message_user(request, f"{reused} image(s) were already stored and have been added without uploading.")
+            if queued:
+                self.message_user(request, f"{queued} image(s) queued for upload; they will appear shortly.")
 
     def get_existing_images_preview(self, obj):
         if not obj.pk:
@@ -156,4 +181,59 @@ class PropertyListingAdmin(admin.ModelAdmin):
             'ktmpropertyhub/js/admin_filters.js',         # For State/District dropdowns
             'ktmpropertyhub/js/admin_dynamic_forms.js',    # For ALL conditional fields
             'ktmpropertyhub/js/admin_land_size.js'
-        )
\ No newline at end of file
+        )
+
+
+@admin.register(ArchivedListing)
+class ArchivedListingAdmin(admin.ModelAdmin):
+    list_display = ('title', 'id', 'user', 'reason', 'created_at', 'archived_at')
+    list_filter = ('reason',)
+    search_fields = ('title', 'user__username')
+    list_select_related = ('user',)
+    list_per_page = 25
+    actions = ['restore_listings']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description="Restore selected listings")
+    def restore_listings(self, request, queryset):
+        restored = 0
+        for archived in queryset.prefetch_related('images'):
+            archive.restore_listing(archived)
+            restored += 1
+        self.message_user(request, f"Restored {restored} listings.")
+
+
+@admin.register(ImageAsset)
+class ImageAssetAdmin(admin.ModelAdmin):
+    list_display = ('public_id', 'size', 'width', 'height', 'reuse_count', 'bytes_saved', 'created_at')
+    search_fields = ('public_id', 'sha256')
+    readonly_fields = [field.name for field in ImageAsset._meta.fields]
+    list_per_page = 50
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'id', 'status', 'attempts', 'run_at', 'created_at', 'finished_at')
+    list_filter = ('status', 'name')
+    search_fields = ('idempotency_key',)
+    readonly_fields = [field.name for field in Job._meta.fields]
+    list_per_page = 50
+    actions = ['retry_jobs']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Retry selected jobs now")
+    def retry_jobs(self, request, queryset):
+        retried = queryset.exclude(status=Job.Status.RUNNING).update(
+            status=Job.Status.QUEUED, run_at=timezone.now(), attempts=0, finished_at=None,
+        )
+        self.message_user(request, f"Requeued {retried} jobs.")
@@ -0,0 +1,191 @@
+"""
+Price-per-sqft analytics served from `PricePerAreaSummary`.
+
+Each summary row carries a `QuantileSketch`: a histogram over logarithmically
+sized buckets (the DDSketch layout). Any value is reported within
+`RELATIVE_ACCURACY` of its true value, the number of buckets is bounded by the
+range of prices rather than the number of listings, and two sketches merge by
+adding bucket counts. Because counts can also be subtracted, a listing save
+or delete updates its slice in place instead of forcing a recomputation.
+"""
+import math
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import PropertyListing, PricePerAreaSummary
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+
+SLICE_FIELDS = ('district_id', 'property_type', 'listing_purpose')
+LISTING_FIELDS = ('is_active', 'price', 'total_land_area_sqft') + SLICE_FIELDS
+
+
+class QuantileSketch:
+    """
+    A mergeable, relative-error quantile sketch for positive values.
+    Serialized as {bucket index (as str): count} for the JSONField.
+    """
+
+    def __init__(self, buckets=None):
+        self.buckets = {int(k): v for k, v in (buckets or {}).items() if v}
+
+    def to_json(self):
+        return {str(k): v for k, v in self.buckets.items()}
+
+    @property
+    def count(self):
+        return sum(self.buckets.values())
+
+    def add(self, value, count=1):
+        key = math.ceil(math.log(value) / LOG_GAMMA)
+        total = self.buckets.get(key, 0) + count
+        if total > 0:
+            self.buckets[key] = total
+        else:
+            self.buckets.pop(key, None)
+
+    def remove(self, value):
+        self.add(value, -1)
+
+    def merge(self, other):
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        return self
+
+    def quantiles(self, qs):
+        """
+        Return the estimated value at each quantile in `qs` (0..1).
+        """
+        total = self.count
+        if not total:
+            return [None for _ in qs]
+        keys = sorted(self.buckets)
+        results = []
+        for q in qs:
+            rank = q * (total - 1)
+            seen = 0
+            for key in keys:
+                seen += self.buckets[key]
+                if seen > rank:
+                    break
+            results.append(2 * GAMMA ** key / (GAMMA + 1))
+        return results
+
+
+def price_per_sqft(values):
+    """
+    The price per sqft a listing contributes, or None if it doesn't count
+    (inactive, or without a positive price and area; the sketch only holds
+    positive values).
+    """
+    price, area = values['price'], values['total_land_area_sqft']
+    if not values['is_active'] or price is None or area is None or price <= 0 or area <= 0:
+        return None
+    return float(price) / area
+
+
+def slice_key(values):
+    return tuple(values[field] for field in SLICE_FIELDS)
+
+
+def contribution(values):
+    """
+    (slice key, price per sqft) for a listing's field values, or None.
+    """
+    if values is None:
+        return None
+    value = price_per_sqft(values)
+    if value is None:
+        return None
+    return slice_key(values), value
+
+
+def listing_contribution(listing):
+    return contribution({field: getattr(listing, field) for field in LISTING_FIELDS})
+
+
+def stored_contribution(listing_id):
+    """
+    The contribution of the listing as it currently is in the database.
+    """
+    return contribution(PropertyListing.objects.filter(pk=listing_id).values(*LISTING_FIELDS).first())
+
+
+def apply_change(old, new):
+    """
+    Move a listing's contribution from `old` to `new` (either may be None),
+    locking the affected summary rows so concurrent saves don't lose counts.
+    """
+    apply_changes([(old, new)])
+
+
+def apply_changes(changes):
+    """
+    `apply_change` for many (old, new) pairs, updating each affected summary
+    row once.
+    """
+    deltas = defaultdict(list)
+    for old, new in changes:
+        if old == new:
+            continue
+        if old is not None:
+            deltas[old[0]].append((old[1], -1))
+        if new is not None:
+            deltas[new[0]].append((new[1], 1))
+    with transaction.atomic():
+        # Lock slices in a fixed order so concurrent batches can't deadlock.
+        for key in sorted(deltas, key=str):
+            _update_slice(key, deltas[key])
+
+
+def _update_slice(key, changes):
+    district_id, property_type, listing_purpose = key
+    lookup = dict(district_id=district_id, property_type=property_type, listing_purpose=listing_purpose)
+    summary = PricePerAreaSummary.objects.select_for_update().filter(**lookup).first()
+    if summary is None:
+        changes = [(value, delta) for value, delta in changes if delta > 0]
+        if not changes:
+            return  # Nothing recorded for this slice; a rebuild will reconcile it.
+        summary, _ = PricePerAreaSummary.objects.get_or_create(**lookup)
+        summary = PricePerAreaSummary.objects.select_for_update().get(pk=summary.pk)
+
+    sketch = QuantileSketch(summary.sketch)
+    # Additions first, so a removal never hits a bucket that is only
+    # filled later in the same batch.
+    for value, delta in sorted(changes, key=lambda change: -change[1]):
+        sketch.add(value, delta)
+        summary.count = max(summary.count + delta, 0)
+        summary.total = summary.total + delta * value if summary.count else 0
+    summary.sketch = sketch.to_json()
+    summary.save(update_fields=['sketch', 'count', 'total', 'updated_at'])
+
+
+def rebuild():
+    """
+    Recompute every summary row from the listing table. Returns the number of
+    listings counted.
+    """
+    sketches = {}
+    totals = {}
+    counted = 0
+    listings = PropertyListing.objects.filter(is_active=True, price__gt=0, total_land_area_sqft__gt=0)
+    for values in listings.values(*LISTING_FIELDS).iterator(chunk_size=5000):
+        key, value = contribution(values)
+        sketches.setdefault(key, QuantileSketch()).add(value)
+        totals[key] = totals.get(key, 0) + value
+        counted += 1
+
+    summaries = [
+        PricePerAreaSummary(
+            district_id=key[0], property_type=key[1], listing_purpose=key[2],
+            count=sketch.count, total=totals[key], sketch=sketch.to_json(),
+        )
+        for key, sketch in sketches.items()
+    ]
+    with transaction.atomic():
+        PricePerAreaSummary.objects.all().delete()
+        PricePerAreaSummary.objects.bulk_create(summaries, batch_size=500)
+    return counted
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class KtmpropertyhubConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'ktmpropertyhub'
+
+    def ready(self):
+        # Connect the model signal handlers (indexes, caches, alerts, ...).
+        from . import signals  # noqa: F401
@@ -0,0 +1,143 @@
+"""
+Hot/cold split for listings.
+
+Inactive listings are never shown publicly, and listings nobody has edited,
+viewed or asked about in a long time are as good as gone, but both stay in
+the listing table, so every public scan
+has to skip them and the table and its indexes keep growing.
+`archive_listings` moves them into `ArchivedListing` and
+`ArchivedListingImage` together with their images, facility links and
+counters, one batch per transaction. After that, `PropertyListing` only holds
+live rows.
+
+The hot rows are removed with an ordinary delete, so the post_delete
+signals remove the listing from the derived data (price summaries,
+similarity matrix, location counts, signatures) and cascade to its saved
+search matches. Restoring inserts the listing again under the same id through
+`save()` and `facilities.set()`, so the derived data picks it back up.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import counters
+from .models import (
+    ArchivedListing, ArchivedListingImage, District, Facility, ListingStats, PropertyImage, PropertyListing, State,
+)
+
+
+def candidates(now=None):
+    """
+    (reason, queryset) pairs of the listings due for archiving: inactive and
+    untouched for `LISTING_ARCHIVE_INACTIVE_AFTER_DAYS`, or active but without
+    an edit, view or contact request for `LISTING_ARCHIVE_MAX_AGE_DAYS`.
+    An old `updated_at` alone doesn't make a listing stale; plenty of live
+    listings are posted once and never edited.
+    """
+    now = now or timezone.now()
+    inactive_after = datetime.timedelta(days=getattr(settings, 'LISTING_ARCHIVE_INACTIVE_AFTER_DAYS', 30))
+    max_age = datetime.timedelta(days=getattr(settings, 'LISTING_ARCHIVE_MAX_AGE_DAYS', 365))
+    return [
+        (ArchivedListing.Reason.INACTIVE, PropertyListing.objects.filter(is_active=False, updated_at__lt=now - inactive_after)),
+        (ArchivedListing.Reason.STALE, PropertyListing.objects.filter(
+            Q(stats__isnull=True) | Q(stats__updated_at__lt=now - max_age),
+            is_active=True, updated_at__lt=now - max_age,
+        )),
+    ]
+
+
+def listing_data(listing):
+    return {
+        field.attname: field.value_from_object(listing)
+        for field in PropertyListing._meta.concrete_fields
+        if not field.primary_key
+    }
+
+
+def archive_batch(queryset, ids, reason):
+    """
+    Move the listings among `ids` that are still in `queryset` to the
+    archive. Returns how many were moved.
+    """
+    with transaction.atomic():
+        # Re-check the criteria under the lock, in case a listing was
+        # reactivated since the ids were read.
+        listings = list(
+            queryset.filter(pk__in=ids).select_for_update(of=('self',))
+            .order_by('pk').prefetch_related('facilities', 'images')
+        )
+        if not listings:
+            return 0
+        ids = [listing.pk for listing in listings]
+        stats = counters.counts(ids)
+        archived, images = [], []
+        for listing in listings:
+            archived.append(ArchivedListing(
+                id=listing.pk, user_id=listing.user_id, title=listing.title, created_at=listing.created_at,
+                reason=reason, data=listing_data(listing),
+                facility_ids=[facility.pk for facility in listing.facilities.all()],
+                **stats[listing.pk],
+            ))
+            images.extend(
+                ArchivedListingImage(listing_id=listing.pk, image=image.image, caption=image.caption, is_thumbnail=image.is_thumbnail)
+                for image in listing.images.all()
+            )
+        ArchivedListing.objects.bulk_create(archived)
+        ArchivedListingImage.objects.bulk_create(images, batch_size=1000)
+        PropertyListing.objects.filter(pk__in=ids).delete()
+    return len(listings)
+
+
+def archive_listings(batch_size=500, limit=None, now=None):
+    """
+    Archive every listing due for it, `batch_size` per transaction, stopping
+    after `limit` listings if given. Returns {reason: count}.
+    """
+    moved = {}
+    total = 0
+    for reason, queryset in candidates(now):
+        moved[reason] = 0
+        while limit is None or total < limit:
+            size = batch_size if limit is None else min(batch_size, limit - total)
+            ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:size])
+            if not ids:
+                break
+            n = archive_batch(queryset, ids, reason)
+            moved[reason] += n
+            total += n
+    return moved
+
+
+def restore_listing(archived):
+    """
+    Put an archived listing back in the hot table with its original id,
+    images, facilities and counters. Returns the restored listing.
+    """
+    with transaction.atomic():
+        listing = PropertyListing(pk=archived.pk)
+        for field in PropertyListing._meta.concrete_fields:
+            if field.attname in archived.data:
+                setattr(listing, field.attname, field.to_python(archived.data[field.attname]))
+        # Live listings lose a deleted state or district (SET_NULL); so do archived ones.
+        if listing.state_id is not None and not State.objects.filter(pk=listing.state_id).exists():
+            listing.state_id = None
+        if listing.district_id is not None and not District.objects.filter(pk=listing.district_id).exists():
+            listing.district_id = None
+        listing.save(force_insert=True)
+        # created_at is auto_now_add, which the insert overwrote.
+        PropertyListing.objects.filter(pk=listing.pk).update(created_at=archived.created_at)
+        listing.created_at = archived.created_at
+        listing._remember_loaded_values(['created_at'])
+
+        listing.facilities.set(Facility.objects.filter(pk__in=archived.facility_ids))
+        PropertyImage.objects.bulk_create([
+            PropertyImage(property_listing=listing, image=image.image, caption=image.caption, is_thumbnail=image.is_thumbnail)
+            for image in archived.images.all()
+        ])
+        if archived.view_count or archived.contact_count:
+            ListingStats.objects.create(listing=listing, view_count=archived.view_count, contact_count=archived.contact_count)
+        archived.delete()
+    return listing
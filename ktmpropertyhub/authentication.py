@@ -0,0 +1,102 @@
+"""
+JWT authentication that doesn't hit `auth_user` on every request.
+
+simplejwt's `JWTAuthentication` loads the user row for each authenticated
+request. `CachedJWTAuthentication` keeps what authorization needs about the
+user (`CACHED_FIELDS` and a digest of the password hash, never the hash or
+the rest of the row) in the shared cache for `AUTH_USER_CACHE_TIMEOUT`
+seconds. Other fields are loaded from the database on first access, like
+deferred fields.
+
+Entries are keyed by user id, a per-user generation and the token's password
+version (its `REVOKE_TOKEN_CLAIM`, when `CHECK_REVOKE_TOKEN` is on). Saving
+or deleting the user moves it to a new generation, which orphans its
+entries; that covers password changes and deactivation. The same checks are
+still applied to cached users. Bulk `QuerySet.update()` calls bypass the
+signals, so the timeout bounds how stale an entry can get.
+
+For endpoints that only need the user id, `ClaimsOnlyJWTAuthentication`
+builds the user from the token claims alone and never touches the database
+or cache; deactivated users keep access until their access token expires.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+# What authorization needs; anything else is loaded when first accessed.
+CACHED_FIELDS = ('id', 'username', 'is_active', 'is_staff', 'is_superuser')
+
+
+def generation_key(user_id):
+    return f'auth:user:{user_id}:generation'
+
+
+def user_cache_key(user_id, generation, password_version=''):
+    return f'auth:user:{user_id}:{generation}:{password_version}'
+
+
+def invalidate_cached_user(user_id):
+    """
+    Orphan every cached entry for the user by moving it to a new generation.
+    """
+    key = generation_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def cache_entry(user):
+    return {
+        'fields': {field: getattr(user, field) for field in CACHED_FIELDS},
+        'password_digest': get_md5_hash_password(user.password),
+    }
+
+
+def user_from_entry(entry):
+    """
+    A user instance with the cached fields; the others are deferred.
+    """
+    model, fields = get_user_model(), entry['fields']
+    # from_db() takes the values in the model's field order.
+    names = [field.attname for field in model._meta.concrete_fields if field.attname in fields]
+    return model.from_db(DEFAULT_DB_ALIAS, names, [fields[name] for name in names])
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        password_version = validated_token.get(jwt_settings.REVOKE_TOKEN_CLAIM, '') if jwt_settings.CHECK_REVOKE_TOKEN else ''
+        key = user_cache_key(user_id, cache.get(generation_key(user_id), 0), password_version)
+        entry = cache.get(key)
+        if entry is None:
+            # Not cached: load it and run simplejwt's checks the normal way.
+            user = super().get_user(validated_token)
+            cache.set(key, cache_entry(user), getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60))
+            return user
+
+        user = user_from_entry(entry)
+        if jwt_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if jwt_settings.CHECK_REVOKE_TOKEN and password_version != entry['password_digest']:
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
+
+
+class ClaimsOnlyJWTAuthentication(JWTStatelessUserAuthentication):
+    """
+    `request.user` is a `TokenUser` built from the token: use `.pk`/`.id`,
+    not model fields or relations.
+    """
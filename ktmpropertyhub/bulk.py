@@ -0,0 +1,188 @@
+"""
+Bulk create and partial update of a user's own listings.
+
+Every item is validated with the same serializer as the single-object
+endpoints. If any item is invalid nothing is written and the errors are
+reported per item, in request order (`{}` for the valid ones). Otherwise all
+rows are written in one transaction: `bulk_create`/`bulk_update` for the
+listings and bulk inserts into the through table for facilities.
+
+`bulk_create` and `bulk_update` skip `save()` and the model signals, so the
+work they would have done is repeated here in batch form: the land area
+calculation and sort keys (on update only when one of their inputs is
+sent), `updated_at`, facility bits, price summaries, saved-search
+matching, the similar-listings index, the location typeahead counts,
+the near-duplicate signatures and the change feed.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from . import analytics, changes, duplicates, edge_cache, facility_bits, locations, saved_searches, similarity
+from .models import PropertyListing
+
+Through = PropertyListing.facilities.through
+
+# The reverse `images` relation can't be bulk-written; images are managed separately.
+IGNORED_FIELDS = ('images',)
+
+
+def check_items(items):
+    max_items = getattr(settings, 'BULK_LISTINGS_MAX_ITEMS', 500)
+    if not isinstance(items, list) or not items:
+        raise ValidationError({'non_field_errors': ["Expected a non-empty list of items."]})
+    if len(items) > max_items:
+        raise ValidationError({'non_field_errors': [f"At most {max_items} items can be sent at once."]})
+
+
+def _validate(serializers):
+    errors = [{} if serializer.is_valid() else serializer.errors for serializer in serializers]
+    if any(errors):
+        raise ValidationError(errors)
+    return [serializer.validated_data for serializer in serializers]
+
+
+def _split(data):
+    """
+    Separate a validated item into plain field values and its facilities
+    (or None if it didn't send any).
+    """
+    data = {field: value for field, value in data.items() if field not in IGNORED_FIELDS}
+    facilities = data.pop('facilities', None)
+    if facilities is not None:
+        facilities = list({facility.pk: facility for facility in facilities}.values())
+    return data, facilities
+
+
+def _through_rows(listings, facility_lists):
+    return [
+        Through(propertylisting_id=listing.pk, facility_id=facility.pk)
+        for listing, facilities in zip(listings, facility_lists)
+        if facilities
+        for facility in facilities
+    ]
+
+
+def create_listings(user, items, serializer_class, context):
+    """
+    Validate and create one listing per item, owned by `user`.
+    """
+    check_items(items)
+    validated = _validate([serializer_class(data=item, context=context) for item in items])
+
+    listings, facility_lists = [], []
+    for data in validated:
+        data, facilities = _split(data)
+        listing = PropertyListing(user=user, **data)
+        listing.calculate_total_land_area()
+        listing.calculate_sort_keys()
+        listing.facility_bits = facility_bits.mask_of(facility.bit for facility in facilities or ())
+        listings.append(listing)
+        facility_lists.append(facilities)
+
+    with transaction.atomic():
+        PropertyListing.objects.bulk_create(listings)
+        Through.objects.bulk_create(_through_rows(listings, facility_lists))
+        analytics.apply_changes((None, analytics.listing_contribution(listing)) for listing in listings)
+        # One batch, so reposts within the same import are caught too.
+        duplicates.index_listings(listings)
+
+        active = [listing for listing in listings if listing.is_active]
+        ids = [listing.pk for listing in listings]
+        moves = [(None, _location(listing)) for listing in listings]
+        changes.record(ids, changes.CREATED)
+        edge_cache.listings_changed(ids, [(listing.district_id, listing.state_id) for listing in listings])
+        transaction.on_commit(lambda: saved_searches.record_matches(active))
+        transaction.on_commit(lambda: similarity.listings_changed(ids))
+        transaction.on_commit(lambda: locations.listings_changed(moves))
+    prefetch_related_objects(listings, 'facilities', 'images')
+    return listings
+
+
+def _item_id(item):
+    try:
+        return int(item['id'])
+    except (TypeError, KeyError, ValueError):
+        return None
+
+
+def update_listings(queryset, items, serializer_class, context):
+    """
+    Validate and apply a partial update per item. Each item names its listing
+    by `id`, which must be in `queryset` (the caller's own listings).
+    """
+    check_items(items)
+    ids = [_item_id(item) for item in items]
+    instances = queryset.in_bulk([pk for pk in ids if pk is not None])
+
+    serializers, errors, seen = [], [], set()
+    for item, pk in zip(items, ids):
+        error = {}
+        if pk is None:
+            error = {'id': ["A valid integer id is required."]}
+        elif pk not in instances:
+            error = {'id': ["Not found."]}
+        elif pk in seen:
+            error = {'id': ["Duplicate id."]}
+        seen.add(pk)
+        errors.append(error)
+        if not error:
+            data = {field: value for field, value in item.items() if field != 'id'}
+            serializers.append(serializer_class(instances[pk], data=data, partial=True, context=context))
+    if any(errors):
+        # Report the field errors of the remaining items too.
+        field_errors = iter([{} if s.is_valid() else s.errors for s in serializers])
+        raise ValidationError([error or next(field_errors) for error in errors])
+    validated = _validate(serializers)
+
+    listings, facility_lists, price_changes, moves, resigned = [], [], [], [], []
+    fields = {'updated_at'}
+    now = timezone.now()
+    for serializer, data in zip(serializers, validated):
+        listing = serializer.instance
+        old = analytics.listing_contribution(listing)
+        old_location = _location(listing)
+        data, facilities = _split(data)
+        for field, value in data.items():
+            setattr(listing, field, value)
+        fields.update(data)
+        area_changed = bool(listing.LAND_AREA_FIELDS.intersection(data))
+        if area_changed:
+            listing.calculate_total_land_area()
+            fields.update(listing.LAND_AREA_FIELDS)
+        if area_changed or listing.SORT_KEY_INPUTS.intersection(data):
+            listing.calculate_sort_keys()
+            fields.update(listing.SORT_KEY_FIELDS)
+        listing.updated_at = now
+        if facilities is not None:
+            listing.facility_bits = facility_bits.mask_of(facility.bit for facility in facilities)
+            fields.add('facility_bits')
+        listings.append(listing)
+        facility_lists.append(facilities)
+        price_changes.append((old, analytics.listing_contribution(listing)))
+        moves.append((old_location, _location(listing)))
+        written = set(data) | (listing.LAND_AREA_FIELDS if area_changed else set())
+        if not {PropertyListing._meta.get_field(field).attname for field in written}.isdisjoint(duplicates.LISTING_FIELDS):
+            resigned.append(listing)
+
+    with transaction.atomic():
+        PropertyListing.objects.bulk_update(listings, sorted(fields), batch_size=500)
+        replaced = [listing.pk for listing, facilities in zip(listings, facility_lists) if facilities is not None]
+        Through.objects.filter(propertylisting_id__in=replaced).delete()
+        Through.objects.bulk_create(_through_rows(listings, facility_lists))
+        analytics.apply_changes(price_changes)
+        duplicates.index_listings(resigned)
+
+        ids = [listing.pk for listing in listings]
+        changes.record(ids, changes.UPDATED)
+        edge_cache.listings_changed(ids, {location for listing in listings for location in edge_cache.locations_of(listing)})
+        transaction.on_commit(lambda: similarity.listings_changed(ids))
+        transaction.on_commit(lambda: locations.listings_changed(moves))
+    prefetch_related_objects(listings, 'facilities', 'images')
+    return listings
+
+
+def _location(listing):
+    return locations.location_of({field: getattr(listing, field) for field in locations.LISTING_FIELDS})
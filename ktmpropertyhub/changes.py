@@ -0,0 +1,100 @@
+"""
+Listing change log behind `/api/properties/changes/`.
+
+Every write that can change what the public API shows for a listing (a
+save, its facilities or images changing, a delete) appends a small
+`ListingChange` row: listing id and kind, no payload. The row id is the
+feed's cursor, so a client that remembers the last cursor it saw reads only
+the rows after it. The cost of a sync grows with the number of changes
+rather than with the size of the listing table.
+
+Rows are written once the transaction commits, so rolled-back writes never
+show up and ids are handed out in commit order. Two commits can still
+insert their rows concurrently and become visible out of id order, so the
+feed holds back rows younger than `LISTING_CHANGES_LAG_SECONDS`, which
+leaves time for the lower id to become visible. Rows older than
+`LISTING_CHANGES_RETENTION_DAYS` are pruned (`manage.py prune_listing_changes`);
+a cursor from before the oldest remaining row can't be continued, and the
+client has to download the listings again.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import ListingChange
+
+CREATED = ListingChange.Kind.CREATED
+UPDATED = ListingChange.Kind.UPDATED
+DELETED = ListingChange.Kind.DELETED
+
+
+def record(listing_ids, kind):
+    """
+    Log a change of `kind` to each listing once the current transaction
+    commits.
+    """
+    listing_ids = list(listing_ids)
+    if listing_ids:
+        transaction.on_commit(lambda: ListingChange.objects.bulk_create(
+            [ListingChange(listing_id=listing_id, kind=kind) for listing_id in listing_ids], batch_size=1000,
+        ))
+
+
+def head():
+    """
+    The newest cursor, for a client starting from a fresh full download.
+    """
+    return ListingChange.objects.aggregate(head=Max('id'))['head'] or 0
+
+
+def expired(since):
+    """
+    Whether changes after cursor `since` may already have been pruned.
+    """
+    oldest = ListingChange.objects.aggregate(oldest=Min('id'))['oldest']
+    return oldest is not None and since < oldest - 1
+
+
+def read(since, limit):
+    """
+    Up to `limit` change rows after cursor `since`, coalesced to one
+    (cursor, listing id, kind) per listing in cursor order, plus the cursor
+    to continue from and whether more rows are waiting.
+    """
+    lag = datetime.timedelta(seconds=getattr(settings, 'LISTING_CHANGES_LAG_SECONDS', 2))
+    rows = list(
+        ListingChange.objects.filter(id__gt=since, created_at__lte=timezone.now() - lag)
+        .order_by('id').values_list('id', 'listing_id', 'kind')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    latest = {}
+    for cursor, listing_id, kind in rows:
+        # A listing created and then updated within the page is still new to the client.
+        if kind == UPDATED and latest.get(listing_id, (None, None))[1] == CREATED:
+            kind = CREATED
+        latest[listing_id] = (cursor, kind)
+    changes = sorted((cursor, listing_id, kind) for listing_id, (cursor, kind) in latest.items())
+    return changes, (rows[-1][0] if rows else since), has_more
+
+
+def prune(batch_size=5000, now=None):
+    """
+    Delete change rows older than the retention period, in batches. The
+    newest row is always kept, so `expired()` can still tell stale cursors
+    apart. Returns the number of rows deleted.
+    """
+    now = now or timezone.now()
+    retention = datetime.timedelta(days=getattr(settings, 'LISTING_CHANGES_RETENTION_DAYS', 30))
+    newest = head()
+    old = ListingChange.objects.filter(created_at__lt=now - retention, id__lt=newest).order_by('id')
+    deleted = 0
+    while True:
+        ids = list(old.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += ListingChange.objects.filter(id__in=ids).delete()[0]
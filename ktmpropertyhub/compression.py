@@ -0,0 +1,97 @@
+"""
+Negotiated gzip/brotli compression for API responses.
+
+Django's `GZipMiddleware` only speaks gzip and compresses anything over 200
+bytes. This middleware picks brotli when the client accepts it and the
+`brotli` package is installed (it is optional), gzip otherwise, honouring
+q-values in `Accept-Encoding`, and only bothers with responses of at least
+`COMPRESSION_MIN_SIZE` bytes of a compressible type under
+`COMPRESSION_PATH_PREFIXES`.
+
+Responses under `COMPRESSION_EXCLUDE_PREFIXES` (the auth endpoints, which
+return tokens) are never compressed, as a defence against BREACH-style
+attacks. Static files are served precompressed by WhiteNoise.
+"""
+import gzip
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/', 'application/javascript', 'application/xml')
+
+
+def accepted_encodings(header):
+    """
+    {encoding: q} from an Accept-Encoding header.
+    """
+    encodings = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        encodings[name.strip().lower()] = q
+    return encodings
+
+
+def choose_encoding(header):
+    accepted = accepted_encodings(header)
+    candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+    # Take the highest q; on a tie, prefer brotli (listed first).
+    best = max(candidates, key=lambda name: accepted.get(name, accepted.get('*', 0)))
+    return best if accepted.get(best, accepted.get('*', 0)) > 0 else None
+
+
+def compress(content, encoding):
+    if encoding == 'br':
+        return brotli.compress(content, quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5))
+    return gzip.compress(content, compresslevel=getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6), mtime=0)
+
+
+class CompressionMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.prefixes = tuple(getattr(settings, 'COMPRESSION_PATH_PREFIXES', ('/api/',)))
+        self.excluded = tuple(getattr(settings, 'COMPRESSION_EXCLUDE_PREFIXES', ('/api/auth/',)))
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not request.path.startswith(self.prefixes) or request.path.startswith(self.excluded):
+            return response
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if not response.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES):
+            return response
+
+        # Whether or not this response is compressed, others at this URL may be.
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < self.min_size:
+            return response
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # The body changed, so a strong ETag no longer describes it.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,123 @@
+"""
+Write-buffered listing counters (detail views and contact clicks).
+
+Counting every detail view with an UPDATE would turn the most popular read
+into a hot-row write. Instead increments accumulate in a per-process buffer
+and are flushed at most every `LISTING_COUNTERS_FLUSH_INTERVAL` seconds (or
+once `LISTING_COUNTERS_MAX_PENDING` listings are pending) as one batched
+`UPDATE ... SET n = n + delta` on `ListingStats`, never on the listing row.
+Counts still in a buffer when its process dies are lost; that window is
+accepted. Serverless functions (`SERVERLESS`) set the interval to 0 and so
+write every increment before responding, as their memory may be discarded
+as soon as the response is sent.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ListingStats, PropertyListing
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('view_count', 'contact_count')
+
+
+class CounterBuffer:
+    """
+    Pending increments per listing: {listing_id: {field: delta}}.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.flushed_at = time.monotonic()
+
+    def incr(self, listing_id, field, n=1):
+        with self.lock:
+            counts = self.pending.setdefault(listing_id, dict.fromkeys(FIELDS, 0))
+            counts[field] += n
+            due = (
+                len(self.pending) >= getattr(settings, 'LISTING_COUNTERS_MAX_PENDING', 1000)
+                or time.monotonic() - self.flushed_at >= getattr(settings, 'LISTING_COUNTERS_FLUSH_INTERVAL', 30)
+            )
+            if due:
+                # Claim the flush so concurrent requests don't also start one.
+                self.flushed_at = time.monotonic()
+        if due:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all pending increments. On a database error they are put back
+        for the next flush. Returns the number of listings written.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flushed_at = time.monotonic()
+        if not pending:
+            return 0
+        try:
+            return write(pending)
+        except DatabaseError:
+            logger.exception("Flushing %d listing counters failed; will retry.", len(pending))
+            with self.lock:
+                for listing_id, counts in pending.items():
+                    current = self.pending.setdefault(listing_id, dict.fromkeys(FIELDS, 0))
+                    for field, n in counts.items():
+                        current[field] += n
+            return 0
+
+    def pending_for(self, listing_id):
+        with self.lock:
+            return dict(self.pending.get(listing_id) or dict.fromkeys(FIELDS, 0))
+
+
+def write(pending):
+    """
+    Add the deltas in `pending` to the stored counters, creating missing rows.
+    Listings deleted in the meantime are skipped.
+    """
+    existing = set(PropertyListing.objects.filter(pk__in=pending).order_by().values_list('pk', flat=True))
+    now = timezone.now()
+    rows = []
+    for listing_id in existing:
+        stats = ListingStats(listing_id=listing_id, updated_at=now)
+        for field, n in pending[listing_id].items():
+            setattr(stats, field, F(field) + n)
+        rows.append(stats)
+    with transaction.atomic():
+        ListingStats.objects.bulk_create([ListingStats(listing_id=pk) for pk in existing], ignore_conflicts=True)
+        ListingStats.objects.bulk_update(rows, FIELDS + ('updated_at',), batch_size=500)
+    return len(rows)
+
+
+buffer = CounterBuffer()
+atexit.register(buffer.flush)
+
+
+def record_view(listing_id):
+    buffer.incr(listing_id, 'view_count')
+
+
+def record_contact(listing_id):
+    buffer.incr(listing_id, 'contact_count')
+
+
+def counts(listing_ids):
+    """
+    {listing_id: {field: count}} for the given listings, including this
+    process's unflushed increments.
+    """
+    result = {listing_id: dict.fromkeys(FIELDS, 0) for listing_id in listing_ids}
+    for row in ListingStats.objects.filter(listing_id__in=result).values('listing_id', *FIELDS):
+        result[row.pop('listing_id')].update(row)
+    for listing_id, stored in result.items():
+        for field, n in buffer.pending_for(listing_id).items():
+            stored[field] += n
+    return result
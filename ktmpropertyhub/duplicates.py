@@ -0,0 +1,165 @@
+"""
+Near-duplicate listing detection with MinHash and locality-sensitive hashing.
+
+A listing's text (title, description and local area) is cut into overlapping
+character shingles, and its MinHash signature is the minimum of each of
+`NUM_PERM` hash functions over those shingles; the fraction of positions at
+which two signatures agree estimates the Jaccard similarity of the shingle
+sets.
+
+To find candidates without comparing against every listing, the signature is
+split into `BANDS` bands of `ROWS` values and each band is hashed, together
+with the district, property type and a coarse area bucket, into a key stored
+in `ListingSignatureBand`. Two listings become candidates if they share any
+key, which happens with high probability above a similarity of about
+(1 / BANDS) ** (1 / ROWS) ~= 0.7, and rarely below it. A lookup is therefore
+an indexed `key IN (...)` query plus an exact signature comparison against
+the few candidates. Neighbouring area buckets are queried too, so a small
+correction to the area doesn't hide a duplicate.
+
+Listings are flagged, not rejected: `ListingSignature.duplicate_of` points at
+the earliest (lowest id) earlier listing at or above
+`DUPLICATE_LISTING_THRESHOLD`, i.e. the presumed original.
+"""
+import hashlib
+import math
+import re
+
+import numpy as np
+from django.conf import settings
+
+from .models import ListingSignature, ListingSignatureBand
+
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 5
+# Area buckets are ~30% wide on a log scale.
+AREA_BUCKET_BASE = 1.3
+
+# Listing fields the signature and band keys are computed from.
+LISTING_FIELDS = (
+    'id', 'title', 'description', 'local_area', 'district_id', 'property_type',
+    'total_land_area_sqft', 'built_up_area_sqft',
+)
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(0x4b544d)  # fixed, so signatures agree across processes
+_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+
+_non_word = re.compile(r'[^\w]+')
+
+
+def shingles(values):
+    text = ' '.join(values.get(field) or '' for field in ('title', 'description', 'local_area'))
+    text = _non_word.sub(' ', text).strip().casefold()
+    if len(text) < SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def _hash(data, size=4):
+    return int.from_bytes(hashlib.blake2b(data.encode(), digest_size=size).digest(), 'little')
+
+
+def minhash(values):
+    hashes = np.fromiter((_hash(s) % _PRIME for s in shingles(values)), dtype=np.uint64)
+    # (a * x + b) mod p for every hash function and shingle; a, x < 2**31 so
+    # the product fits in 64 bits.
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1)
+
+
+def similarity(a, b):
+    return float(np.mean(np.asarray(a) == np.asarray(b)))
+
+
+def area_bucket(values):
+    area = values.get('total_land_area_sqft') or values.get('built_up_area_sqft')
+    return math.floor(math.log(area) / math.log(AREA_BUCKET_BASE)) if area else None
+
+
+def band_keys(signature, values, bucket):
+    prefix = f"{values.get('district_id')}:{values.get('property_type')}:{bucket}"
+    keys = []
+    for band in range(BANDS):
+        rows = ','.join(str(v) for v in signature[band * ROWS:(band + 1) * ROWS])
+        # Signed 64-bit, to fit a BigIntegerField.
+        keys.append(_hash(f'{prefix}:{band}:{rows}', 8) - (1 << 63))
+    return keys
+
+
+def lookup_keys(signature, values):
+    bucket = area_bucket(values)
+    if bucket is None:
+        return band_keys(signature, values, None)
+    return [key for b in (bucket - 1, bucket, bucket + 1) for key in band_keys(signature, values, b)]
+
+
+def _chunks(items, size=500):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def index_listings(listings):
+    """
+    (Re)compute the signatures and band keys of `listings` (model instances
+    or dicts with `LISTING_FIELDS`) and flag each one's earliest similar
+    earlier listing, including ones in the same batch. Returns
+    {listing_id: (duplicate_of, similarity) or None}.
+    """
+    threshold = getattr(settings, 'DUPLICATE_LISTING_THRESHOLD', 0.8)
+    listings = list(listings)
+    rows = [item if isinstance(item, dict) else {f: getattr(item, f) for f in LISTING_FIELDS} for item in listings]
+    if not rows:
+        return {}
+    ids = [row['id'] for row in rows]
+    signatures = [minhash(row) for row in rows]
+    queries = [lookup_keys(sig, row) for sig, row in zip(signatures, rows)]
+
+    ListingSignatureBand.objects.filter(listing_id__in=ids).delete()
+    ListingSignature.objects.filter(listing_id__in=ids).delete()
+
+    # Candidates already in the database, in one query per 500 keys.
+    stored = {}
+    for chunk in _chunks({key for keys in queries for key in keys}):
+        for key, listing_id in ListingSignatureBand.objects.filter(key__in=chunk).values_list('key', 'listing_id'):
+            stored.setdefault(key, set()).add(listing_id)
+    candidate_ids = set().union(*stored.values()) if stored else set()
+    known = {}
+    for chunk in _chunks(candidate_ids):
+        known.update(ListingSignature.objects.filter(listing_id__in=chunk).values_list('listing_id', 'minhash'))
+
+    results, new_signatures, new_bands, batch = {}, [], [], {}
+    for item, row, sig, keys in zip(listings, rows, signatures, queries):
+        candidates = set()
+        for key in keys:
+            candidates |= stored.get(key, set()) | batch.get(key, set())
+        # Only earlier listings can be the original, and the earliest similar
+        # one is, so re-indexing an old listing never points it at a repost.
+        best = None
+        for candidate in sorted(c for c in candidates if c < row['id']):
+            score = similarity(sig, known[candidate])
+            if score >= threshold:
+                best = (candidate, score)
+                break
+        results[row['id']] = best
+
+        own_keys = band_keys(sig, row, area_bucket(row))
+        for key in own_keys:
+            batch.setdefault(key, set()).add(row['id'])
+        known[row['id']] = sig.tolist()
+        signature = ListingSignature(
+            listing_id=row['id'], minhash=sig.tolist(),
+            duplicate_of_id=best[0] if best else None, similarity=best[1] if best else None,
+        )
+        if not isinstance(item, dict):
+            # Also caches the signature on the listing, for the response.
+            signature.listing = item
+        new_signatures.append(signature)
+        new_bands.extend(ListingSignatureBand(listing_id=row['id'], key=key) for key in own_keys)
+
+    ListingSignature.objects.bulk_create(new_signatures, batch_size=500)
+    ListingSignatureBand.objects.bulk_create(new_bands, batch_size=2000)
+    return results
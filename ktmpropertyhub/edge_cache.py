@@ -0,0 +1,269 @@
+"""
+Caching API responses at the edge (Vercel's CDN, or a CDN in front of it).
+
+Views with an `edge_cache_policy` send anonymous GET responses with
+`Cache-Control: public, max-age=..., s-maxage=..., stale-while-revalidate=...`
+from `EDGE_CACHE_POLICIES`, so the CDN answers repeated requests without
+running the function. Authenticated responses are marked private.
+
+Each cacheable response also names what it shows in `Surrogate-Key` (Fastly)
+and `Cache-Tag` (Cloudflare): `listing-<id>`, `district-<id>`, `state-<id>`,
+plus a collection key (`listings`, `states`, `districts`) on responses that a
+new row could join. Lists of listings also carry `listings-district-<id>` or
+`listings-state-<id>` for every location they could show a listing from (see
+`list_keys`), so a change to a listing purges the listing and the lists of
+the district and state it is in or has just left (see `listings_changed`),
+not every list, nor the states and districts endpoints. When listings,
+states or districts change, a job purges only the affected keys through the
+client configured in `EDGE_CACHE_PURGE`; without one, responses simply
+expire after `s-maxage`. Purges are sent once the write commits, never for
+a rolled-back one (see tasks.purge_edge_cache and jobs.defer): by a worker,
+which retries failures, or in the request where no worker runs.
+
+Purge clients are pluggable, like cache backends: a dotted path and options.
+`FakePurgeClient` records the keys instead of sending them, for tests and
+local development.
+"""
+import threading
+
+import requests
+from django.conf import settings
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.module_loading import import_string
+
+from . import jobs, reference_data
+from .models import PropertyListing, State
+
+# Each header with the separator its CDN expects.
+KEY_HEADERS = {'Surrogate-Key': ' ', 'Cache-Tag': ','}
+
+# Past this many keys a response keeps its collection, district and state
+# keys but not the listing ones, to stay under CDN header size limits. A
+# change to a listing also purges the location keys of its district and
+# state, which every list that could show it carries, so nothing goes stale.
+MAX_KEYS = 100
+
+# Listing columns no cached response shows; saves limited to them purge nothing.
+HIDDEN_LISTING_FIELDS = frozenset({'facility_bits'})
+SHOWN_LISTING_FIELDS = frozenset(
+    field.attname for field in PropertyListing._meta.concrete_fields
+) - HIDDEN_LISTING_FIELDS
+
+CACHEABLE_METHODS = ('GET', 'HEAD')
+
+
+# --- Keys ---
+
+def listing_keys(listing):
+    """
+    Keys for a serialized listing: itself and the district and state shown in it.
+    """
+    keys = [f"listing-{listing['id']}"]
+    for field in ('district', 'state'):
+        value = listing.get(field)
+        if isinstance(value, dict) and value.get('id') is not None:
+            keys.append(f"{field}-{value['id']}")
+    return keys
+
+
+def location_keys(district_id, state_id):
+    """
+    Keys of the lists that can show a listing in this district and state.
+    Lists not filtered by location carry every state's key, so a listing
+    without a state purges the `listings` collection instead.
+    """
+    keys = [f'listings-district-{district_id}'] if district_id is not None else []
+    keys.append(f'listings-state-{state_id}' if state_id is not None else 'listings')
+    return keys
+
+
+def list_keys(district_id=None, state_id=None):
+    """
+    Keys for a list of listings filtered to this district or state, if
+    any: those of every location it could show a listing from.
+    """
+    if district_id is not None:
+        return [f'listings-district-{district_id}']
+    if state_id is not None:
+        return [f'listings-state-{state_id}']
+    return [f'listings-state-{pk}' for pk in reference_data.get_tables().rows[State]]
+
+
+def set_key_headers(response, keys):
+    for header, separator in KEY_HEADERS.items():
+        response[header] = separator.join(keys)
+
+
+class EdgeCacheMixin:
+    """
+    For API views: applies the `edge_cache_policy` named in
+    `EDGE_CACHE_POLICIES` to the actions in `edge_cache_actions` (all of
+    them when None), and tags responses with `get_surrogate_keys()`.
+    """
+    edge_cache_policy = None
+    edge_cache_actions = None
+
+    # Key of the collection the view lists, if any.
+    surrogate_collection = None
+
+    def get_surrogate_keys(self, response):
+        return []
+
+    def is_edge_cacheable(self, request, response):
+        if request.method not in CACHEABLE_METHODS or response.status_code != 200:
+            return False
+        if response.has_header('Cache-Control'):
+            return False
+        action = getattr(self, 'action', None)
+        return self.edge_cache_actions is None or action in self.edge_cache_actions
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        policy = getattr(settings, 'EDGE_CACHE_POLICIES', {}).get(self.edge_cache_policy)
+        if policy is None or not self.is_edge_cacheable(request, response):
+            return response
+
+        patch_vary_headers(response, ['Authorization'])
+        if request.user.is_authenticated:
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        patch_cache_control(
+            response, public=True, max_age=policy.get('max_age', 0), s_maxage=policy['s_maxage'],
+            stale_while_revalidate=policy.get('stale_while_revalidate', 0),
+        )
+        keys = list(dict.fromkeys(self.get_surrogate_keys(response)))
+        if len(keys) > MAX_KEYS:
+            keys = [key for key in keys if not key.startswith('listing-')][:MAX_KEYS]
+        if self.surrogate_collection:
+            keys = [self.surrogate_collection, *keys]
+        if keys:
+            set_key_headers(response, keys)
+        return response
+
+
+# --- Purging ---
+
+class PurgeClient:
+    """
+    Base class. `purge()` invalidates every cached response tagged with any
+    of `keys`, raising on failure.
+    """
+
+    def __init__(self, **options):
+        self.options = options
+
+    def purge(self, keys):
+        raise NotImplementedError
+
+
+class FakePurgeClient(PurgeClient):
+    """
+    Records purged keys in `purged` (a list of key lists) instead of sending them.
+    """
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.purged = []
+
+    def purge(self, keys):
+        self.purged.append(list(keys))
+
+    def purged_keys(self):
+        return {key for keys in self.purged for key in keys}
+
+
+class FastlyPurgeClient(PurgeClient):
+    """
+    Options: SERVICE_ID, API_TOKEN, and SOFT (mark stale rather than evict,
+    so stale-while-revalidate still applies). Matches `Surrogate-Key`.
+    """
+    batch_size = 256
+
+    def purge(self, keys):
+        keys = list(keys)
+        headers = {'Fastly-Key': self.options['API_TOKEN']}
+        if self.options.get('SOFT', True):
+            headers['Fastly-Soft-Purge'] = '1'
+        for start in range(0, len(keys), self.batch_size):
+            response = requests.post(
+                f"https://api.fastly.com/service/{self.options['SERVICE_ID']}/purge",
+                headers={**headers, 'Surrogate-Key': ' '.join(keys[start:start + self.batch_size])},
+                timeout=10,
+            )
+            response.raise_for_status()
+
+
+class CloudflarePurgeClient(PurgeClient):
+    """
+    Options: ZONE_ID and API_TOKEN (with the Cache Purge permission).
+    Matches `Cache-Tag`.
+    """
+    batch_size = 30
+
+    def purge(self, keys):
+        keys = list(keys)
+        for start in range(0, len(keys), self.batch_size):
+            response = requests.post(
+                f"https://api.cloudflare.com/client/v4/zones/{self.options['ZONE_ID']}/purge_cache",
+                headers={'Authorization': f"Bearer {self.options['API_TOKEN']}"},
+                json={'tags': keys[start:start + self.batch_size]},
+                timeout=10,
+            )
+            response.raise_for_status()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    The configured purge client, or None if purging is off.
+    """
+    global _client
+    config = getattr(settings, 'EDGE_CACHE_PURGE', {})
+    if not config.get('CLIENT'):
+        return None
+    with _client_lock:
+        if _client is None or _client.config is not config:
+            _client = import_string(config['CLIENT'])(**config.get('OPTIONS', {}))
+            _client.config = config
+        return _client
+
+
+def purge(keys):
+    """
+    Purge `keys` once the current transaction commits.
+    """
+    keys = sorted(set(keys))
+    if keys and get_client() is not None:
+        jobs.defer('purge_edge_cache', {'keys': keys})
+
+
+def locations_of(listing):
+    """
+    The (district id, state id) of the listing, and where it was when loaded
+    from the database if it has moved since.
+    """
+    loaded = getattr(listing, '_loaded_values', {})
+    locations = {(listing.district_id, listing.state_id)}
+    if 'district_id' in loaded and 'state_id' in loaded:
+        locations.add((loaded['district_id'], loaded['state_id']))
+    return locations
+
+
+def listings_changed(listing_ids, locations=None):
+    """
+    Queue a purge of the listings and of the lists they can join or leave:
+    those of `locations`, the (district id, state id) pairs the listings are
+    in or have left; looked up for the listings if not given.
+    """
+    listing_ids = list(listing_ids)
+    if not listing_ids or get_client() is None:
+        return
+    if locations is None:
+        locations = PropertyListing.objects.filter(pk__in=listing_ids).values_list('district_id', 'state_id')
+    keys = [f'listing-{pk}' for pk in listing_ids]
+    for district_id, state_id in set(locations):
+        keys.extend(location_keys(district_id, state_id))
+    purge(keys)
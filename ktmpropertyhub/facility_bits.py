@@ -0,0 +1,118 @@
+"""
+Facilities as a bitset on the listing.
+
+Every facility is given a bit number (`Facility.bit`, 0-62) and every listing
+stores the OR of its facilities' bits in `PropertyListing.facility_bits`, so
+"has all of these facilities" is a single predicate on the listing row:
+
+    facility_bits & mask = mask
+
+instead of one join per facility or a GROUP BY/HAVING over the through table.
+The M2M stays the source of truth; the bitset is kept in sync from the
+`m2m_changed` and `Facility` signals and can be recomputed with the
+`rebuild_facility_bits` command. Facilities beyond the 63 available bits get
+no bit and are filtered with a join instead.
+"""
+from django.db import transaction
+from django.db.models import F
+
+from . import reference_data
+from .models import Facility, PropertyListing
+
+# A signed BIGINT has 63 usable bits.
+MAX_BITS = 63
+
+Through = PropertyListing.facilities.through
+
+
+def mask_of(bits):
+    mask = 0
+    for bit in bits:
+        if bit is not None:
+            mask |= 1 << bit
+    return mask
+
+
+def assign_bits(renumber=False):
+    """
+    Give every facility without a bit the lowest free one, in pk order. With
+    `renumber`, all bits are handed out afresh (listings must be recomputed
+    afterwards). Returns the number of facilities changed.
+    """
+    with transaction.atomic():
+        facilities = list(Facility.objects.select_for_update().order_by('pk'))
+        if renumber:
+            Facility.objects.update(bit=None)
+            for facility in facilities:
+                facility.bit = None
+        used = {f.bit for f in facilities if f.bit is not None}
+        free = (bit for bit in range(MAX_BITS) if bit not in used)
+        changed = []
+        for facility in facilities:
+            if facility.bit is None:
+                facility.bit = next(free, None)
+                if facility.bit is None:
+                    break
+                changed.append(facility)
+        Facility.objects.bulk_update(changed, ['bit'])
+    # Cached facilities carry their bit (see reference_data.py).
+    transaction.on_commit(reference_data.invalidate)
+    return len(changed)
+
+
+def refresh_listings(listing_ids):
+    """
+    Recompute `facility_bits` for the given listings from the through table.
+    Returns {listing_id: bits}.
+    """
+    listing_ids = list(listing_ids)
+    bits = dict.fromkeys(listing_ids, 0)
+    rows = Through.objects.filter(propertylisting_id__in=listing_ids, facility__bit__isnull=False)
+    for listing_id, bit in rows.values_list('propertylisting_id', 'facility__bit'):
+        bits[listing_id] |= 1 << bit
+    PropertyListing.objects.bulk_update(
+        [PropertyListing(pk=pk, facility_bits=value) for pk, value in bits.items()], ['facility_bits'], batch_size=1000,
+    )
+    return bits
+
+
+def rebuild(batch_size=5000):
+    """
+    Recompute `facility_bits` for every listing. Returns the number of listings.
+    """
+    ids = list(PropertyListing.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(ids), batch_size):
+        with transaction.atomic():
+            refresh_listings(ids[start:start + batch_size])
+    return len(ids)
+
+
+def clear_bit(bit):
+    """
+    Drop a bit from every listing, e.g. when its facility is deleted (the
+    cascade on the through table doesn't send m2m_changed).
+    """
+    mask = 1 << bit
+    PropertyListing.objects.alias(has_bit=F('facility_bits').bitand(mask)).filter(has_bit=mask).update(
+        facility_bits=F('facility_bits').bitand(~mask)
+    )
+
+
+def filter_has_all(queryset, facility_ids):
+    """
+    Listings in `queryset` having every one of `facility_ids`. Unknown
+    facility ids match nothing.
+    """
+    facility_ids = {int(pk) for pk in facility_ids}
+    if not facility_ids:
+        return queryset
+    bits = dict(Facility.objects.filter(pk__in=facility_ids).values_list('pk', 'bit'))
+    if len(bits) < len(facility_ids):
+        return queryset.none()
+    mask = mask_of(bits.values())
+    if mask:
+        queryset = queryset.alias(facility_match=F('facility_bits').bitand(mask)).filter(facility_match=mask)
+    for pk, bit in bits.items():
+        if bit is None:
+            queryset = queryset.filter(facilities=pk)
+    return queryset
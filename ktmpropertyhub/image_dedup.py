@@ -0,0 +1,250 @@
+"""
+Content-hash deduplication of uploaded listing images.
+
+Agents upload the same photos again and again, across listings and when
+re-saving one. Every image stored in Cloudinary gets an `ImageAsset` row with
+two hashes of its content:
+
+- the SHA-256 of the file, computed while the upload is read, so
+  byte-identical files are recognised before anything is sent to Cloudinary;
+- a 64-bit difference hash (dHash) of the picture: the image shrunk to 9x8
+  grey pixels, one bit per pair of neighbours saying which is brighter. It
+  survives re-encoding, resizing and small edits, so a re-saved JPEG still
+  matches, within `IMAGE_DUPLICATE_MAX_DISTANCE` differing bits.
+
+A matching upload becomes a `PropertyImage` that points at the stored image
+instead of being uploaded again; the asset counts the reuse and the bytes
+saved. Near matches are found the way duplicates.py finds similar
+listings: the hash is cut into four 16-bit bands stored in `ImageAssetBand`,
+and any two hashes at most three bits apart share at least one band.
+
+An asset is removed together with the Cloudinary image, once no listing
+refers to it any more (see tasks.delete_cloudinary_image).
+"""
+import hashlib
+import os
+import re
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+from .models import ImageAsset, ImageAssetBand, PropertyImage
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+HASH_WIDTH, HASH_HEIGHT = 9, 8
+BANDS = 4
+BAND_BITS = 16
+
+Hashes = namedtuple('Hashes', 'sha256 phash size width height')
+
+
+# --- Hashing ---
+
+def spool_upload(uploaded_file, path):
+    """
+    Write an uploaded file to `path`, chunk by chunk. Returns its SHA-256.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'wb') as f:
+        for chunk in uploaded_file.chunks():
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+
+def to_signed(value):
+    # BigIntegerField is signed.
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def dhash(image):
+    """
+    The 64-bit difference hash of a PIL image, as a signed integer.
+    """
+    # Lets the JPEG decoder scale down while decoding, far cheaper than a full decode.
+    image.draft('L', (HASH_WIDTH * 8, HASH_HEIGHT * 8))
+    image = ImageOps.exif_transpose(image).convert('L').resize((HASH_WIDTH, HASH_HEIGHT), Image.Resampling.LANCZOS)
+    pixels = list(image.getdata())
+    value = 0
+    for row in range(HASH_HEIGHT):
+        for col in range(HASH_WIDTH - 1):
+            left = pixels[row * HASH_WIDTH + col]
+            value = value << 1 | (left > pixels[row * HASH_WIDTH + col + 1])
+    return to_signed(value)
+
+
+def picture_hash(source):
+    """
+    (perceptual hash, width, height) of an image file path or file object;
+    all None if it can't be decoded.
+    """
+    if Image is not None:
+        try:
+            with Image.open(source) as image:
+                width, height = image.size
+                return dhash(image), width, height
+        except Exception:
+            pass
+    return None, None, None
+
+
+def hash_file(path, sha256=None):
+    """
+    Hashes of the file at `path`. The SHA-256 is only computed if not
+    given; the perceptual hash is None if the file can't be decoded.
+    """
+    if sha256 is None:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+    phash, width, height = picture_hash(path)
+    return Hashes(sha256, phash, os.path.getsize(path), width, height)
+
+
+def hash_upload(uploaded_file):
+    """
+    Hashes of a Django UploadedFile, read chunk by chunk. Leaves it rewound.
+    """
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    phash, width, height = picture_hash(uploaded_file)
+    uploaded_file.seek(0)
+    return Hashes(digest.hexdigest(), phash, uploaded_file.size, width, height)
+
+
+def distance(a, b):
+    return ((a ^ b) & ((1 << 64) - 1)).bit_count()
+
+
+def band_keys(phash):
+    """
+    One key per band; the band number is folded in so bands don't collide.
+    """
+    value = phash & ((1 << 64) - 1)
+    mask = (1 << BAND_BITS) - 1
+    return [band << BAND_BITS | (value >> (band * BAND_BITS)) & mask for band in range(BANDS)]
+
+
+# --- Index ---
+
+def stored_as(public_id):
+    """
+    Matches an image field holding exactly `public_id`, whether saved bare
+    (as attach() does) or in CloudinaryField's full form, e.g.
+    `image/upload/v1234/<public_id>.jpg`. Never matches a longer id that
+    merely starts or ends with it.
+    """
+    full_form = rf'^[a-z]+/[a-z]+/(v[0-9]+/)?{re.escape(public_id)}(\.[A-Za-z0-9]+)?$'
+    return Q(image=public_id) | Q(image__regex=full_form)
+
+
+
+def find_exact(sha256):
+    return ImageAsset.objects.filter(sha256=sha256).order_by('id').first()
+
+
+def find_similar(phash):
+    """
+    The stored asset whose picture is closest to `phash`, if one is within
+    `IMAGE_DUPLICATE_MAX_DISTANCE` bits.
+    """
+    max_distance = getattr(settings, 'IMAGE_DUPLICATE_MAX_DISTANCE', 3)
+    ids = ImageAssetBand.objects.filter(key__in=band_keys(phash)).values('asset_id')
+    best = None
+    for asset in ImageAsset.objects.filter(id__in=ids, phash__isnull=False).order_by('id'):
+        d = distance(asset.phash, phash)
+        if d <= max_distance and (best is None or d < best[0]):
+            best = (d, asset)
+    return best[1] if best else None
+
+
+def find_asset(hashes):
+    asset = find_exact(hashes.sha256)
+    if asset is None and hashes.phash is not None:
+        asset = find_similar(hashes.phash)
+    return asset
+
+
+def record_asset(public_id, hashes):
+    """
+    Index an image just stored in Cloudinary.
+    """
+    with transaction.atomic():
+        asset = ImageAsset.objects.create(
+            public_id=public_id, sha256=hashes.sha256, phash=hashes.phash,
+            size=hashes.size, width=hashes.width, height=hashes.height,
+        )
+        if hashes.phash is not None:
+            ImageAssetBand.objects.bulk_create([ImageAssetBand(asset=asset, key=key) for key in band_keys(hashes.phash)])
+    return asset
+
+
+def attach(listing_id, asset, size=0, reused=True):
+    """
+    Add the stored image to the listing, unless the listing already has it.
+    A reuse is counted with the `size` of the upload it replaced. Returns
+    False if the asset has been deleted meanwhile.
+    """
+    with transaction.atomic():
+        # Locked so the image can't be deleted from Cloudinary meanwhile.
+        if not ImageAsset.objects.select_for_update().filter(pk=asset.pk).exists():
+            return False
+        if PropertyImage.objects.filter(stored_as(asset.public_id), property_listing_id=listing_id).exists():
+            return True
+        PropertyImage.objects.create(property_listing_id=listing_id, image=asset.public_id)
+        if reused:
+            ImageAsset.objects.filter(pk=asset.pk).update(
+                reuse_count=F('reuse_count') + 1, bytes_saved=F('bytes_saved') + size,
+            )
+    return True
+
+
+def duplicate_groups(max_distance=None):
+    """
+    Groups of stored assets holding the same or nearly the same picture,
+    e.g. uploaded before they were indexed. Yields lists of assets.
+    """
+    if max_distance is None:
+        max_distance = getattr(settings, 'IMAGE_DUPLICATE_MAX_DISTANCE', 3)
+    assets = {asset.pk: asset for asset in ImageAsset.objects.order_by('id')}
+    parent = {pk: pk for pk in assets}
+
+    def find(pk):
+        while parent[pk] != pk:
+            parent[pk] = parent[parent[pk]]
+            pk = parent[pk]
+        return pk
+
+    def union(a, b):
+        a, b = find(a), find(b)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+
+    by_sha = {}
+    for asset in assets.values():
+        union(by_sha.setdefault(asset.sha256, asset.pk), asset.pk)
+    buckets = {}
+    for asset_id, key in ImageAssetBand.objects.values_list('asset_id', 'key'):
+        buckets.setdefault(key, []).append(asset_id)
+    for members in buckets.values():
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                if distance(assets[a].phash, assets[b].phash) <= max_distance:
+                    union(a, b)
+
+    groups = {}
+    for pk in assets:
+        groups.setdefault(find(pk), []).append(assets[pk])
+    for group in groups.values():
+        if len(group) > 1:
+            yield group
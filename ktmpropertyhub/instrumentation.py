@@ -0,0 +1,163 @@
+"""
+Per-request performance instrumentation.
+
+`RequestTimingMiddleware` measures, for every request:
+
+- total time spent in Django,
+- number of SQL queries and time spent in them (via `connection.execute_wrapper`),
+- time spent turning model instances into primitives (serializers using
+  `TimedSerializerMixin`),
+- time spent rendering the response body (whatever the renderer),
+
+reports them to the client in a `Server-Timing` header and records them in
+the metrics registry, labelled with the viewset and action that handled the
+request. The bookkeeping is a handful of `perf_counter()` calls per request
+(plus one per query and one per serialized object), so it is cheap enough to
+leave on in production.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+from .metrics import registry
+
+_current = contextvars.ContextVar('ktmpropertyhub_request_timings', default=None)
+
+registry.describe('ktm_request_phase_seconds', "Time spent per request in each phase (total, db, serialize, render).")
+registry.describe('ktm_db_queries_total', "SQL queries executed while handling requests.")
+
+
+class RequestTimings:
+    """
+    The measurements for one request. `phases` maps a phase name to seconds.
+    """
+    __slots__ = ('phases', 'query_count', 'depth')
+
+    def __init__(self):
+        self.phases = {'db': 0.0, 'serialize': 0.0, 'render': 0.0}
+        self.query_count = 0
+        self.depth = {}
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+
+@contextmanager
+def timed(phase):
+    """
+    Add the time spent in the block to `phase` of the current request. Nested
+    blocks for the same phase (e.g. nested serializers) are counted once.
+    """
+    timings = _current.get()
+    if timings is None or timings.depth.get(phase):
+        yield
+        return
+    timings.depth[phase] = 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(phase, time.perf_counter() - start)
+        timings.depth[phase] = 0
+
+
+class TimedSerializerMixin:
+    """
+    Mix into a serializer to count its `to_representation` time as the
+    "serialize" phase of the current request.
+    """
+
+    def to_representation(self, instance):
+        with timed('serialize'):
+            return super().to_representation(instance)
+
+
+class RequestTimingMiddleware:
+    """
+    Put this first in MIDDLEWARE so "total" covers the whole stack.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'INSTRUMENTATION_ENABLED', True)
+        self.server_timing = getattr(settings, 'INSTRUMENTATION_SERVER_TIMING', True)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        request._view_labels = None
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(self._time_query):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - start
+
+        self._record(request, timings, total)
+        if self.server_timing:
+            response['Server-Timing'] = self._server_timing(timings, total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._view_labels = view_labels(request, view_func)
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered straight after the last
+        # process_template_response hook, which is ours since we come first.
+        timings = _current.get()
+        if timings is not None:
+            render_start = time.perf_counter()
+            response.add_post_render_callback(
+                lambda r: timings.add('render', time.perf_counter() - render_start)
+            )
+        return response
+
+    @staticmethod
+    def _time_query(execute, sql, params, many, context):
+        timings = _current.get()
+        if timings is None:
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            timings.phases['db'] += time.perf_counter() - start
+            timings.query_count += 1
+
+    @staticmethod
+    def _server_timing(timings, total):
+        parts = [f'total;dur={total * 1000:.1f}']
+        parts.append(f'db;dur={timings.phases["db"] * 1000:.1f};desc="{timings.query_count} queries"')
+        for phase in ('serialize', 'render'):
+            parts.append(f'{phase};dur={timings.phases[phase] * 1000:.1f}')
+        return ', '.join(parts)
+
+    @staticmethod
+    def _record(request, timings, total):
+        view, action = getattr(request, '_view_labels', None) or ('unresolved', request.method.lower())
+        labels = (('view', view), ('action', action))
+        registry.observe('ktm_request_phase_seconds', labels + (('phase', 'total'),), total)
+        for phase, seconds in timings.phases.items():
+            registry.observe('ktm_request_phase_seconds', labels + (('phase', phase),), seconds)
+        registry.inc('ktm_db_queries_total', labels, timings.query_count)
+
+
+def view_labels(request, view_func):
+    """
+    (view, action) labels for a resolved view: the viewset class and action
+    for DRF viewsets, the class and HTTP method for other class-based views,
+    and the function name otherwise.
+    """
+    method = request.method.lower()
+    cls = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if cls is None:
+        return getattr(view_func, '__name__', 'unknown'), method
+    actions = getattr(view_func, 'actions', None) or {}
+    return cls.__name__, actions.get(method, method)
@@ -0,0 +1,207 @@
+"""
+A small background job queue stored in the database.
+
+Request handlers call `enqueue()` and return; `manage.py run_workers` runs
+the jobs. Because jobs are rows in the same database, a job enqueued inside
+a transaction only becomes visible to workers once that transaction
+commits, and disappears with it on rollback. No broker is needed.
+
+Workers claim due jobs with `SELECT ... FOR UPDATE SKIP LOCKED` where the
+database supports it (Postgres), so concurrent workers never wait for each
+other or take the same job. Elsewhere (SQLite) candidates are read without
+locks and each is claimed with a conditional UPDATE; a worker that loses
+the race just moves on. A failed job is retried with exponential backoff
+until it has run `max_attempts` times. Jobs left RUNNING by a worker that
+died are put back after `JOB_LOCK_TIMEOUT` seconds, so a job may run more
+than once: job functions must be safe to repeat.
+
+An `idempotency_key` makes enqueueing idempotent: while a job with that
+key is stored, enqueueing again returns it instead of adding another.
+
+Where no worker runs (`JOB_WORKERS` off, e.g. on Vercel), `defer()` calls
+the job in the request once the transaction commits, and only queues it if
+that fails, for a scheduled `run_workers --drain` to retry.
+"""
+import datetime
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+def task(name=None, max_attempts=5):
+    """
+    Register a function as a job. It is called with the payload as keyword
+    arguments.
+    """
+    def decorator(func):
+        func.job_name = name or f'{func.__module__}.{func.__qualname__}'
+        func.max_attempts = max_attempts
+        registry[func.job_name] = func
+        return func
+    return decorator
+
+
+def enqueue(func, payload=None, *, key=None, delay=0, max_attempts=None):
+    """
+    Queue a call of the registered `func` with `payload` (JSON-serializable
+    keyword arguments). Returns the Job, or the existing one for `key`.
+    """
+    name = func if isinstance(func, str) else func.job_name
+    if name not in registry:
+        raise ValueError(f"Unknown job {name!r}.")
+    job = Job(
+        name=name, payload=payload or {}, idempotency_key=key,
+        max_attempts=max_attempts or registry[name].max_attempts,
+        run_at=timezone.now() + datetime.timedelta(seconds=delay),
+    )
+    if key is None:
+        job.save()
+        return job
+    try:
+        # A savepoint, so a duplicate key doesn't break the caller's transaction.
+        with transaction.atomic():
+            job.save()
+        return job
+    except IntegrityError:
+        return Job.objects.get(idempotency_key=key)
+
+
+def defer(func, payload=None, *, key=None):
+    """
+    `enqueue()` where workers run. Otherwise run the job once the current
+    transaction commits (never for a rolled-back one), queueing it only if
+    it fails.
+    """
+    if getattr(settings, 'JOB_WORKERS', True):
+        return enqueue(func, payload, key=key)
+    name = func if isinstance(func, str) else func.job_name
+    if name not in registry:
+        raise ValueError(f"Unknown job {name!r}.")
+    transaction.on_commit(lambda: run_now(name, payload or {}, key))
+
+
+def run_now(name, payload, key=None):
+    try:
+        registry[name](**payload)
+    except Exception:
+        logger.warning("Job %s failed; queued for a retry.", name, exc_info=True)
+        enqueue(name, payload, key=key)
+
+
+def backoff(attempts):
+    """
+    Seconds to wait before the next attempt: exponential, capped, with jitter.
+    """
+    base = getattr(settings, 'JOB_RETRY_BASE_DELAY', 10)
+    cap = getattr(settings, 'JOB_RETRY_MAX_DELAY', 60 * 60)
+    return min(cap, base * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+
+
+def claim(worker, limit=1):
+    """
+    Mark up to `limit` due jobs as RUNNING by `worker` and return them.
+    """
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.Status.QUEUED, run_at__lte=now).order_by('run_at', 'id')
+    claimed = {'status': Job.Status.RUNNING, 'locked_by': worker, 'locked_at': now, 'attempts': F('attempts') + 1}
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(due.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            Job.objects.filter(id__in=ids).update(**claimed)
+    else:
+        ids = []
+        for pk in due.values_list('id', flat=True)[:limit * 4]:
+            if Job.objects.filter(id=pk, status=Job.Status.QUEUED).update(**claimed):
+                ids.append(pk)
+                if len(ids) == limit:
+                    break
+    return list(Job.objects.filter(id__in=ids).order_by('run_at', 'id'))
+
+
+def run(job):
+    """
+    Run a claimed job and record the outcome. Returns whether it succeeded.
+    """
+    func = registry.get(job.name)
+    try:
+        if func is None:
+            raise LookupError(f"No job function registered as {job.name!r}.")
+        func(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Job %s failed (attempt %s of %s)", job, job.attempts, job.max_attempts, exc_info=True)
+        if job.attempts < job.max_attempts and func is not None:
+            retry_at = timezone.now() + datetime.timedelta(seconds=backoff(job.attempts))
+            Job.objects.filter(pk=job.pk).update(status=Job.Status.QUEUED, run_at=retry_at, locked_by='', locked_at=None, last_error=error)
+        else:
+            Job.objects.filter(pk=job.pk).update(status=Job.Status.FAILED, finished_at=timezone.now(), last_error=error)
+        return False
+    Job.objects.filter(pk=job.pk).update(status=Job.Status.DONE, finished_at=timezone.now())
+    return True
+
+
+def recover_stale(now=None):
+    """
+    Put back jobs whose worker has held them longer than `JOB_LOCK_TIMEOUT`
+    seconds (it most likely died). Returns how many were requeued.
+    """
+    now = now or timezone.now()
+    timeout = datetime.timedelta(seconds=getattr(settings, 'JOB_LOCK_TIMEOUT', 15 * 60))
+    return Job.objects.filter(status=Job.Status.RUNNING, locked_at__lt=now - timeout).update(
+        status=Job.Status.QUEUED, run_at=now, locked_by='', locked_at=None,
+    )
+
+
+def prune(now=None):
+    """
+    Delete finished jobs older than `JOB_RETENTION_DAYS`, freeing their
+    idempotency keys. Failed jobs are kept for inspection.
+    """
+    now = now or timezone.now()
+    retention = datetime.timedelta(days=getattr(settings, 'JOB_RETENTION_DAYS', 7))
+    return Job.objects.filter(status=Job.Status.DONE, finished_at__lt=now - retention).delete()[0]
+
+
+class Worker(threading.Thread):
+    """
+    Runs jobs one at a time until `stop` is set, sleeping `poll_interval`
+    seconds whenever the queue is empty. With `drain`, exits instead.
+    """
+
+    def __init__(self, number, stop, poll_interval=1.0, drain=False):
+        super().__init__(name=f'job-worker-{number}', daemon=True)
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{number}'
+        self.stop = stop
+        self.poll_interval = poll_interval
+        self.drain = drain
+        self.processed = 0
+
+    def run(self):
+        try:
+            while not self.stop.is_set():
+                close_old_connections()
+                jobs = claim(self.worker_id)
+                if not jobs:
+                    if self.drain:
+                        return
+                    self.stop.wait(self.poll_interval)
+                    continue
+                for job in jobs:
+                    run(job)
+                    self.processed += 1
+        finally:
+            connection.close()
@@ -0,0 +1,216 @@
+"""
+In-memory typeahead index over location names.
+
+Suggestions come from three kinds of names: the free-text `local_area` of
+active listings, district names and state names. Every name is filed in a
+sorted list under its whole normalized form and under each of its words, so a
+prefix lookup is a bisect plus a short scan; queries of three characters or
+more that find too few prefix matches also look for fuzzy matches through a
+trigram index, which catches misspellings like "budanilkantha".
+
+Results rank whole-name prefix matches first, then word prefix matches, then
+fuzzy matches by similarity, and within each tier by the number of active
+listings in that place. Listing counts are patched in place as listings are
+saved and deleted; the whole index is rebuilt every `LOCATION_INDEX_MAX_AGE`
+seconds to pick up changes made by other processes.
+"""
+import bisect
+import re
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Count, Q
+
+from .models import District, PropertyListing, State
+
+# Listing fields that decide which locations a listing counts towards.
+LISTING_FIELDS = ('is_active', 'local_area', 'district_id', 'state_id')
+
+FUZZY_MIN_LENGTH = 3
+FUZZY_MIN_SIMILARITY = 0.3
+# How many prefix matches to rank for very short queries.
+MAX_PREFIX_SCAN = 2000
+
+_non_word = re.compile(r'[^\w\s]+')
+_spaces = re.compile(r'\s+')
+
+
+def normalize(text):
+    return _spaces.sub(' ', _non_word.sub(' ', text or '')).strip().casefold()
+
+
+def trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# Returned by location_of() when the values needed are missing.
+unknown = object()
+
+
+def location_of(values):
+    """
+    (local area as typed, district id, state id) that a listing with these
+    field values counts towards, None if it doesn't count (inactive), or
+    `unknown` if a field is missing.
+    """
+    if any(field not in values for field in LISTING_FIELDS):
+        return unknown
+    if not values['is_active']:
+        return None
+    return (values['local_area'] or '').strip(), values['district_id'], values['state_id']
+
+
+class Entry:
+    __slots__ = ('kind', 'id', 'name', 'context', 'listings', 'normalized', 'trigram_count')
+
+    def __init__(self, kind, id, name, context=None, listings=0):
+        self.kind = kind
+        self.id = id
+        self.name = name
+        self.context = context
+        self.listings = listings
+        self.normalized = normalize(name)
+        self.trigram_count = len(trigrams(self.normalized))
+
+    def as_dict(self):
+        data = {'type': self.kind, 'name': self.name, 'listings': self.listings}
+        if self.id is not None:
+            data['id'] = self.id
+        if self.context:
+            data['context'] = self.context
+        return data
+
+
+class LocationIndex:
+
+    def __init__(self):
+        self.entries = {}
+        self.tokens = []  # sorted (token, entry key)
+        self.trigrams = defaultdict(set)
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, key, entry):
+        self.entries[key] = entry
+        for token in {entry.normalized} | set(entry.normalized.split(' ')):
+            bisect.insort(self.tokens, (token, key))
+        for gram in trigrams(entry.normalized):
+            self.trigrams[gram].add(key)
+
+    def count(self, key, delta):
+        entry = self.entries.get(key)
+        if entry is not None:
+            entry.listings = max(entry.listings + delta, 0)
+
+    def add_listing(self, location, delta):
+        area, district_id, state_id = location
+        key = ('local_area', normalize(area))
+        if key[1]:
+            if key not in self.entries and delta > 0:
+                self.add(key, Entry('local_area', None, area))
+            self.count(key, delta)
+        self.count(('district', district_id), delta)
+        self.count(('state', state_id), delta)
+
+    def suggest(self, query, limit=10):
+        query = normalize(query)
+        if not query:
+            return []
+        ranked = {}
+        start = bisect.bisect_left(self.tokens, (query,))
+        for token, key in self.tokens[start:start + MAX_PREFIX_SCAN]:
+            if not token.startswith(query):
+                break
+            rank = (0 if self.entries[key].normalized.startswith(query) else 1, 0)
+            if key not in ranked or rank < ranked[key]:
+                ranked[key] = rank
+
+        if len(ranked) < limit and len(query) >= FUZZY_MIN_LENGTH:
+            grams = trigrams(query)
+            shared = defaultdict(int)
+            for gram in grams:
+                for key in self.trigrams.get(gram, ()):
+                    shared[key] += 1
+            for key, n in shared.items():
+                if key in ranked:
+                    continue
+                similarity = n / (len(grams) + self.entries[key].trigram_count - n)
+                if similarity >= FUZZY_MIN_SIMILARITY:
+                    ranked[key] = (2, -similarity)
+
+        results = [
+            (rank, -self.entries[key].listings, len(self.entries[key].name), key)
+            for key, rank in ranked.items()
+            # Local areas only exist through listings; hide those with none left.
+            if self.entries[key].listings or key[0] != 'local_area'
+        ]
+        results.sort()
+        return [self.entries[key] for *_, key in results[:limit]]
+
+
+def build_index():
+    index = LocationIndex()
+    states = {}
+    active = Q(propertylisting__is_active=True)
+    for state in State.objects.annotate(n=Count('propertylisting', filter=active)):
+        states[state.pk] = state.name
+        index.add(('state', state.pk), Entry('state', state.pk, state.name, listings=state.n))
+    for district in District.objects.annotate(n=Count('propertylisting', filter=active)):
+        index.add(('district', district.pk), Entry('district', district.pk, district.name, states.get(district.state_id), district.n))
+
+    # One entry per normalized local area, shown in its most common spelling.
+    spellings = defaultdict(dict)
+    rows = (
+        PropertyListing.objects.filter(is_active=True).exclude(local_area__isnull=True).exclude(local_area='')
+        .values('local_area').annotate(n=Count('id')).order_by()
+    )
+    for row in rows:
+        spellings[normalize(row['local_area'])][row['local_area'].strip()] = row['n']
+    for area, counts in spellings.items():
+        if area:
+            name = max(counts, key=counts.get)
+            index.add(('local_area', area), Entry('local_area', None, name, listings=sum(counts.values())))
+    return index
+
+
+# --- Process-wide index ---
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    max_age = getattr(settings, 'LOCATION_INDEX_MAX_AGE', 600)
+    with _index_lock:
+        if _index is None or time.monotonic() - _index.built_at > max_age:
+            _index = build_index()
+        return _index
+
+
+def listings_changed(changes):
+    """
+    Patch listing counts for (old location, new location) pairs, as returned
+    by `location_of`, if the index has been built.
+    """
+    with _index_lock:
+        if _index is None:
+            return
+        for old, new in changes:
+            if old is unknown or new is unknown or old == new:
+                continue
+            if old is not None:
+                _index.add_listing(old, -1)
+            if new is not None:
+                _index.add_listing(new, 1)
+
+
+def suggest(query, limit=10):
+    index = get_index()
+    with _index_lock:
+        return [entry.as_dict() for entry in index.suggest(query, limit)]
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ktmpropertyhub import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Move inactive listings and listings without any activity, with their images, facility links "
+        "and counters, out of the live listing table into the archive tables, "
+        "one batch per transaction. The age limits come from "
+        "LISTING_ARCHIVE_INACTIVE_AFTER_DAYS and LISTING_ARCHIVE_MAX_AGE_DAYS. "
+        "Safe to run from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--limit', type=int, help="Archive at most this many listings.")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the listings due for archiving.")
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            for reason, queryset in archive.candidates():
+                self.stdout.write(f"{reason.label}: {queryset.count()} listings due for archiving.")
+            return
+        start = time.perf_counter()
+        moved = archive.archive_listings(options['batch_size'], options['limit'])
+        elapsed = time.perf_counter() - start
+        summary = ', '.join(f"{n} {reason.label.lower()}" for reason, n in moved.items())
+        self.stdout.write(self.style.SUCCESS(f"Archived {sum(moved.values())} listings ({summary}) in {elapsed:.1f}s."))
@@ -0,0 +1,65 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from ktmpropertyhub import compression, renderers
+from ktmpropertyhub.models import PropertyListing
+from ktmpropertyhub.serializers import PropertyListingSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the stdlib and orjson JSON renderers on a typical page of "
+        "listings (encode time), and the bytes on the wire uncompressed, "
+        "gzipped and brotli-compressed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--iterations', type=int, default=200)
+
+    def handle(self, *args, **options):
+        listings = list(
+            PropertyListing.objects.filter(is_active=True)
+            .select_related('user', 'state', 'district')
+            .prefetch_related('facilities', 'images')[:options['page_size']]
+        )
+        if not listings:
+            raise CommandError("No active listings. Run generate_synthetic_data first.")
+        data = PropertyListingSerializer(listings, many=True).data
+
+        stdlib, fast = JSONRenderer(), renderers.FastJSONRenderer()
+        if json.loads(stdlib.render(data)) != json.loads(fast.render(data)):
+            raise CommandError("The two renderers produced different JSON.")
+        if renderers.orjson is None:
+            self.stdout.write(self.style.WARNING("orjson is not installed; FastJSONRenderer is the stdlib renderer."))
+
+        self.stdout.write(f"{len(listings)} listings per page, {options['iterations']} iterations")
+        self.stdout.write(f"{'renderer':<12}{'mean ms':>10}{'p50 ms':>10}")
+        for name, renderer in (('stdlib', stdlib), ('orjson', fast)):
+            timings = self.time_render(renderer, data, options['iterations'])
+            self.stdout.write(f"{name:<12}{statistics.mean(timings):>10.3f}{statistics.median(timings):>10.3f}")
+
+        body = fast.render(data)
+        self.stdout.write(f"{'encoding':<12}{'bytes':>10}{'ratio':>10}{'ms':>10}")
+        self.stdout.write(f"{'identity':<12}{len(body):>10}{1:>10.2f}{0:>10.3f}")
+        encodings = ['gzip'] + (['br'] if compression.brotli is not None else [])
+        for encoding in encodings:
+            start = time.perf_counter()
+            compressed = compression.compress(body, encoding)
+            elapsed = (time.perf_counter() - start) * 1000
+            self.stdout.write(f"{encoding:<12}{len(compressed):>10}{len(body) / len(compressed):>10.2f}{elapsed:>10.3f}")
+        if compression.brotli is None:
+            self.stdout.write("brotli is not installed; install it to enable br encoding.")
+
+    @staticmethod
+    def time_render(renderer, data, iterations):
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            renderer.render(data)
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
@@ -0,0 +1,98 @@
+import random
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+
+from ktmpropertyhub.models import PropertyListing
+from ktmpropertyhub.saved_searches import SavedSearchIndex, EQUALITY_CRITERIA, RANGE_CRITERIA, within
+
+PURPOSES = PropertyListing.ListingPurpose.values
+TYPES = PropertyListing.PropertyType.values
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the saved search index against a brute-force scan using "
+        "synthetic, in-memory searches and listings (no database access)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--searches', type=int, default=100_000)
+        parser.add_argument('--listings', type=int, default=1_000)
+        parser.add_argument('--districts', type=int, default=77)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        districts = list(range(1, options['districts'] + 1))
+
+        searches = [self.make_search(rng, i, districts) for i in range(1, options['searches'] + 1)]
+        listings = [self.make_listing(rng, districts) for _ in range(options['listings'])]
+
+        start = time.perf_counter()
+        index = SavedSearchIndex()
+        for search in searches:
+            index.add(search)
+        build_time = time.perf_counter() - start
+        self.stdout.write(f"Index build: {len(index)} searches in {build_time * 1000:.1f} ms")
+
+        start = time.perf_counter()
+        indexed = [index.candidates(listing) for listing in listings]
+        index_time = time.perf_counter() - start
+
+        # Brute force over a sample only; a full scan per listing is the
+        # thing we're trying to avoid and takes far too long at this size.
+        sample = listings[:min(len(listings), 50)]
+        start = time.perf_counter()
+        brute = [{s['id'] for s in searches if self.brute_match(s, listing)} for listing in sample]
+        brute_time = (time.perf_counter() - start) * len(listings) / len(sample)
+
+        if brute != indexed[:len(sample)]:
+            self.stderr.write(self.style.ERROR("Index and brute-force results differ!"))
+
+        total = sum(len(c) for c in indexed)
+        self.stdout.write(
+            f"Index:       {index_time * 1000:.1f} ms for {len(listings)} listings "
+            f"({index_time * 1e6 / len(listings):.0f} us/listing, {total / len(listings):.1f} matches/listing)"
+        )
+        self.stdout.write(
+            f"Brute force: {brute_time * 1000:.1f} ms (extrapolated from {len(sample)} listings)"
+        )
+        self.stdout.write(self.style.SUCCESS(f"Speed-up: {brute_time / index_time:.0f}x"))
+
+    def make_search(self, rng, search_id, districts):
+        district = rng.choice(districts) if rng.random() < 0.95 else None
+        min_sqft = rng.choice([None, 500, 1000, 2000, 5000])
+        max_price = rng.choice([None, 5_000_000, 10_000_000, 25_000_000, 50_000_000])
+        return {
+            'id': search_id,
+            'listing_purpose': rng.choice(PURPOSES),
+            'property_type': rng.choice(TYPES) if rng.random() < 0.85 else None,
+            # Searches pick either a district or, sometimes, just its state.
+            'state_id': (district % 7) + 1 if district and rng.random() < 0.3 else None,
+            'district_id': district,
+            'min_sqft': min_sqft,
+            'max_sqft': min_sqft * 4 if min_sqft and rng.random() < 0.5 else None,
+            'min_price': None,
+            'max_price': max_price,
+        }
+
+    def make_listing(self, rng, districts):
+        district = rng.choice(districts)
+        return SimpleNamespace(
+            listing_purpose=rng.choice(PURPOSES),
+            property_type=rng.choice(TYPES),
+            state_id=(district % 7) + 1,
+            district_id=district,
+            total_land_area_sqft=rng.uniform(300, 20_000),
+            price=rng.uniform(1_000_000, 80_000_000),
+        )
+
+    def brute_match(self, search, listing):
+        for field, attr in EQUALITY_CRITERIA:
+            if search[field] is not None and search[field] != getattr(listing, attr):
+                return False
+        bounds = tuple((search[low], search[high]) for low, high, _ in RANGE_CRITERIA)
+        values = tuple(getattr(listing, attr) for _, _, attr in RANGE_CRITERIA)
+        return within(values, bounds)
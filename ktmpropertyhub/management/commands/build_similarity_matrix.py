@@ -0,0 +1,26 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ktmpropertyhub.similarity import build_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the feature matrix used by /api/properties/<id>/similar/ from "
+        "the database and write it to SIMILAR_LISTINGS_MATRIX_PATH."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.SIMILAR_LISTINGS_MATRIX_PATH)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        index = build_index()
+        index.save(options['output'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(index)} listings in {len(index.partitions)} partitions "
+            f"({index.space.width} features) to {options['output']} in {elapsed:.1f}s."
+        ))
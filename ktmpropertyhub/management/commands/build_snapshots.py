@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ktmpropertyhub import snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the static JSON snapshots of the most requested listing lists "
+        "(per district, and per purpose and property type). Only the slices "
+        "touched by listing changes since the last run are rebuilt, unless "
+        "--full is given. Use --watch to keep rebuilding every --interval seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Rebuild every slice.")
+        parser.add_argument('--watch', action='store_true')
+        parser.add_argument('--interval', type=float, default=30)
+
+    def handle(self, *args, **options):
+        full = options['full']
+        while True:
+            start = time.perf_counter()
+            keys = snapshots.build(full=full)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(keys)} snapshots in {elapsed:.2f}s."))
+            if not options['watch']:
+                return
+            full = False
+            time.sleep(options['interval'])
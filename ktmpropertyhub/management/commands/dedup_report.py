@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ktmpropertyhub import duplicates
+from ktmpropertyhub.models import ListingSignature, ListingSignatureBand, PropertyListing
+
+
+class Command(BaseCommand):
+    help = (
+        "Report groups of listings flagged as near-duplicates of each other. "
+        "Use --rebuild to first recompute every listing's signature in id "
+        "order, e.g. for listings created before signatures existed or after "
+        "changing DUPLICATE_LISTING_THRESHOLD."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--limit', type=int, default=50, help="Show at most this many groups (0 for all).")
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            self.rebuild(options['batch_size'])
+
+        # Union-find over the duplicate_of links, so chains of reposts form one group.
+        parent = {}
+
+        def find(x):
+            while parent.setdefault(x, x) != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        pairs = ListingSignature.objects.filter(duplicate_of__isnull=False).values_list('listing_id', 'duplicate_of_id')
+        for listing_id, duplicate_of in pairs.iterator(chunk_size=5000):
+            parent[find(listing_id)] = find(duplicate_of)
+        groups = {}
+        for listing_id in parent:
+            groups.setdefault(find(listing_id), []).append(listing_id)
+        groups = sorted((sorted(ids) for ids in groups.values()), key=lambda ids: (-len(ids), ids[0]))
+
+        flagged = sum(len(ids) - 1 for ids in groups)
+        self.stdout.write(f"{len(groups)} groups of near-duplicates, {flagged} listings flagged as reposts.")
+        shown = groups[:options['limit']] if options['limit'] else groups
+        listings = PropertyListing.objects.select_related('user').in_bulk([pk for ids in shown for pk in ids])
+        for ids in shown:
+            self.stdout.write(f"\n{len(ids)} listings:")
+            for pk in ids:
+                listing = listings.get(pk)
+                if listing is not None:
+                    self.stdout.write(f"  #{pk:<8} {listing.user.username:<20} {listing.title}")
+
+    def rebuild(self, batch_size):
+        start = time.perf_counter()
+        with transaction.atomic():
+            # Start empty, so each listing is only compared with earlier ones.
+            ListingSignatureBand.objects.all().delete()
+            ListingSignature.objects.all().delete()
+            indexed = 0
+            rows = PropertyListing.objects.order_by('pk').values(*duplicates.LISTING_FIELDS)
+            batch = []
+            for row in rows.iterator(chunk_size=batch_size):
+                batch.append(row)
+                if len(batch) == batch_size:
+                    duplicates.index_listings(batch)
+                    indexed += len(batch)
+                    batch = []
+            duplicates.index_listings(batch)
+            indexed += len(batch)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} listings in {elapsed:.1f}s."))
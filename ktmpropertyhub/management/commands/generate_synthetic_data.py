@@ -0,0 +1,206 @@
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ktmpropertyhub.models import PropertyListing, PropertyImage, Facility, District
+from ktmpropertyhub import analytics, facility_bits
+
+SYNTHETIC_USER_PREFIX = 'synthetic_user_'
+
+FACILITY_NAMES = [
+    'Parking', 'Drinking Water', 'Internet', 'Electricity Backup', 'Security Guard', 'CCTV',
+    'Lift', 'Garden', 'Gym', 'Swimming Pool', 'Solar Water Heater', 'Water Tank', 'Balcony',
+    'Modular Kitchen', 'Earthquake Resistant',
+]
+
+# Districts in the plains, where land is measured in bigha/katha/dhur.
+# Everywhere else uses the Hilly ropani/aana/paisa/dam units.
+TERAI_DISTRICTS = {
+    'Jhapa', 'Morang', 'Sunsari', 'Udayapur', 'Saptari', 'Siraha', 'Dhanusha', 'Mahottari',
+    'Sarlahi', 'Rautahat', 'Bara', 'Parsa', 'Chitwan', 'Nawalpur', 'Parasi', 'Rupandehi',
+    'Kapilvastu', 'Dang', 'Banke', 'Bardiya', 'Kailali', 'Kanchanpur',
+}
+
+# Rough share of listings per district: the valley and big cities dominate.
+DISTRICT_WEIGHTS = {
+    'Kathmandu': 30, 'Lalitpur': 15, 'Bhaktapur': 8, 'Kaski': 8, 'Chitwan': 6, 'Rupandehi': 5,
+    'Morang': 4, 'Jhapa': 4, 'Sunsari': 3, 'Kavrepalanchok': 3, 'Makwanpur': 2, 'Banke': 2,
+    'Kailali': 2, 'Dhanusha': 2, 'Parsa': 2,
+}
+
+LOCAL_AREAS = [
+    'Baneshwor', 'Koteshwor', 'Budhanilkantha', 'Imadol', 'Sanepa', 'Jhamsikhel', 'Thimi',
+    'Lakeside', 'Bharatpur', 'Butwal', 'Biratnagar', 'Itahari', 'Dhangadhi', 'Nepalgunj',
+    'Tokha', 'Kirtipur', 'Chabahil', 'Kalanki', 'Bhaisepati', 'Gongabu', 'Hattiban', 'Suryabinayak',
+]
+
+TITLE_TEMPLATES = {
+    'LAND': ['{area} land for {purpose} in {local}', 'Plot of {area} at {local}', 'Residential land in {local}'],
+    'HOUSE': ['{floors} storey house in {local}', 'Beautiful house at {local}', 'Family home near {local} chowk'],
+    'APARTMENT': ['{beds}BHK apartment in {local}', 'Furnished flat at {local}', 'Apartment unit, {local}'],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a reproducible synthetic dataset (users, listings, facility "
+        "links and images) for benchmarking. The same --seed always produces "
+        "the same data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=10_000)
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--max-images', type=int, default=6, help="Images per listing are drawn from 0..max.")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--clear', action='store_true', help="Delete previously generated synthetic data first.")
+        parser.add_argument('--no-rebuild', action='store_true', help="Skip rebuilding derived tables afterwards.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        User = get_user_model()
+
+        if options['clear']:
+            deleted, _ = User.objects.filter(username__startswith=SYNTHETIC_USER_PREFIX).delete()
+            self.stdout.write(f"Deleted {deleted} synthetic rows.")
+
+        districts = list(District.objects.select_related('state').order_by('pk'))
+        if not districts:
+            raise CommandError("No districts found. Run the migrations first; they seed states and districts.")
+        weights = [DISTRICT_WEIGHTS.get(d.name, 1) for d in districts]
+
+        facilities = [Facility.objects.get_or_create(name=name)[0] for name in FACILITY_NAMES]
+
+        start = time.perf_counter()
+        users = self.create_users(User, options['users'])
+        self.stdout.write(f"Users ready: {len(users)}")
+
+        batch_size = options['batch_size']
+        remaining = options['listings']
+        created = 0
+        while remaining > 0:
+            count = min(batch_size, remaining)
+            listings = [self.make_listing(rng, users, districts, weights) for _ in range(count)]
+            with transaction.atomic():
+                PropertyListing.objects.bulk_create(listings, batch_size=batch_size)
+                self.link_facilities(rng, listings, facilities)
+                self.create_images(rng, listings, options['max_images'])
+            remaining -= count
+            created += count
+            self.stdout.write(f"  {created}/{options['listings']} listings")
+
+        if not options['no_rebuild']:
+            analytics.rebuild()
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f"Generated {created} listings in {elapsed:.1f}s."))
+
+    def create_users(self, User, count):
+        password = make_password('synthetic-password')
+        existing = set(User.objects.filter(username__startswith=SYNTHETIC_USER_PREFIX).values_list('username', flat=True))
+        new_users = [
+            User(username=f"{SYNTHETIC_USER_PREFIX}{i}", email=f"{SYNTHETIC_USER_PREFIX}{i}@example.com", password=password)
+            for i in range(count)
+            if f"{SYNTHETIC_USER_PREFIX}{i}" not in existing
+        ]
+        User.objects.bulk_create(new_users, batch_size=1000)
+        return list(User.objects.filter(username__startswith=SYNTHETIC_USER_PREFIX).order_by('pk')[:count])
+
+    def make_listing(self, rng, users, districts, weights):
+        district = rng.choices(districts, weights)[0]
+        purpose = rng.choices(['SELL', 'BUY', 'RENT'], [60, 15, 25])[0]
+        property_type = rng.choices(['LAND', 'HOUSE', 'APARTMENT'], [45, 40, 15])[0]
+        listing = PropertyListing(
+            user=rng.choice(users),
+            listing_purpose=purpose,
+            property_type=property_type,
+            state_id=district.state_id,
+            district=district,
+            local_area=rng.choice(LOCAL_AREAS),
+            is_active=rng.random() < 0.9,
+            road_size_ft=rng.choice([8, 10, 12, 13, 14, 16, 20, 24, 30]),
+            road_condition=rng.choice(PropertyListing.RoadCondition.values[1:]),
+            facing_direction=rng.choice(PropertyListing.FacingDirection.values[1:]),
+            price_negotiable=rng.choice(PropertyListing.PriceNegotiability.values),
+        )
+
+        if property_type != 'APARTMENT':
+            if district.name in TERAI_DISTRICTS:
+                listing.bigha = rng.choice([0, 0, 0, 1, 2])
+                listing.katha = rng.randint(0 if listing.bigha else 1, 19)
+                listing.dhur = rng.randint(0, 19)
+            else:
+                listing.ropani = rng.choice([0, 0, 0, 1, 2, 4])
+                listing.aana = rng.randint(0 if listing.ropani else 3, 15)
+                listing.paisa = rng.randint(0, 3)
+                listing.dam = rng.randint(0, 3)
+            listing.calculate_total_land_area()
+
+        if property_type == 'LAND':
+            listing.land_type = rng.choice(PropertyListing.LandType.values)
+        else:
+            listing.floors = rng.randint(1, 4) if property_type == 'HOUSE' else None
+            listing.master_bedrooms = rng.randint(1, 3)
+            listing.common_bedrooms = rng.randint(0, 4)
+            listing.common_bathrooms = rng.randint(1, 4)
+            listing.kitchens = rng.randint(1, 2)
+            listing.living_rooms = rng.randint(1, 2)
+            listing.built_up_area_sqft = rng.randint(600, 4500)
+            listing.built_year_bs = rng.randint(2050, 2081)
+            listing.furnishing = rng.choice(PropertyListing.Furnishing.values)
+            listing.property_condition = rng.choice(PropertyListing.PropertyCondition.values[1:])
+            listing.parking_car = rng.randint(0, 2)
+            listing.parking_bike = rng.randint(0, 4)
+
+        area = listing.total_land_area_sqft or listing.built_up_area_sqft or 1000
+        if purpose == 'RENT':
+            listing.rent_amount = Decimal(rng.randrange(8_000, 250_000, 500))
+            listing.frequency = rng.choices(['MONTHLY', 'YEARLY'], [85, 15])[0]
+            if listing.frequency == 'YEARLY':
+                listing.rent_amount *= 12
+            listing.rent_available_duration = rng.randint(1, 5)
+            listing.rent_available_duration_unit = rng.choice(PropertyListing.RentDurationUnit.values)
+        else:
+            # Price per sqft varies a lot between the valley and elsewhere.
+            per_sqft = rng.lognormvariate(8.3 if district.name in DISTRICT_WEIGHTS else 7.3, 0.5)
+            listing.price = Decimal(round(area * per_sqft, -3))
+            if purpose == 'BUY':
+                listing.price_min = (listing.price * Decimal('0.7')).quantize(Decimal('1'))
+
+        template = rng.choice(TITLE_TEMPLATES[property_type])
+        listing.title = template.format(
+            area=f"{round(area)} sq.ft", purpose=purpose.lower(), local=listing.local_area,
+            floors=listing.floors or 2, beds=(listing.master_bedrooms or 1) + (listing.common_bedrooms or 0),
+        )
+        listing.description = f"{listing.title}. Contact for details. Ref {rng.randrange(10**8):08d}."
+        listing.calculate_sort_keys()
+        return listing
+
+    def link_facilities(self, rng, listings, facilities):
+        Through = PropertyListing.facilities.through
+        links = [
+            Through(propertylisting_id=listing.pk, facility_id=facility.pk)
+            for listing in listings
+            for facility in rng.sample(facilities, rng.randint(0, 8))
+        ]
+        Through.objects.bulk_create(links, batch_size=5000)
+        # bulk_create doesn't send m2m_changed.
+        facility_bits.refresh_listings(listing.pk for listing in listings)
+
+    def create_images(self, rng, listings, max_images):
+        images = []
+        for listing in listings:
+            count = rng.randint(0, max_images)
+            for n in range(count):
+                images.append(PropertyImage(
+                    property_listing_id=listing.pk,
+                    image=f"synthetic/listing-{listing.pk}-{n}",
+                    is_thumbnail=(n == 0),
+                ))
+        PropertyImage.objects.bulk_create(images, batch_size=5000)
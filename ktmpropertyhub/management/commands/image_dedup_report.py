@@ -0,0 +1,71 @@
+import os
+import tempfile
+import time
+
+import requests
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+
+from ktmpropertyhub import image_dedup
+from ktmpropertyhub.models import ArchivedListingImage, ImageAsset, PropertyImage
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the storage saved by image deduplication and the groups of "
+        "stored images that are the same picture. Use --backfill to first "
+        "download and index stored images that have no hashes yet, e.g. those "
+        "uploaded before deduplication existed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backfill', action='store_true')
+        parser.add_argument('--limit', type=int, default=50, help="Show at most this many groups (0 for all).")
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            self.backfill()
+
+        totals = ImageAsset.objects.aggregate(
+            assets=Count('id'), stored=Sum('size'), reuses=Sum('reuse_count'), saved=Sum('bytes_saved'),
+        )
+        self.stdout.write(
+            f"{totals['assets']} stored images ({(totals['stored'] or 0) / 2**20:.1f} MiB); "
+            f"{totals['reuses'] or 0} uploads reused one instead, saving {(totals['saved'] or 0) / 2**20:.1f} MiB."
+        )
+
+        groups = sorted(image_dedup.duplicate_groups(), key=lambda group: (-len(group), group[0].pk))
+        wasted = sum(asset.size for group in groups for asset in group[1:])
+        self.stdout.write(f"{len(groups)} groups of duplicate stored images, {wasted / 2**20:.1f} MiB removable.")
+        for group in groups[:options['limit']] if options['limit'] else groups:
+            self.stdout.write(f"\n{len(group)} images:")
+            for asset in group:
+                self.stdout.write(f"  {asset.public_id:<60} {asset.size:>10} bytes  {asset.width}x{asset.height}")
+
+    def backfill(self):
+        start = time.perf_counter()
+        indexed = set(ImageAsset.objects.values_list('public_id', flat=True))
+        pending = {}
+        for model in (PropertyImage, ArchivedListingImage):
+            for image in model.objects.only('image').iterator(chunk_size=1000):
+                public_id = getattr(image.image, 'public_id', None)
+                if public_id and public_id not in indexed:
+                    pending.setdefault(public_id, image.image.url)
+
+        done = failed = 0
+        for public_id, url in pending.items():
+            fd, path = tempfile.mkstemp(prefix='image-dedup-')
+            try:
+                with os.fdopen(fd, 'wb') as f, requests.get(url, stream=True, timeout=30) as response:
+                    response.raise_for_status()
+                    for chunk in response.iter_content(1 << 16):
+                        f.write(chunk)
+                image_dedup.record_asset(public_id, image_dedup.hash_file(path))
+                done += 1
+            except (requests.RequestException, OSError) as exc:
+                failed += 1
+                self.stderr.write(f"Could not fetch {public_id}: {exc}")
+            finally:
+                os.remove(path)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f"Indexed {done} stored images ({failed} failed) in {elapsed:.1f}s."))
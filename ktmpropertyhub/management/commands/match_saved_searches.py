@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_datetime
+
+from ktmpropertyhub.models import PropertyListing
+from ktmpropertyhub.saved_searches import get_index, record_matches
+
+
+class Command(BaseCommand):
+    help = (
+        "Match existing active listings against all saved searches and record "
+        "the matches. Use this to backfill after importing listings or searches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="Only match listings created at or after this ISO datetime.")
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        listings = PropertyListing.objects.filter(is_active=True).only(
+            'id', 'listing_purpose', 'property_type', 'state_id', 'district_id', 'total_land_area_sqft', 'price',
+        ).order_by('pk')
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                self.stderr.write(self.style.ERROR(f"Invalid --since value: {options['since']}"))
+                return
+            listings = listings.filter(created_at__gte=since)
+
+        index = get_index()
+        self.stdout.write(f"Matching against {len(index)} saved searches...")
+
+        batch_size = options['batch_size']
+        last_pk = 0
+        scanned = matched = 0
+        while True:
+            batch = list(listings.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            matched += record_matches(batch, index=index)
+            scanned += len(batch)
+            last_pk = batch[-1].pk
+
+        self.stdout.write(self.style.SUCCESS(f"Scanned {scanned} listings, found {matched} matches."))
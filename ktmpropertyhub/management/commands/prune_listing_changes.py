@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from ktmpropertyhub import changes
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete listing change feed entries older than "
+        "LISTING_CHANGES_RETENTION_DAYS, in small batches. Safe to run from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        deleted = changes.prune(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} change feed entries."))
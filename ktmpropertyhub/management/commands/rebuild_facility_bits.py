@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ktmpropertyhub import facility_bits
+
+
+class Command(BaseCommand):
+    help = (
+        "Assign bit numbers to facilities that lack one and recompute every "
+        "listing's facility bitset from the facilities M2M. Use --renumber to "
+        "hand out all bits afresh, e.g. after facilities were deleted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--renumber', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        assigned = facility_bits.assign_bits(renumber=options['renumber'])
+        counted = facility_bits.rebuild(options['batch_size'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Assigned {assigned} facility bits and recomputed {counted} listings in {elapsed:.1f}s."
+        ))
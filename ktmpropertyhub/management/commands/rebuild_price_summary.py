@@ -0,0 +1,15 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ktmpropertyhub import analytics
+
+
+class Command(BaseCommand):
+    help = "Recompute the price-per-sqft summary table from all active listings."
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        counted = analytics.rebuild()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f"Summarized {counted} listings in {elapsed:.1f}s."))
@@ -0,0 +1,198 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from ktmpropertyhub.models import PropertyListing
+
+
+class Rollback(Exception):
+    pass
+
+
+class QueryCounter:
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the main API endpoints and the admin changelist against the "
+        "configured database (generate data first with generate_synthetic_data). "
+        "Reports latency percentiles and queries per request, and can save "
+        "results to JSON and compare them with an earlier run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--only', nargs='*', help="Run only these scenarios.")
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+        parser.add_argument('--compare', help="Compare with the results in this JSON file.")
+        parser.add_argument('--with-throttling', action='store_true', help="Keep API throttles enabled.")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        listing = PropertyListing.objects.filter(is_active=True).select_related('district').order_by('pk').first()
+        if listing is None:
+            raise CommandError("No active listings. Run generate_synthetic_data first.")
+        owner = listing.user
+        admin = User.objects.filter(is_superuser=True).first()
+        if admin is None:
+            admin = User.objects.create_superuser('benchmark_admin', 'benchmark_admin@example.com', None)
+
+        # The test client's default host isn't in ALLOWED_HOSTS.
+        host = next((h for h in settings.ALLOWED_HOSTS if h[:1] not in ('.', '*')), 'localhost')
+        anonymous = APIClient(HTTP_HOST=host)
+        authenticated = APIClient(HTTP_HOST=host)
+        authenticated.force_authenticate(owner)
+        admin_client = APIClient(HTTP_HOST=host)
+        admin_client.force_login(admin)
+
+        filter_params = {
+            'listing_purpose': listing.listing_purpose,
+            'property_type': listing.property_type,
+            'district': listing.district_id,
+            'min_sqft': 500,
+            'max_sqft': 20_000,
+        }
+        create_payload = {
+            'listing_purpose': 'SELL', 'property_type': 'LAND', 'title': 'Benchmark listing',
+            'state': listing.state_id, 'district': listing.district_id, 'ropani': 1, 'aana': 4,
+            'price': '12500000', 'images': [],
+        }
+
+        scenarios = {
+            'list': lambda: anonymous.get('/api/properties/'),
+            'filter': lambda: anonymous.get('/api/properties/', filter_params),
+            'retrieve': lambda: anonymous.get(f'/api/properties/{listing.pk}/'),
+            'create': lambda: self.rolled_back(lambda: authenticated.post('/api/add-property/', create_payload, format='json')),
+            'admin_changelist': lambda: admin_client.get('/admin/ktmpropertyhub/propertylisting/'),
+        }
+        if options['only']:
+            unknown = set(options['only']) - set(scenarios)
+            if unknown:
+                raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+            scenarios = {name: run for name, run in scenarios.items() if name in options['only']}
+
+        # All requests come from one client, which the throttles would
+        # otherwise start rejecting part-way through.
+        rest_framework = dict(settings.REST_FRAMEWORK)
+        if not options['with_throttling']:
+            rest_framework['DEFAULT_THROTTLE_RATES'] = {scope: None for scope in rest_framework.get('DEFAULT_THROTTLE_RATES', {})}
+
+        results = {}
+        with override_settings(REST_FRAMEWORK=rest_framework):
+            for name, run in scenarios.items():
+                results[name] = self.measure(name, run, options['warmup'], options['iterations'])
+
+        report = {
+            'commit': self.git_commit(),
+            'database': connection.vendor,
+            'listings': PropertyListing.objects.count(),
+            'python': platform.python_version(),
+            'timestamp': timezone.now().isoformat(),
+            'iterations': options['iterations'],
+            'results': results,
+        }
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        self.print_report(report, baseline)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def rolled_back(self, request):
+        """
+        Run a write request in a transaction that is rolled back afterwards,
+        so repeated runs see the same data.
+        """
+        response = None
+        try:
+            with transaction.atomic():
+                response = request()
+                raise Rollback
+        except Rollback:
+            pass
+        return response
+
+    def measure(self, name, run, warmup, iterations):
+        for _ in range(warmup):
+            run()
+
+        latencies = []
+        queries = []
+        status = None
+        for _ in range(iterations):
+            # Count with an execute wrapper rather than connection.queries,
+            # whose log is capped and would undercount the worst endpoints.
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                start = time.perf_counter()
+                response = run()
+                latencies.append((time.perf_counter() - start) * 1000)
+            queries.append(counter.count)
+            status = response.status_code
+
+        latencies.sort()
+        return {
+            'status': status,
+            'bytes': len(response.content),
+            'queries': statistics.mean(queries),
+            'mean_ms': statistics.mean(latencies),
+            'p50_ms': self.percentile(latencies, 50),
+            'p90_ms': self.percentile(latencies, 90),
+            'p99_ms': self.percentile(latencies, 99),
+        }
+
+    @staticmethod
+    def percentile(ordered, p):
+        index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered) + 0.5) - 1))
+        return ordered[index]
+
+    @staticmethod
+    def git_commit():
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def print_report(self, report, baseline):
+        self.stdout.write(
+            f"commit {report['commit']} on {report['database']}, {report['listings']} listings, "
+            f"{report['iterations']} iterations"
+        )
+        header = f"{'scenario':<18}{'status':>7}{'queries':>9}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'KiB':>10}"
+        if baseline:
+            header += f"{'p50 vs ' + str(baseline.get('commit')):>20}"
+        self.stdout.write(header)
+        for name, r in report['results'].items():
+            line = (
+                f"{name:<18}{r['status']:>7}{r['queries']:>9.1f}{r['p50_ms']:>10.1f}"
+                f"{r['p90_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['bytes'] / 1024:>10.1f}"
+            )
+            before = (baseline or {}).get('results', {}).get(name)
+            if before:
+                change = (r['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0
+                line += f"{change:>+19.1f}%"
+            self.stdout.write(line)
@@ -0,0 +1,49 @@
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from ktmpropertyhub import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background jobs from the database queue with --concurrency "
+        "worker threads, until interrupted. On SIGTERM or Ctrl-C the workers "
+        "finish their current job and exit. Use --drain to exit once the "
+        "queue is empty instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--drain', action='store_true')
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stop.set())
+
+        requeued = jobs.recover_stale()
+        pruned = jobs.prune()
+        self.stdout.write(f"Requeued {requeued} orphaned jobs, pruned {pruned} finished jobs.")
+
+        workers = [
+            jobs.Worker(number, stop, options['poll_interval'], options['drain'])
+            for number in range(options['concurrency'])
+        ]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        # Orphaned jobs are checked for again every minute while running.
+        recovered_at = time.monotonic()
+        while any(worker.is_alive() for worker in workers) and not stop.wait(1):
+            if time.monotonic() - recovered_at > 60:
+                jobs.recover_stale()
+                recovered_at = time.monotonic()
+        for worker in workers:
+            worker.join()
+        processed = sum(worker.processed for worker in workers)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f"Ran {processed} jobs in {elapsed:.1f}s."))
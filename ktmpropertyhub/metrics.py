@@ -0,0 +1,179 @@
+"""
+A small in-process metrics registry with Prometheus text exposition.
+
+We only need counters and latency histograms, so rather than pulling in
+prometheus_client this keeps a dict of series guarded by one lock. Each
+histogram also keeps a rolling window of recent observations (a ring of
+fixed-length time slots) from which we export p50/p90/p99, so the numbers
+reflect the last few minutes rather than the whole life of the process.
+
+Metrics are per process: each worker exports its own, and the scraper (or
+the dashboard) adds them up.
+"""
+import bisect
+import threading
+import time
+
+# Upper bounds, in seconds, of the latency buckets (the +Inf bucket is implicit).
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+WINDOW_SLOT_SECONDS = 60
+WINDOW_SLOTS = 5
+WINDOW_QUANTILES = (0.5, 0.9, 0.99)
+
+
+class Histogram:
+    """
+    Cumulative bucket counts (exported as a Prometheus histogram) plus the
+    same counts split into time slots for the rolling-window quantiles.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.slots = {}  # slot number -> per-bucket counts
+
+    def observe(self, value, now):
+        index = bisect.bisect_left(self.buckets, value)
+        self.counts[index] += 1
+        self.sum += value
+
+        slot = int(now // WINDOW_SLOT_SECONDS)
+        counts = self.slots.get(slot)
+        if counts is None:
+            counts = self.slots[slot] = [0] * (len(self.buckets) + 1)
+            for old in [s for s in self.slots if s <= slot - WINDOW_SLOTS]:
+                del self.slots[old]
+        counts[index] += 1
+
+    def window_quantiles(self, now, quantiles=WINDOW_QUANTILES):
+        """
+        Estimate quantiles over the rolling window by linear interpolation
+        within buckets, the same way PromQL's histogram_quantile() does.
+        """
+        oldest = int(now // WINDOW_SLOT_SECONDS) - WINDOW_SLOTS
+        window = [0] * (len(self.buckets) + 1)
+        for slot, counts in self.slots.items():
+            if slot > oldest:
+                for i, count in enumerate(counts):
+                    window[i] += count
+        total = sum(window)
+        if not total:
+            return {}
+
+        results = {}
+        for q in quantiles:
+            rank = q * total
+            seen = 0
+            for i, count in enumerate(window):
+                if count and seen + count >= rank:
+                    if i == len(self.buckets):
+                        results[q] = self.buckets[-1]
+                    else:
+                        lower = self.buckets[i - 1] if i else 0.0
+                        fraction = (rank - seen) / count
+                        results[q] = lower + (self.buckets[i] - lower) * fraction
+                    break
+                seen += count
+        return results
+
+
+class Registry:
+    """
+    Holds every series, keyed by (metric name, label pairs).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.help = {}
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def inc(self, name, labels=(), amount=1):
+        key = (name, tuple(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        now = time.time()
+        key = (name, tuple(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value, now)
+
+    def clear(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def render(self):
+        """
+        The registry in the Prometheus text exposition format (version 0.0.4).
+        """
+        now = time.time()
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+            snapshots = [
+                (key, list(h.counts), h.sum, h.buckets, h.window_quantiles(now))
+                for key, h in histograms
+            ]
+
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f"{name}{_labels(labels)} {value}")
+
+        for (name, labels), counts, total, buckets, _ in snapshots:
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+
+        for (name, labels), _, _, _, quantiles in snapshots:
+            if not quantiles:
+                continue
+            window_name = f"{name}_window"
+            if window_name not in described:
+                described.add(window_name)
+                lines.append(
+                    f"# HELP {window_name} Estimated quantiles of {name} over the last "
+                    f"{WINDOW_SLOTS * WINDOW_SLOT_SECONDS} seconds."
+                )
+                lines.append(f"# TYPE {window_name} gauge")
+            for q, value in quantiles.items():
+                lines.append(f"{window_name}{_labels(labels + (('quantile', repr(q)),))} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ktmpropertyhub', '0003_rename_rent_duration_value_propertylisting_aana_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SavedSearch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, help_text='An optional label for this search.', max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('is_active', models.BooleanField(default=True, help_text='Inactive searches do not receive new matches.')),
+                ('listing_purpose', models.CharField(blank=True, choices=[('BUY', 'Buy'), ('SELL', 'Sell'), ('RENT', 'Rent')], max_length=4, null=True)),
+                ('property_type', models.CharField(blank=True, choices=[('LAND', 'Land'), ('HOUSE', 'House'), ('APARTMENT', 'Apartment')], max_length=10, null=True)),
+                ('min_sqft', models.FloatField(blank=True, null=True)),
+                ('max_sqft', models.FloatField(blank=True, null=True)),
+                ('min_price', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True)),
+                ('max_price', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True)),
+                ('district', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='ktmpropertyhub.district')),
+                ('state', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='ktmpropertyhub.state')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saved_searches', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Saved searches',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SavedSearchMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('is_seen', models.BooleanField(default=False)),
+                ('property_listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saved_search_matches', to='ktmpropertyhub.propertylisting')),
+                ('saved_search', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='matches', to='ktmpropertyhub.savedsearch')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'constraints': [models.UniqueConstraint(fields=('saved_search', 'property_listing'), name='unique_saved_search_match')],
+            },
+        ),
+    ]
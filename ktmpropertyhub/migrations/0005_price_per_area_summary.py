@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ktmpropertyhub', '0004_saved_searches'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PricePerAreaSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('property_type', models.CharField(choices=[('LAND', 'Land'), ('HOUSE', 'House'), ('APARTMENT', 'Apartment')], max_length=10)),
+                ('listing_purpose', models.CharField(choices=[('BUY', 'Buy'), ('SELL', 'Sell'), ('RENT', 'Rent')], max_length=4)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.FloatField(default=0, help_text='Sum of price per sqft, for the mean.')),
+                ('sketch', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('district', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='price_summaries', to='ktmpropertyhub.district')),
+            ],
+            options={
+                'verbose_name_plural': 'Price per area summaries',
+                'constraints': [models.UniqueConstraint(fields=('district', 'property_type', 'listing_purpose'), name='unique_price_summary_slice')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:02
+
+from django.db import migrations, models
+
+
+def fill_facility_bits(apps, schema_editor):
+    Facility = apps.get_model('ktmpropertyhub', 'Facility')
+    PropertyListing = apps.get_model('ktmpropertyhub', 'PropertyListing')
+    Through = PropertyListing.facilities.through
+
+    facilities = list(Facility.objects.order_by('pk')[:63])
+    for bit, facility in enumerate(facilities):
+        facility.bit = bit
+    Facility.objects.bulk_update(facilities, ['bit'])
+
+    bits = {}
+    for listing_id, bit in Through.objects.filter(facility__bit__isnull=False).values_list('propertylisting_id', 'facility__bit'):
+        bits[listing_id] = bits.get(listing_id, 0) | (1 << bit)
+    PropertyListing.objects.bulk_update(
+        [PropertyListing(pk=pk, facility_bits=value) for pk, value in bits.items()], ['facility_bits'], batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ktmpropertyhub', '0005_price_per_area_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facility',
+            name='bit',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='propertylisting',
+            name='facility_bits',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_facility_bits, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ktmpropertyhub', '0006_facility_bits'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingStats',
+            fields=[
+                ('listing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='ktmpropertyhub.propertylisting')),
+                ('view_count', models.PositiveIntegerField(default=0)),
+                ('contact_count', models.PositiveIntegerField(default=0, help_text='Times the contact details were requested.')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Listing stats',
+            },
+        ),
+    ]
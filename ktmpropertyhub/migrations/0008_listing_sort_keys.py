@@ -0,0 +1,66 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:10
+
+from django.conf import settings
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def fill_sort_keys(apps, schema_editor):
+    PropertyListing = apps.get_model('ktmpropertyhub', 'PropertyListing')
+    fields = ('id', 'price', 'rent_amount', 'frequency', 'total_land_area_sqft')
+    batch = []
+    for row in PropertyListing.objects.values(*fields).iterator(chunk_size=2000):
+        listing = PropertyListing(pk=row['id'], monthly_rent=None, price_per_sqft=None)
+        if row['rent_amount'] is not None:
+            rent = row['rent_amount']
+            listing.monthly_rent = (rent / 12).quantize(Decimal('0.01')) if row['frequency'] == 'YEARLY' else rent
+        if row['price'] and row['total_land_area_sqft']:
+            listing.price_per_sqft = float(row['price']) / row['total_land_area_sqft']
+        batch.append(listing)
+        if len(batch) == 2000:
+            PropertyListing.objects.bulk_update(batch, ['monthly_rent', 'price_per_sqft'])
+            batch = []
+    PropertyListing.objects.bulk_update(batch, ['monthly_rent', 'price_per_sqft'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ktmpropertyhub', '0007_listing_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='propertylisting',
+            name='monthly_rent',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='propertylisting',
+            name='price_per_sqft',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_sort_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='propertylisting',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['created_at', 'id'], name='listing_sort_newest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='propertylisting',
+            index=models.Index(condition=models.Q(('is_active', True), ('price__isnull', False)), fields=['price', 'id'], name='listing_sort_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='propertylisting',
+            index=models.Index(condition=models.Q(('is_active', True), ('total_land_area_sqft__isnull', False)), fields=['total_land_area_sqft', 'id'], name='listing_sort_area_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='propertylisting',
+            index=models.Index(condition=models.Q(('is_active', True), ('monthly_rent__isnull', False)), fields=['monthly_rent', 'id'], name='listing_sort_rent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='propertylisting',
+            index=models.Index(condition=models.Q(('is_active', True), ('price_per_sqft__isnull', False)), fields=['price_per_sqft', 'id'], name='listing_sort_ppsf_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ktmpropertyhub', '0008_listing_sort_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingSignature',
+            fields=[
+                ('listing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='ktmpropertyhub.propertylisting')),
+                ('minhash', models.JSONField()),
+                ('similarity', models.FloatField(blank=True, null=True)),
+                ('duplicate_of', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='ktmpropertyhub.propertylisting')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ListingSignatureBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField(db_index=True)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ktmpropertyhub.propertylisting')),
+            ],
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:16
+
+import cloudinary.models
+import django.core.serializers.json
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ktmpropertyhub', '0009_listing_signatures'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedListing',
+            fields=[
+                ('id', models.BigIntegerField(help_text="The listing's original id.", primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('reason', models.CharField(choices=[('INACTIVE', 'Inactive'), ('STALE', 'Not updated for a long time')], max_length=10)),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('facility_ids', models.JSONField(default=list)),
+                ('view_count', models.PositiveIntegerField(default=0)),
+                ('contact_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-archived_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedListingImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', cloudinary.models.CloudinaryField(max_length=255, verbose_name='image')),
+                ('caption', models.CharField(blank=True, max_length=255, null=True)),
+                ('is_thumbnail', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='propertylisting',
+            index=models.Index(fields=['updated_at'], name='listing_updated_at_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedlisting',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_listings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedlistingimage',
+            name='listing',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='images', to='ktmpropertyhub.archivedlisting'),
+        ),
+    ]
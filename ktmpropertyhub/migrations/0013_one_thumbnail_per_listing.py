@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:23
+
+from django.db import migrations, models
+
+
+def keep_first_thumbnail(apps, schema_editor):
+    PropertyImage = apps.get_model('ktmpropertyhub', 'PropertyImage')
+    seen = set()
+    extra = []
+    for pk, listing_id in PropertyImage.objects.filter(is_thumbnail=True).order_by('property_listing_id', 'pk').values_list('pk', 'property_listing_id'):
+        if listing_id in seen:
+            extra.append(pk)
+        seen.add(listing_id)
+    for start in range(0, len(extra), 1000):
+        PropertyImage.objects.filter(pk__in=extra[start:start + 1000]).update(is_thumbnail=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ktmpropertyhub', '0012_job_queue'),
+    ]
+
+    operations = [
+        migrations.RunPython(keep_first_thumbnail, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='propertyimage',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_thumbnail', True)), fields=('property_listing',), name='one_thumbnail_per_listing'),
+        ),
+    ]
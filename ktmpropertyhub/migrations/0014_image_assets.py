@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ktmpropertyhub', '0013_one_thumbnail_per_listing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageAsset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('public_id', models.CharField(db_index=True, max_length=255)),
+                ('sha256', models.CharField(db_index=True, help_text='SHA-256 of the uploaded file.', max_length=64)),
+                ('phash', models.BigIntegerField(blank=True, help_text='64-bit difference hash of the picture.', null=True)),
+                ('size', models.PositiveBigIntegerField(help_text='Bytes of the uploaded file.')),
+                ('width', models.PositiveIntegerField(blank=True, null=True)),
+                ('height', models.PositiveIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('reuse_count', models.PositiveIntegerField(default=0, help_text='Uploads attached to this image instead of stored again.')),
+                ('bytes_saved', models.PositiveBigIntegerField(default=0, help_text='Bytes not uploaded thanks to those reuses.')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ImageAssetBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField(db_index=True)),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ktmpropertyhub.imageasset')),
+            ],
+        ),
+    ]
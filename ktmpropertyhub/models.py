@@ -1,8 +1,10 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings # To link to the User model
+from django.core.serializers.json import DjangoJSONEncoder
 from cloudinary.models import CloudinaryField
 from django.utils.text import slugify
 import time
+from decimal import Decimal
 
 
 class State(models.Model):
@@ -30,6 +32,8 @@ class Facility(models.Model):
     the checklist on the frontend.
     """
     name = models.CharField(max_length=100, unique=True)
+    # Position in PropertyListing.facility_bits (see facility_bits.py).
+    bit = models.PositiveSmallIntegerField(null=True, blank=True, unique=True, editable=False)
 
     def __str__(self):
         return self.name
@@ -108,10 +112,12 @@ class PropertyListing(models.Model):
     # We use a FloatField to handle the decimal precision from the conversions.
     total_land_area_sqft = models.FloatField(null=True, blank=True, help_text="Total land area in square feet, calculated automatically.")
 
-    def save(self, *args, **kwargs):
+    def calculate_total_land_area(self):
         """
-        Override the save method to automatically calculate the total square feet.
-        This is the ultimate source of truth for the calculation.
+        Calculate `total_land_area_sqft` from the Hilly or Terai units and
+        clear the units of the other system. This is the ultimate source of
+        truth for the calculation; bulk inserts that bypass save() call it
+        directly.
         """
         # Precise conversion factors
         ROPANI_SQFT = 5476
@@ -158,7 +164,92 @@ class PropertyListing(models.Model):
         # Assign the calculated value back to the model field.
         self.total_land_area_sqft = total_sqft if total_sqft > 0 else None
 
+    # The inputs and outputs of calculate_total_land_area().
+    LAND_UNIT_FIELDS = frozenset({'ropani', 'aana', 'paisa', 'dam', 'bigha', 'katha', 'dhur'})
+    LAND_AREA_FIELDS = LAND_UNIT_FIELDS | {'total_land_area_sqft'}
+    # The inputs and outputs of calculate_sort_keys().
+    SORT_KEY_INPUTS = frozenset({'price', 'rent_amount', 'frequency', 'total_land_area_sqft'})
+    SORT_KEY_FIELDS = frozenset({'monthly_rent', 'price_per_sqft'})
+
+    def calculate_sort_keys(self):
+        """
+        Fill the stored sort columns: the rent normalized to a monthly amount
+        and the price per sqft of land. Call after calculate_total_land_area().
+        """
+        if self.rent_amount is None:
+            self.monthly_rent = None
+        elif self.frequency == self.RentPeriod.YEARLY:
+            self.monthly_rent = (Decimal(self.rent_amount) / 12).quantize(Decimal('0.01'))
+        else:
+            self.monthly_rent = self.rent_amount
+        if self.price and self.total_land_area_sqft:
+            self.price_per_sqft = float(self.price) / self.total_land_area_sqft
+        else:
+            self.price_per_sqft = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what was loaded so save() can write only what changed.
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._remember_loaded_values(fields)
+
+    def _remember_loaded_values(self, fields=None):
+        deferred = self.get_deferred_fields()
+        loaded = getattr(self, '_loaded_values', {})
+        for field in self._meta.concrete_fields:
+            if field.attname not in deferred and (fields is None or field.name in fields or field.attname in fields):
+                loaded[field.attname] = getattr(self, field.attname)
+        self._loaded_values = loaded
+
+    def get_dirty_fields(self):
+        """
+        Names of the fields whose value differs from what was loaded from the
+        database, or None if the instance wasn't loaded from it (new objects).
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if self._state.adding or loaded is None:
+            return None
+        return {
+            field.name for field in self._meta.concrete_fields
+            if field.attname in loaded and getattr(self, field.attname) != loaded[field.attname]
+        }
+
+    def save(self, *args, **kwargs):
+        """
+        Override the save method to automatically calculate the total square feet.
+
+        Saving a listing loaded from the database writes only the fields that
+        changed (plus `updated_at`), so concurrent edits of different fields
+        don't overwrite each other, and the land area and sort keys are only
+        recalculated when one of their inputs changed.
+        """
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            changed = self.get_dirty_fields()
+            if changed is not None:
+                changed.add('updated_at')
+        else:
+            changed = set(update_fields)
+        if changed is None:
+            self.calculate_total_land_area()
+            self.calculate_sort_keys()
+        else:
+            # The units are the source of truth: an edit of the area alone
+            # is recalculated away too.
+            if changed & self.LAND_AREA_FIELDS:
+                self.calculate_total_land_area()
+                changed |= self.LAND_AREA_FIELDS
+            if changed & self.SORT_KEY_INPUTS:
+                self.calculate_sort_keys()
+                changed |= self.SORT_KEY_FIELDS
+            kwargs['update_fields'] = changed
         super().save(*args, **kwargs) # Call the original save method to save all changes.
+        self._remember_loaded_values()
 
     # --- Road Information ---
     road_size_min_ft = models.PositiveIntegerField(blank=True, null=True, help_text="Minimum size of the road.")
@@ -275,12 +366,36 @@ class PropertyListing(models.Model):
         blank=True,
         help_text="Select the available facilities from the predefined list."
     )
+    # Denormalized copy of `facilities` as a bitset, for fast "has all" filtering.
+    facility_bits = models.BigIntegerField(default=0, editable=False)
+
+    # Stored sort keys, calculated on save (see calculate_sort_keys()).
+    monthly_rent = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True, editable=False)
+    price_per_sqft = models.FloatField(null=True, blank=True, editable=False)
 
     def __str__(self):
         return f"{self.get_property_type_display()} for {self.get_listing_purpose_display()} - {self.title}"
 
     class Meta:
         ordering = ['-created_at']
+        # One index per public sort order, covering only the rows that can
+        # appear in it, so sorted pages are read in index order. Scanned
+        # backwards for the descending orders.
+        indexes = [
+            models.Index(fields=['created_at', 'id'], condition=models.Q(is_active=True), name='listing_sort_newest_idx'),
+            models.Index(fields=['price', 'id'], condition=models.Q(is_active=True, price__isnull=False), name='listing_sort_price_idx'),
+            models.Index(
+                fields=['total_land_area_sqft', 'id'], condition=models.Q(is_active=True, total_land_area_sqft__isnull=False),
+                name='listing_sort_area_idx',
+            ),
+            models.Index(fields=['monthly_rent', 'id'], condition=models.Q(is_active=True, monthly_rent__isnull=False), name='listing_sort_rent_idx'),
+            models.Index(
+                fields=['price_per_sqft', 'id'], condition=models.Q(is_active=True, price_per_sqft__isnull=False),
+                name='listing_sort_ppsf_idx',
+            ),
+            # For finding listings to archive (see archive.py).
+            models.Index(fields=['updated_at'], name='listing_updated_at_idx'),
+        ]
 
 
 class PropertyImage(models.Model):
@@ -311,6 +426,290 @@ class PropertyImage(models.Model):
         help_text="Is this the main display image for the property?"
     )
 
+    class Meta:
+        constraints = [
+            # List responses show one image per listing (see serializers.card_images_prefetch).
+            models.UniqueConstraint(
+                fields=['property_listing'], condition=models.Q(is_thumbnail=True), name='one_thumbnail_per_listing',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        """
+        Making an image the thumbnail takes the flag away from the listing's
+        previous thumbnail.
+        """
+        if self.is_thumbnail:
+            with transaction.atomic():
+                (
+                    PropertyImage.objects.filter(property_listing_id=self.property_listing_id, is_thumbnail=True)
+                    .exclude(pk=self.pk).update(is_thumbnail=False)
+                )
+                super().save(*args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Image for property: {self.property_listing.title}"
-    
\ No newline at end of file
+    
+
+class SavedSearch(models.Model):
+    """
+    A user's saved set of `PropertyFilter` parameters. New listings are
+    matched against these to produce alerts (see `saved_searches.py`).
+    Any criterion left empty matches everything.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='saved_searches')
+    name = models.CharField(max_length=100, blank=True, help_text="An optional label for this search.")
+    created_at = models.DateTimeField(auto_now_add=True)
+    is_active = models.BooleanField(default=True, help_text="Inactive searches do not receive new matches.")
+
+    # --- The PropertyFilter parameter set ---
+    listing_purpose = models.CharField(max_length=4, choices=PropertyListing.ListingPurpose.choices, blank=True, null=True)
+    property_type = models.CharField(max_length=10, choices=PropertyListing.PropertyType.choices, blank=True, null=True)
+    state = models.ForeignKey(State, on_delete=models.CASCADE, null=True, blank=True)
+    district = models.ForeignKey(District, on_delete=models.CASCADE, null=True, blank=True)
+    min_sqft = models.FloatField(null=True, blank=True)
+    max_sqft = models.FloatField(null=True, blank=True)
+    min_price = models.DecimalField(max_digits=14, decimal_places=2, blank=True, null=True)
+    max_price = models.DecimalField(max_digits=14, decimal_places=2, blank=True, null=True)
+
+    def matches(self, listing):
+        """
+        Exact check of a listing against this search, with the same
+        semantics as `PropertyFilter` (inclusive ranges, NULLs never match
+        a bounded range).
+        """
+        if self.listing_purpose and listing.listing_purpose != self.listing_purpose:
+            return False
+        if self.property_type and listing.property_type != self.property_type:
+            return False
+        if self.state_id and listing.state_id != self.state_id:
+            return False
+        if self.district_id and listing.district_id != self.district_id:
+            return False
+        for value, low, high in (
+            (listing.total_land_area_sqft, self.min_sqft, self.max_sqft),
+            (listing.price, self.min_price, self.max_price),
+        ):
+            if low is None and high is None:
+                continue
+            if value is None:
+                return False
+            if low is not None and value < low:
+                return False
+            if high is not None and value > high:
+                return False
+        return True
+
+    def __str__(self):
+        return self.name or f"Saved search #{self.pk} for {self.user}"
+
+    class Meta:
+        verbose_name_plural = "Saved searches"
+        ordering = ['-created_at']
+
+
+class SavedSearchMatch(models.Model):
+    """
+    Records that a listing matched a saved search. One row per pair; these
+    are the alerts shown to (or sent to) the search owner.
+    """
+    saved_search = models.ForeignKey(SavedSearch, on_delete=models.CASCADE, related_name='matches')
+    property_listing = models.ForeignKey(PropertyListing, on_delete=models.CASCADE, related_name='saved_search_matches')
+    created_at = models.DateTimeField(auto_now_add=True)
+    is_seen = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['saved_search', 'property_listing'], name='unique_saved_search_match'),
+        ]
+
+
+class PricePerAreaSummary(models.Model):
+    """
+    Pre-aggregated price-per-sqft statistics for one (district, property type,
+    purpose) slice of the active listings. `sketch` holds a mergeable quantile
+    sketch (see `analytics.QuantileSketch`), so percentiles for any
+    combination of slices can be answered without touching the listing table.
+    Maintained incrementally by signal handlers and rebuilt by
+    `manage.py rebuild_price_summary`.
+    """
+    district = models.ForeignKey(District, on_delete=models.CASCADE, null=True, blank=True, related_name='price_summaries')
+    property_type = models.CharField(max_length=10, choices=PropertyListing.PropertyType.choices)
+    listing_purpose = models.CharField(max_length=4, choices=PropertyListing.ListingPurpose.choices)
+    count = models.PositiveIntegerField(default=0)
+    total = models.FloatField(default=0, help_text="Sum of price per sqft, for the mean.")
+    sketch = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Price per area summaries"
+        constraints = [
+            models.UniqueConstraint(fields=['district', 'property_type', 'listing_purpose'], name='unique_price_summary_slice'),
+        ]
+
+
+class ListingStats(models.Model):
+    """
+    Engagement counters for a listing, kept out of the `PropertyListing` row
+    so that counting a view never writes to (or locks) the listing itself.
+    Written in batches by `counters.CounterBuffer`.
+    """
+    listing = models.OneToOneField(PropertyListing, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    view_count = models.PositiveIntegerField(default=0)
+    contact_count = models.PositiveIntegerField(default=0, help_text="Times the contact details were requested.")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Listing stats"
+
+    def __str__(self):
+        return f"Stats for listing {self.listing_id}"
+
+
+class ListingSignature(models.Model):
+    """
+    MinHash signature of a listing's text, used to spot near-duplicate posts
+    (see duplicates.py). `duplicate_of` is the earliest earlier listing that
+    was similar enough, if any.
+    """
+    listing = models.OneToOneField(PropertyListing, on_delete=models.CASCADE, primary_key=True, related_name='signature')
+    minhash = models.JSONField()
+    duplicate_of = models.ForeignKey(PropertyListing, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    similarity = models.FloatField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Signature of listing {self.listing_id}"
+
+
+class ListingSignatureBand(models.Model):
+    """
+    One locality-sensitive-hashing band of a listing's signature. Listings
+    sharing a `key` are duplicate candidates.
+    """
+    listing = models.ForeignKey(PropertyListing, on_delete=models.CASCADE, related_name='+')
+    key = models.BigIntegerField(db_index=True)
+
+
+class ArchivedListing(models.Model):
+    """
+    A listing moved out of `PropertyListing` because it was inactive or had
+    no activity for a long time (see archive.py). Keeps the listing's id; `data` holds its field
+    values by attname so it can be restored as it was.
+    """
+    class Reason(models.TextChoices):
+        INACTIVE = 'INACTIVE', 'Inactive'
+        STALE = 'STALE', 'Not updated for a long time'
+
+    id = models.BigIntegerField(primary_key=True, help_text="The listing's original id.")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_listings')
+    title = models.CharField(max_length=255)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    reason = models.CharField(max_length=10, choices=Reason.choices)
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    facility_ids = models.JSONField(default=list)
+    view_count = models.PositiveIntegerField(default=0)
+    contact_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-archived_at']
+
+    def __str__(self):
+        return f"Archived listing {self.pk} - {self.title}"
+
+
+class ArchivedListingImage(models.Model):
+    """
+    An image of an archived listing. The Cloudinary asset itself is left
+    where it is.
+    """
+    listing = models.ForeignKey(ArchivedListing, on_delete=models.CASCADE, related_name='images')
+    image = CloudinaryField('image')
+    caption = models.CharField(max_length=255, blank=True, null=True)
+    is_thumbnail = models.BooleanField(default=False)
+
+
+class ListingChange(models.Model):
+    """
+    One entry in the change log behind `/api/properties/changes/` (see
+    changes.py). The id is the feed cursor. Entries outlive deleted
+    listings, so `listing_id` is a plain integer rather than a foreign key.
+    """
+    class Kind(models.TextChoices):
+        CREATED = 'CREATED', 'Created'
+        UPDATED = 'UPDATED', 'Updated'
+        DELETED = 'DELETED', 'Deleted'
+
+    listing_id = models.BigIntegerField()
+    kind = models.CharField(max_length=7, choices=Kind.choices)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+
+class Job(models.Model):
+    """
+    A unit of background work in the database-backed queue (see jobs.py),
+    run by `manage.py run_workers`. `name` selects the registered function
+    and `payload` holds its keyword arguments.
+    """
+    class Status(models.TextChoices):
+        QUEUED = 'QUEUED', 'Queued'
+        RUNNING = 'RUNNING', 'Running'
+        DONE = 'DONE', 'Done'
+        FAILED = 'FAILED', 'Failed'
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=7, choices=Status.choices, default=Status.QUEUED)
+    idempotency_key = models.CharField(
+        max_length=255, unique=True, null=True, blank=True,
+        help_text="Enqueueing again with the same key returns the existing job.",
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(help_text="Not run before this time; pushed back after a failed attempt.")
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The workers' "next due job" query.
+            models.Index(fields=['run_at', 'id'], condition=models.Q(status='QUEUED'), name='job_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+
+class ImageAsset(models.Model):
+    """
+    An image stored in Cloudinary, indexed by content (see image_dedup.py).
+    Uploads of the same file, or of a re-encoded copy, are attached to the
+    stored image instead of being uploaded again.
+    """
+    public_id = models.CharField(max_length=255, db_index=True)
+    sha256 = models.CharField(max_length=64, db_index=True, help_text="SHA-256 of the uploaded file.")
+    phash = models.BigIntegerField(null=True, blank=True, help_text="64-bit difference hash of the picture.")
+    size = models.PositiveBigIntegerField(help_text="Bytes of the uploaded file.")
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    reuse_count = models.PositiveIntegerField(default=0, help_text="Uploads attached to this image instead of stored again.")
+    bytes_saved = models.PositiveBigIntegerField(default=0, help_text="Bytes not uploaded thanks to those reuses.")
+
+    def __str__(self):
+        return self.public_id
+
+
+class ImageAssetBand(models.Model):
+    """
+    One 16-bit band of an asset's perceptual hash. Assets sharing a `key`
+    are near-duplicate candidates.
+    """
+    asset = models.ForeignKey(ImageAsset, on_delete=models.CASCADE, related_name='+')
+    key = models.BigIntegerField(db_index=True)
@@ -0,0 +1,147 @@
+"""
+Keeping expensive requests from taking the service down.
+
+A list request with wide filter ranges and no pagination can run a query for
+longer than the function is allowed to live, holding a database connection
+the whole time; a burst of them exhausts the connections and everything else
+queues behind them. Two limits, configured per view `load_scope`:
+
+- `STATEMENT_TIMEOUTS`: on Postgres, reads (GET, HEAD, OPTIONS) run in a
+  transaction with `SET LOCAL statement_timeout`, so the database cancels
+  any query that takes longer and the connection is free again. The client
+  gets a 503 with `Retry-After` instead of a gateway timeout. Writes keep
+  their own transaction handling and run without a timeout, as do other
+  databases, which have no such setting.
+- `MAX_CONCURRENT_REQUESTS`: at most this many expensive requests of a scope
+  run at once. Each holds one of that many slots in the shared cache (a key
+  added with `cache.add`, which is atomic); a request that finds every slot
+  taken is shed with a 503 and `Retry-After` before touching the database.
+  Slots expire after `OVERLOAD_SLOT_LEASE` seconds, so a process that dies
+  mid-request can't leak one for long. Without a shared cache the limit
+  applies per process.
+
+Shed requests are counted in `ktm_shed_requests_total`, by scope and reason.
+"""
+import random
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import OperationalError, connection, transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+
+from .metrics import registry
+
+# SQLSTATE of a query cancelled by statement_timeout.
+QUERY_CANCELED = '57014'
+
+registry.describe('ktm_shed_requests_total', "Requests refused with a 503 to protect the database, per scope and reason.")
+
+
+class Overloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "The service is busy. Please try again shortly."
+    default_code = 'overloaded'
+
+    def __init__(self, wait, detail=None):
+        super().__init__(detail)
+        # DRF's exception handler turns `wait` into a Retry-After header.
+        self.wait = wait
+
+
+def retry_after():
+    # A little jitter, so shed clients don't all come back at the same moment.
+    base = getattr(settings, 'OVERLOAD_RETRY_AFTER', 5)
+    return base + random.randint(0, base)
+
+
+def is_statement_timeout(exc):
+    cause = exc.__cause__
+    # psycopg 3 names it sqlstate, psycopg2 pgcode.
+    return QUERY_CANCELED in (getattr(cause, 'sqlstate', None), getattr(cause, 'pgcode', None))
+
+
+class ConcurrencyLimiter:
+    """
+    Up to `limit` concurrent holders per scope, as slot keys in the cache.
+    """
+    cache_alias = 'default'
+
+    def acquire(self, scope, limit):
+        """
+        Take a free slot and return its key, or None if all are taken.
+        """
+        if limit <= 0:
+            return None
+        cache = caches[self.cache_alias]
+        lease = getattr(settings, 'OVERLOAD_SLOT_LEASE', 60)
+        # Start at a random slot so requests don't all contend for the first ones.
+        start = random.randrange(limit)
+        for i in range(limit):
+            key = f'overload:{scope}:{(start + i) % limit}'
+            if cache.add(key, 1, lease):
+                return key
+        return None
+
+    def release(self, key):
+        caches[self.cache_alias].delete(key)
+
+
+limiter = ConcurrencyLimiter()
+
+
+class LoadControlMixin:
+    """
+    For API views: applies the statement timeout and concurrency limit of
+    the view's `load_scope`. Only the actions in `expensive_actions` (all of
+    them when None) take a concurrency slot.
+    """
+    load_scope = None
+    expensive_actions = None
+
+    def get_statement_timeout(self):
+        """
+        Milliseconds, or None for no timeout.
+        """
+        seconds = getattr(settings, 'STATEMENT_TIMEOUTS', {}).get(self.load_scope)
+        return None if seconds is None else int(seconds * 1000)
+
+    def is_expensive(self, request):
+        action = getattr(self, 'action', None)
+        return self.expensive_actions is None or action in self.expensive_actions
+
+    def initial(self, request, *args, **kwargs):
+        # After authentication and throttling, so throttled clients never hold a slot.
+        super().initial(request, *args, **kwargs)
+        limit = getattr(settings, 'MAX_CONCURRENT_REQUESTS', {}).get(self.load_scope)
+        if limit is not None and self.is_expensive(request):
+            self.load_slot = limiter.acquire(self.load_scope, limit)
+            if self.load_slot is None:
+                registry.inc('ktm_shed_requests_total', (('scope', self.load_scope), ('reason', 'concurrency')))
+                raise Overloaded(retry_after())
+
+    def dispatch(self, request, *args, **kwargs):
+        self.load_slot = None
+        try:
+            timeout = self.get_statement_timeout()
+            # Only reads: wrapping a write would tie its commit, on_commit
+            # hooks and signal side effects to the whole view.
+            if timeout is None or connection.vendor != 'postgresql' or request.method not in SAFE_METHODS:
+                return super().dispatch(request, *args, **kwargs)
+            try:
+                with transaction.atomic():
+                    with connection.cursor() as cursor:
+                        # set_config(..., true) is SET LOCAL that accepts a parameter.
+                        cursor.execute("SELECT set_config('statement_timeout', %s, true)", [str(timeout)])
+                    return super().dispatch(request, *args, **kwargs)
+            except OperationalError as exc:
+                # Handled out here, once the aborted transaction has been rolled back.
+                if not is_statement_timeout(exc):
+                    raise
+                registry.inc('ktm_shed_requests_total', (('scope', self.load_scope), ('reason', 'statement_timeout')))
+                response = self.handle_exception(Overloaded(retry_after()))
+                return self.finalize_response(self.request, response, *args, **kwargs)
+        finally:
+            if self.load_slot is not None:
+                limiter.release(self.load_slot)
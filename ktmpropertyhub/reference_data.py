@@ -0,0 +1,94 @@
+"""
+In-process copy of the small, rarely changing tables listings refer to:
+states, districts and facilities.
+
+Validating a listing payload used to resolve every referenced id with its
+own query, one per facility. These tables have a few dozen rows each, so
+every process keeps all of them in memory and validation looks ids up in a
+dict. Ids missing from the copy (e.g. a facility just added by another
+process) are fetched with one query per table, so validation never costs
+more than three queries however many facilities a listing has.
+
+Writes to the tables replace a version token in the shared cache (see the
+signals in signals.py), and each process reloads its copy when the token
+changes or the copy is older than `REFERENCE_DATA_MAX_AGE` seconds. The
+instances handed out are shared between requests and must not be modified.
+"""
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import District, Facility, State
+
+MODELS = (State, District, Facility)
+VERSION_KEY = 'reference_data:version'
+
+
+def current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate():
+    """
+    Make every process reload its copy on its next lookup.
+    """
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+class Tables:
+    def __init__(self, version):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.rows = {model: {obj.pk: obj for obj in model.objects.all()} for model in (State, Facility)}
+        states = self.rows[State]
+        districts = {}
+        for district in District.objects.all():
+            if district.state_id in states:
+                # Spares a query whenever the district is printed.
+                district.state = states[district.state_id]
+            districts[district.pk] = district
+        self.rows[District] = districts
+
+
+_tables = None
+_tables_lock = threading.Lock()
+
+
+def get_tables():
+    global _tables
+    version = current_version()
+    max_age = getattr(settings, 'REFERENCE_DATA_MAX_AGE', 10 * 60)
+    with _tables_lock:
+        if _tables is None or _tables.version != version or time.monotonic() - _tables.built_at > max_age:
+            _tables = Tables(version)
+        return _tables
+
+
+def resolve(model, pks):
+    """
+    {pk: instance} for those of `pks` that exist.
+    """
+    tables = get_tables()
+    rows = tables.rows[model]
+    found = {pk: rows[pk] for pk in pks if pk in rows}
+    missing = set(pks) - set(found)
+    if missing:
+        fetched = model.objects.in_bulk(missing)
+        with _tables_lock:
+            rows.update(fetched)
+        found.update(fetched)
+    return found
+
+
+def get(model, pk):
+    """
+    The instance with this pk, or None.
+    """
+    return resolve(model, [pk]).get(pk)
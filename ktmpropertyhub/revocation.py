@@ -0,0 +1,146 @@
+"""
+Bloom filter in front of simplejwt's refresh token blacklist.
+
+With `BLACKLIST_AFTER_ROTATION`, every refresh checks the `BlacklistedToken`
+table for the incoming token's jti. Almost all of those lookups find nothing.
+Each process keeps a Bloom filter of the blacklisted jtis; when the filter
+says "definitely not blacklisted" the table lookup is skipped, and only
+possible hits (real ones, plus ~1% false positives) go to the database.
+
+A Bloom filter must never miss a revoked token, so every process has to see
+every new blacklist entry. Blacklisting changes a version token in the shared
+cache once the transaction commits; before trusting its filter a process
+compares that version with its own and, if it changed, loads the entries
+blacklisted since its last sync (with some overlap, since rows don't commit
+in id order). With a per-process cache (LocMem/Dummy) there is no way to hear
+about other processes' revocations, so the filter is bypassed and every check
+goes to the database.
+"""
+import datetime
+import hashlib
+import math
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+VERSION_CACHE_KEY = 'auth:blacklist:version'
+
+# Rows are loaded from (last sync - SYNC_OVERLAP) so that a transaction which
+# started before the last sync but committed after it isn't missed.
+SYNC_OVERLAP = datetime.timedelta(minutes=5)
+
+
+class BloomFilter:
+    """
+    A fixed-size Bloom filter over strings, sized for `capacity` entries at
+    the given false positive rate.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing: k positions from two 64-bit halves of one digest.
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class BlacklistFilter:
+    """
+    The process-wide filter plus its sync state.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.version = None
+        self.synced_at = None
+
+    def _rebuild(self, now):
+        capacity = getattr(settings, 'TOKEN_BLACKLIST_BLOOM_CAPACITY', 200_000)
+        live = BlacklistedToken.objects.filter(token__expires_at__gt=now)
+        bloom = BloomFilter(max(capacity, live.count() * 2))
+        for jti in live.values_list('token__jti', flat=True).iterator(chunk_size=5000):
+            bloom.add(jti)
+        self.bloom = bloom
+
+    def _sync(self):
+        now = timezone.now()
+        version = cache.get(VERSION_CACHE_KEY, 0)
+        if self.bloom is None or self.bloom.count > self.bloom.capacity:
+            self._rebuild(now)
+        elif version != self.version:
+            recent = BlacklistedToken.objects.filter(blacklisted_at__gte=self.synced_at - SYNC_OVERLAP)
+            for jti in recent.values_list('token__jti', flat=True):
+                self.bloom.add(jti)
+        else:
+            return
+        self.version = version
+        self.synced_at = now
+
+    def might_contain(self, jti):
+        if not cache_is_shared():
+            return True
+        with self.lock:
+            self._sync()
+            return jti in self.bloom
+
+    def add(self, jti):
+        with self.lock:
+            if self.bloom is not None:
+                self.bloom.add(jti)
+
+
+blacklist_filter = BlacklistFilter()
+
+
+def cache_is_shared():
+    return not isinstance(cache, (LocMemCache, DummyCache))
+
+
+def token_blacklisted(jti):
+    """
+    Record a new blacklist entry in this process's filter.
+    """
+    blacklist_filter.add(jti)
+
+
+def bump_version():
+    """
+    Tell the other processes to sync. The version is a fresh random value
+    rather than a counter, so that an evicted key (which reads as 0) or two
+    concurrent bumps can never make a changed version look unchanged.
+    """
+    cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+
+class BloomCheckedRefreshToken(RefreshToken):
+    """
+    A refresh token whose blacklist check consults the Bloom filter first.
+    """
+
+    def check_blacklist(self):
+        if blacklist_filter.might_contain(self.payload[jwt_settings.JTI_CLAIM]):
+            super().check_blacklist()
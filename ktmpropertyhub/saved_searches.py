@@ -0,0 +1,194 @@
+"""
+In-memory inverted index over saved search criteria.
+
+When a listing is created we must find the saved searches it satisfies.
+Running every saved query against the new row does not scale, so instead each
+search is filed under the tuple of its exact-match criteria (purpose, type,
+state, district), with `None` standing for "any". A listing can only match
+searches filed under one of the 2**4 keys built by taking, for each
+criterion, either the listing's value or `None` - so matching is at most 16
+dict lookups plus a bounds check on the range criteria (area and price) of
+the searches found there, regardless of how many searches are saved.
+"""
+import itertools
+import threading
+
+from django.core.cache import cache
+
+from .models import SavedSearch, SavedSearchMatch
+
+# Bumped in the shared cache whenever a saved search changes, so that every
+# worker process knows its copy of the index is out of date.
+INDEX_VERSION_CACHE_KEY = 'ktmpropertyhub:saved_search_index:version'
+
+# (SavedSearch field, PropertyListing attribute) pairs for exact-match criteria.
+EQUALITY_CRITERIA = (
+    ('listing_purpose', 'listing_purpose'),
+    ('property_type', 'property_type'),
+    ('state_id', 'state_id'),
+    ('district_id', 'district_id'),
+)
+
+# (SavedSearch min field, SavedSearch max field, PropertyListing attribute).
+RANGE_CRITERIA = (
+    ('min_sqft', 'max_sqft', 'total_land_area_sqft'),
+    ('min_price', 'max_price', 'price'),
+)
+
+INDEX_FIELDS = ['id'] + [f for f, _ in EQUALITY_CRITERIA] + [f for lo, hi, _ in RANGE_CRITERIA for f in (lo, hi)]
+LISTING_FIELDS = [attr for _, attr in EQUALITY_CRITERIA] + [attr for _, _, attr in RANGE_CRITERIA]
+
+
+class SavedSearchIndex:
+    """
+    The index itself. Searches are added and removed as plain dicts (or
+    anything with the `INDEX_FIELDS` attributes) so the same class can be fed
+    from the database or from synthetic data in the benchmark.
+    """
+
+    def __init__(self):
+        # criteria key -> {search id: range bounds, or None if unbounded}
+        self.buckets = {}
+        self.keys = {}  # search id -> the key it is filed under
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, search):
+        search = _as_dict(search)
+        search_id = search['id']
+        self.remove(search_id)
+
+        key = tuple(search[field] or None for field, _ in EQUALITY_CRITERIA)
+        bounds = tuple((search[low], search[high]) for low, high, _ in RANGE_CRITERIA)
+        if all(low is None and high is None for low, high in bounds):
+            bounds = None
+        self.buckets.setdefault(key, {})[search_id] = bounds
+        self.keys[search_id] = key
+
+    def remove(self, search_id):
+        key = self.keys.pop(search_id, None)
+        if key is None:
+            return
+        bucket = self.buckets[key]
+        del bucket[search_id]
+        if not bucket:
+            del self.buckets[key]
+
+    def candidates(self, listing):
+        """
+        Return the ids of the saved searches that `listing` satisfies.
+        """
+        listing = _as_dict(listing, LISTING_FIELDS)
+        options = [
+            (listing[attr], None) if listing[attr] is not None else (None,)
+            for _, attr in EQUALITY_CRITERIA
+        ]
+        values = tuple(listing[attr] for _, _, attr in RANGE_CRITERIA)
+
+        result = set()
+        for key in itertools.product(*options):
+            bucket = self.buckets.get(key)
+            if bucket:
+                result.update(i for i, bounds in bucket.items() if bounds is None or within(values, bounds))
+        return result
+
+
+def within(values, bounds):
+    """
+    Whether each of `values` lies in the matching (low, high) pair of
+    `bounds`, where None means unbounded. A missing value fails any bound.
+    """
+    for value, (low, high) in zip(values, bounds):
+        if low is None and high is None:
+            continue
+        if value is None:
+            return False
+        if low is not None and value < low:
+            return False
+        if high is not None and value > high:
+            return False
+    return True
+
+
+def _as_dict(obj, fields=INDEX_FIELDS):
+    if isinstance(obj, dict):
+        return obj
+    return {field: getattr(obj, field) for field in fields}
+
+
+# --- Process-wide index ---
+# Built lazily from the database on first use and kept up to date by the
+# SavedSearch signal handlers, once each change has committed. A version number in the shared cache lets other
+# processes notice changes they did not see and rebuild.
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index, _index_version
+    version = cache.get(INDEX_VERSION_CACHE_KEY, 0)
+    with _index_lock:
+        if _index is None or _index_version != version:
+            index = SavedSearchIndex()
+            for search in SavedSearch.objects.filter(is_active=True).values(*INDEX_FIELDS).iterator(chunk_size=2000):
+                index.add(search)
+            _index, _index_version = index, version
+        return _index
+
+
+def _bump_version():
+    global _index_version
+    try:
+        version = cache.incr(INDEX_VERSION_CACHE_KEY)
+    except ValueError:
+        version = 1
+        cache.set(INDEX_VERSION_CACHE_KEY, version, None)
+    # Our own copy is already up to date, so don't rebuild it.
+    if _index_version is not None and _index_version + 1 == version:
+        _index_version = version
+
+
+def index_entry(search):
+    """
+    The fields of `search` the index keeps, as a dict.
+    """
+    return _as_dict(search)
+
+
+def saved_search_changed(search, is_active):
+    """
+    `search` is an `index_entry()`. Call once the change is committed.
+    """
+    with _index_lock:
+        if _index is not None:
+            if is_active:
+                _index.add(search)
+            else:
+                _index.remove(search['id'])
+        _bump_version()
+
+
+def saved_search_deleted(search_id):
+    with _index_lock:
+        if _index is not None:
+            _index.remove(search_id)
+        _bump_version()
+
+
+def record_matches(listings, index=None):
+    """
+    Match listings against the saved searches and store a SavedSearchMatch
+    for every pair. Returns the number of matches found.
+    """
+    if index is None:
+        index = get_index()
+    matches = [
+        SavedSearchMatch(saved_search_id=search_id, property_listing_id=listing.pk)
+        for listing in listings
+        for search_id in index.candidates(listing)
+    ]
+    SavedSearchMatch.objects.bulk_create(matches, batch_size=1000, ignore_conflicts=True)
+    return len(matches)
@@ -1,17 +1,23 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
-from .models import PropertyListing, Facility, PropertyImage, State, District
+from rest_framework.relations import MANY_RELATION_KWARGS
+from dj_rest_auth.jwt_auth import CookieTokenRefreshSerializer
+from .models import PropertyListing, Facility, PropertyImage, State, District, SavedSearch, ArchivedListing, ArchivedListingImage
+from . import reference_data
+from .instrumentation import TimedSerializerMixin
+from .revocation import BloomCheckedRefreshToken
 
-class StateSerializer(serializers.ModelSerializer):
+class StateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = State
         fields = ['id', 'name']
 
-class DistrictSerializer(serializers.ModelSerializer):
+class DistrictSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = District
         fields = ['id', 'name']
 
-class FacilitySerializer(serializers.ModelSerializer):
+class FacilitySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the Facility model.
     """
@@ -19,7 +25,7 @@ class FacilitySerializer(serializers.ModelSerializer):
         model = Facility
         fields = ['id', 'name']
 
-class PropertyImageSerializer(serializers.ModelSerializer):
+class PropertyImageSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the PropertyImage model.
     """
@@ -28,7 +34,7 @@ class PropertyImageSerializer(serializers.ModelSerializer):
         # The 'image' field from CloudinaryField automatically provides the URL
         fields = ['id', 'image', 'caption', 'is_thumbnail']
 
-class PropertyListingSerializer(serializers.ModelSerializer):
+class PropertyListingSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user = serializers.StringRelatedField(read_only=True)
     facilities = FacilitySerializer(many=True, read_only=True)
     images = PropertyImageSerializer(many=True, read_only=True)
@@ -58,9 +64,71 @@ class PropertyListingSerializer(serializers.ModelSerializer):
             'facilities', 'images', 'state', 'district', 'state_id', 'district_id',
             'ropani', 'aana', 'paisa', 'dam',
             'bigha', 'katha', 'dhur', 'total_land_area_sqft',
+            'monthly_rent', 'price_per_sqft',
         ]
 
-class PropertyListingCreateSerializer(serializers.ModelSerializer):
+def card_images_prefetch():
+    """
+    Prefetch of one image per listing, into `card_images`: the thumbnail,
+    or the first image if there is none.
+    """
+    queryset = PropertyImage.objects.order_by('-is_thumbnail', 'id')[:1]
+    return Prefetch('images', queryset=queryset, to_attr='card_images')
+
+class PropertyListingCardSerializer(PropertyListingSerializer):
+    """
+    A listing as shown in lists: `images` holds only the card image (see
+    `card_images_prefetch`); the full gallery is at /api/properties/<id>/images/.
+    """
+    images = PropertyImageSerializer(source='card_images', many=True, read_only=True)
+
+class ReferencePrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Resolves ids of State, District or Facility from the in-process copy in
+    reference_data.py instead of one query per id.
+    """
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return ReferenceManyRelatedField(**list_kwargs)
+
+    def to_pk(self, data):
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        try:
+            if isinstance(data, bool):
+                raise TypeError
+            return self.get_queryset().model._meta.pk.get_prep_value(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+    def to_internal_values(self, data):
+        """
+        Resolve a list of ids with at most one query.
+        """
+        pks = [self.to_pk(item) for item in data]
+        found = reference_data.resolve(self.get_queryset().model, pks)
+        for item, pk in zip(data, pks):
+            if pk not in found:
+                self.fail('does_not_exist', pk_value=item)
+        return [found[pk] for pk in pks]
+
+    def to_internal_value(self, data):
+        return self.to_internal_values([data])[0]
+
+class ReferenceManyRelatedField(serializers.ManyRelatedField):
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        return self.child_relation.to_internal_values(list(data))
+
+class PropertyListingCreateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     A dedicated serializer for CREATING new PropertyListing instances.
     It's designed to accept IDs for foreign keys and perform validation.
@@ -70,11 +138,17 @@ class PropertyListingCreateSerializer(serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)
 
     # We expect the frontend to send a list of IDs for the facilities.
-    facilities = serializers.PrimaryKeyRelatedField(
+    facilities = ReferencePrimaryKeyRelatedField(
         queryset=Facility.objects.all(), 
         many=True, 
         required=False
     )
+    state = ReferencePrimaryKeyRelatedField(queryset=State.objects.all(), required=False, allow_null=True)
+    district = ReferencePrimaryKeyRelatedField(queryset=District.objects.all(), required=False, allow_null=True)
+
+    # Flagged, not rejected: the id of an existing listing this one looks
+    # like a repost of (see duplicates.py), or null.
+    possible_duplicate_of = serializers.IntegerField(source='signature.duplicate_of_id', read_only=True, allow_null=True)
     
     class Meta:
         model = PropertyListing
@@ -95,8 +169,30 @@ class PropertyListingCreateSerializer(serializers.ModelSerializer):
             'has_laundry', 'has_store', 'has_puja_room', 'furnishing', 
             'parking_car_min', 'parking_car', 'parking_bike_min', 'parking_bike', 
             'rent_available_duration', 'rent_available_duration_unit',
-            'rent_amount', 'frequency', 'facilities', 'images', 'total_land_area_sqft'
+            'rent_amount', 'frequency', 'facilities', 'images', 'total_land_area_sqft',
+            'possible_duplicate_of',
         ]
+        # Images are uploaded separately, so a listing can be created without any.
+        # The land area is always calculated from the units (see PropertyListing.save).
+        extra_kwargs = {'images': {'required': False}, 'total_land_area_sqft': {'read_only': True}}
+
+    def validate(self, attrs):
+        """
+        The district must belong to the state. On a partial update, the side
+        that isn't sent is taken from the listing.
+        """
+        if 'state' in attrs:
+            state_id = attrs['state'].pk if attrs['state'] else None
+        else:
+            state_id = getattr(self.instance, 'state_id', None)
+        if 'district' in attrs:
+            district = attrs['district']
+        else:
+            district_id = getattr(self.instance, 'district_id', None)
+            district = reference_data.get(District, district_id) if district_id is not None else None
+        if state_id is not None and district is not None and district.state_id != state_id:
+            raise serializers.ValidationError({'district': ["This district is not in the selected state."]})
+        return attrs
 
     def create(self, validated_data):
         """
@@ -104,4 +200,54 @@ class PropertyListingCreateSerializer(serializers.ModelSerializer):
         """
         # We get the user from the context that we will pass in from the view
         validated_data['user'] = self.context['request'].user
-        return super().create(validated_data)
\ No newline at end of file
+        return super().create(validated_data)
+
+class ArchivedListingImageSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedListingImage
+        fields = ['id', 'image', 'caption', 'is_thumbnail']
+
+class ArchivedListingSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    Read-only view of an archived listing. `data` holds the listing's fields
+    as they were when it was archived.
+    """
+    images = ArchivedListingImageSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = ArchivedListing
+        fields = [
+            'id', 'user', 'title', 'created_at', 'archived_at', 'reason',
+            'data', 'facility_ids', 'view_count', 'contact_count', 'images',
+        ]
+        read_only_fields = fields
+
+class SavedSearchSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    Serializer for a user's saved search. The criteria fields mirror the
+    query parameters accepted by `PropertyFilter`.
+    """
+    class Meta:
+        model = SavedSearch
+        fields = [
+            'id', 'name', 'created_at', 'is_active',
+            'listing_purpose', 'property_type', 'state', 'district',
+            'min_sqft', 'max_sqft', 'min_price', 'max_price',
+        ]
+        read_only_fields = ['created_at']
+
+    def validate(self, attrs):
+        for low, high in (('min_sqft', 'max_sqft'), ('min_price', 'max_price')):
+            low_value = attrs.get(low, getattr(self.instance, low, None))
+            high_value = attrs.get(high, getattr(self.instance, high, None))
+            if low_value is not None and high_value is not None and low_value > high_value:
+                raise serializers.ValidationError({low: f"{low} cannot be greater than {high}."})
+        return attrs
+
+
+class TokenRefreshSerializer(CookieTokenRefreshSerializer):
+    """
+    dj_rest_auth's refresh serializer, checking the blacklist through the
+    Bloom filter so most refreshes skip the table lookup.
+    """
+    token_class = BloomCheckedRefreshToken
@@ -28,6 +28,11 @@ DEBUG = True
 # This is required by dj-rest-auth
 SITE_ID = 1
 
+# Vercel sets VERCEL=1. Its functions are frozen between requests and
+# recycled at will, so nothing may be left in memory or to a background
+# thread once a response is sent.
+SERVERLESS = config('SERVERLESS', default=bool(os.environ.get('VERCEL')), cast=bool)
+
 ALLOWED_HOSTS = [
     'www.ktmpropertyhub.com',
     '.vercel.app',
@@ -67,6 +72,7 @@ INSTALLED_APPS = [
     'allauth.socialaccount', # Optional, but good to have for future social login
     'dj_rest_auth',
     'dj_rest_auth.registration',
+    'rest_framework_simplejwt.token_blacklist', # Makes ROTATE/BLACKLIST_AFTER_ROTATION actually revoke tokens
 ]
 
 
@@ -124,9 +130,14 @@ ACCOUNT_PREVENT_ENUMERATION = True
 # DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='webmaster@localhost')
 
 MIDDLEWARE = [
+    # Keep this first so its timings cover every other middleware.
+    'ktmpropertyhub.instrumentation.RequestTimingMiddleware',
+    # Before anything that reads or changes the response body.
+    'ktmpropertyhub.compression.CompressionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'ktmpropertyhub.snapshots.SnapshotMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -136,13 +147,95 @@ MIDDLEWARE = [
     "allauth.account.middleware.AccountMiddleware",
 ]
 
+# --- PERFORMANCE INSTRUMENTATION ---
+# Per-request timings (total, SQL, serializer, renderer), exported at /api/metrics/.
+INSTRUMENTATION_ENABLED = True
+# Send the timings to clients in a `Server-Timing` response header.
+INSTRUMENTATION_SERVER_TIMING = True
+
+# --- RESPONSE COMPRESSION ---
+# API responses of at least COMPRESSION_MIN_SIZE bytes are sent gzip- or
+# brotli-compressed (brotli needs the optional `brotli` package).
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_PATH_PREFIXES = ('/api/',)
+# Never compress responses carrying tokens (BREACH).
+COMPRESSION_EXCLUDE_PREFIXES = ('/api/auth/',)
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5
+
+# Most items accepted by one request to the bulk listing endpoints.
+BULK_LISTINGS_MAX_ITEMS = 500
+
+# Listing view/contact counters are buffered in memory and written in batches
+# (see ktmpropertyhub/counters.py) every this many seconds, or sooner once
+# this many listings have pending counts. Serverless functions write them
+# before responding, since their memory doesn't outlive the request.
+LISTING_COUNTERS_FLUSH_INTERVAL = 0 if SERVERLESS else 30
+LISTING_COUNTERS_MAX_PENDING = 1000
+
 REST_FRAMEWORK = {
     # --- AUTHENTICATION CONFIGURATION ---
+    # Resolves users from the cache instead of loading them on every request.
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'ktmpropertyhub.authentication.CachedJWTAuthentication',
+    ),
+
+    # --- RENDERING ---
+    # orjson-backed JSON (see ktmpropertyhub/renderers.py); falls back to the
+    # stdlib encoder if orjson isn't installed.
+    'DEFAULT_RENDERER_CLASSES': (
+        'ktmpropertyhub.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'ktmpropertyhub.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ),
+
+    # --- THROTTLING CONFIGURATION ---
+    # Token buckets kept in the shared cache (see ktmpropertyhub/throttling.py).
+    # "N/period" means a burst of up to N requests, refilled at N per period.
+    # Per-endpoint limits: add '<scope>.<view throttle_scope>' entries,
+    # e.g. 'anon_read.properties': '300/min'.
+    'DEFAULT_THROTTLE_CLASSES': (
+        'ktmpropertyhub.throttling.AnonReadThrottle',
+        'ktmpropertyhub.throttling.UserWriteThrottle',
+        'ktmpropertyhub.throttling.AuthEndpointThrottle',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'anon_read': config('THROTTLE_ANON_READ', default='120/min'),
+        # The location typeahead is called on every keystroke.
+        'anon_read.locations': config('THROTTLE_ANON_LOCATIONS', default='600/min'),
+        'user_write': config('THROTTLE_USER_WRITE', default='60/min'),
+        'auth': config('THROTTLE_AUTH', default='10/min'),
+        # Contact requests count towards a listing's stats, signed in or not.
+        'contact': config('THROTTLE_CONTACT', default='10/min'),
+    },
+    # Vercel puts exactly one proxy in front of us; trust only the address it adds.
+    'NUM_PROXIES': config('NUM_PROXIES', default=1, cast=int),
 }
 
+# --- CACHE CONFIGURATION ---
+# Throttle buckets and other shared state need a cache that every instance
+# sees. Set REDIS_URL in production; without it each process has its own
+# in-memory cache, which is only suitable for development.
+REDIS_URL = config('REDIS_URL', default='')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # --- DJ-REST-AUTH AND SIMPLE-JWT CONFIGURATION ---
 
 # We will use JWT for authentication
@@ -174,6 +267,14 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
 }
 
+# Size of the per-process Bloom filter in front of the refresh token blacklist
+# (see ktmpropertyhub/revocation.py). It grows if more tokens are blacklisted.
+TOKEN_BLACKLIST_BLOOM_CAPACITY = 200_000
+
+# How long (seconds) an authenticated user may be served from the cache.
+# Saving or deleting the user orphans its entries at once.
+AUTH_USER_CACHE_TIMEOUT = 60
+
 ROOT_URLCONF = 'ktmpropertyhub.urls'
 
 TEMPLATES = [
@@ -195,16 +296,28 @@ WSGI_APPLICATION = 'ktmpropertyhub.wsgi.application'
 
 
 # Database
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': config('DB_NAME'),
-        'USER': config('DB_USER'),
-        'PASSWORD': config('DB_PASSWORD'),
-        'HOST': config('DB_HOST'),
-        'PORT': config('DB_PORT', cast=int),
+# Postgres by default. Set DB_ENGINE=django.db.backends.sqlite3 (and DB_NAME to
+# a file path) to run locally without a server, e.g. for the benchmark suite.
+DB_ENGINE = config('DB_ENGINE', default='django.db.backends.postgresql')
+
+if DB_ENGINE == 'django.db.backends.sqlite3':
+    DATABASES = {
+        'default': {
+            'ENGINE': DB_ENGINE,
+            'NAME': config('DB_NAME', default=os.path.join(BASE_DIR, 'db.sqlite3')),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': DB_ENGINE,
+            'NAME': config('DB_NAME'),
+            'USER': config('DB_USER'),
+            'PASSWORD': config('DB_PASSWORD'),
+            'HOST': config('DB_HOST'),
+            'PORT': config('DB_PORT', cast=int),
+        }
     }
-}
 
 
 # Password validation
@@ -248,6 +361,121 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles_build')  # Use this for Vercel
  
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
+# --- SIMILAR LISTINGS CONFIGURATION ---
+# Where `manage.py build_similarity_matrix` writes the precomputed feature
+# matrix, and how old (in seconds) the in-memory copy may get before it is rebuilt.
+SIMILAR_LISTINGS_MATRIX_PATH = os.path.join(BASE_DIR, 'similarity_matrix.npz')
+SIMILAR_LISTINGS_MAX_AGE = 60 * 60
+
+# How old (in seconds) the in-memory location typeahead index may get before
+# it is rebuilt, picking up listings changed by other processes.
+LOCATION_INDEX_MAX_AGE = 10 * 60
+
+# How old (in seconds) a process's copy of the states, districts and
+# facilities used to validate listings may get (see reference_data.py). Writes
+# to those tables refresh every process's copy sooner.
+REFERENCE_DATA_MAX_AGE = 10 * 60
+
+# Estimated text similarity (0-1) at which a new or edited listing is flagged
+# as a likely repost of an existing one.
+DUPLICATE_LISTING_THRESHOLD = 0.8
+
+# How many of the 64 bits of two images' perceptual hashes may differ for an
+# upload to reuse the stored image instead (see image_dedup.py). Up to 3 is
+# always found; larger values may miss some near copies.
+IMAGE_DUPLICATE_MAX_DISTANCE = 3
+
+# When `manage.py archive_listings` moves listings out of the live table:
+# inactive ones not updated for this many days, and active ones not updated,
+# viewed or contacted for this many.
+LISTING_ARCHIVE_INACTIVE_AFTER_DAYS = 30
+LISTING_ARCHIVE_MAX_AGE_DAYS = 365
+
+# The /api/properties/changes/ feed: how long change log entries are kept
+# (clients whose cursor is older must download the listings again), and how
+# many seconds new entries are held back so concurrent commits can't be
+# skipped by a cursor.
+LISTING_CHANGES_RETENTION_DAYS = 30
+LISTING_CHANGES_LAG_SECONDS = 2
+
+# --- LISTING SNAPSHOTS ---
+# `manage.py build_snapshots` writes prebuilt, precompressed JSON of the most
+# requested listing lists here, served at LISTING_SNAPSHOT_URL. Its private
+# bookkeeping goes to LISTING_SNAPSHOT_STATE_PATH. Anonymous list requests are
+# only redirected to snapshots built within LISTING_SNAPSHOT_MAX_AGE seconds,
+# so run the builder more often than that (e.g. every minute from cron).
+LISTING_SNAPSHOT_ROOT = os.path.join(BASE_DIR, 'snapshots')
+LISTING_SNAPSHOT_URL = '/snapshots/'
+LISTING_SNAPSHOT_STATE_PATH = os.path.join(BASE_DIR, 'snapshots_state.json')
+LISTING_SNAPSHOT_MAX_AGE = 5 * 60
+
+# --- BACKGROUND JOBS ---
+# The database-backed queue run by `manage.py run_workers` (see jobs.py).
+# Failed jobs are retried after JOB_RETRY_BASE_DELAY seconds, doubling up to
+# JOB_RETRY_MAX_DELAY; a job running longer than JOB_LOCK_TIMEOUT seconds is
+# assumed orphaned and requeued, and finished jobs are deleted after
+# JOB_RETENTION_DAYS.
+# JOB_WORKERS says whether run_workers processes are running. Without them
+# (the default on serverless hosts), follow-up work such as Cloudinary
+# deletions and CDN purges runs in the request once it commits; only jobs
+# that fail are queued, for a scheduled `run_workers --drain` to retry.
+# Admin image uploads are only handed to a worker when JOB_SPOOL_DIR is set to
+# a directory the web and worker processes share. Leave it empty where the
+# filesystem is read-only or no worker runs (e.g. on Vercel): images are then
+# uploaded to Cloudinary during the request.
+JOB_WORKERS = config('JOB_WORKERS', default=not SERVERLESS, cast=bool)
+JOB_RETRY_BASE_DELAY = 10
+JOB_RETRY_MAX_DELAY = 60 * 60
+JOB_LOCK_TIMEOUT = 15 * 60
+JOB_RETENTION_DAYS = 7
+JOB_SPOOL_DIR = config('JOB_SPOOL_DIR', default='')
+
+# --- OVERLOAD PROTECTION ---
+# Per view `load_scope` (see ktmpropertyhub/overload.py): Postgres cancels any
+# query running longer than STATEMENT_TIMEOUTS seconds, and only
+# MAX_CONCURRENT_REQUESTS expensive requests run at once. Either way the client
+# gets a 503 and is told to retry after OVERLOAD_RETRY_AFTER to twice that
+# many seconds. Keep the timeouts well below the function time limit.
+STATEMENT_TIMEOUTS = {
+    'properties': config('STATEMENT_TIMEOUT_PROPERTIES', default=5, cast=float),
+    'saved_searches': config('STATEMENT_TIMEOUT_SAVED_SEARCHES', default=5, cast=float),
+    'analytics': config('STATEMENT_TIMEOUT_ANALYTICS', default=3, cast=float),
+}
+MAX_CONCURRENT_REQUESTS = {
+    'properties': config('MAX_CONCURRENT_PROPERTIES', default=32, cast=int),
+    'saved_searches': config('MAX_CONCURRENT_SAVED_SEARCHES', default=8, cast=int),
+    'analytics': config('MAX_CONCURRENT_ANALYTICS', default=8, cast=int),
+}
+OVERLOAD_RETRY_AFTER = 5
+# Seconds after which a concurrency slot is freed even if never released.
+OVERLOAD_SLOT_LEASE = 60
+
+# --- EDGE CACHING ---
+# Cache-Control for anonymous GET responses, per view `edge_cache_policy`
+# (see ktmpropertyhub/edge_cache.py), in seconds: max_age for browsers,
+# s_maxage for the CDN, and how long the CDN may keep serving a stale copy
+# while it refetches. Responses are tagged with Surrogate-Key/Cache-Tag
+# headers; set EDGE_CACHE_PURGE_CLIENT (e.g.
+# 'ktmpropertyhub.edge_cache.FastlyPurgeClient') to purge the affected keys
+# when listings, states or districts change. Without it cached responses just
+# expire, so keep s_maxage short.
+EDGE_CACHE_POLICIES = {
+    'listings': {'max_age': 0, 's_maxage': 60, 'stale_while_revalidate': 300},
+    'reference': {'max_age': 60 * 60, 's_maxage': 24 * 60 * 60, 'stale_while_revalidate': 24 * 60 * 60},
+    'locations': {'max_age': 60, 's_maxage': 5 * 60, 'stale_while_revalidate': 10 * 60},
+    'analytics': {'max_age': 0, 's_maxage': 5 * 60, 'stale_while_revalidate': 10 * 60},
+}
+EDGE_CACHE_PURGE = {
+    'CLIENT': config('EDGE_CACHE_PURGE_CLIENT', default=''),
+    'OPTIONS': {
+        # FastlyPurgeClient
+        'SERVICE_ID': config('FASTLY_SERVICE_ID', default=''),
+        # CloudflarePurgeClient
+        'ZONE_ID': config('CLOUDFLARE_ZONE_ID', default=''),
+        'API_TOKEN': config('EDGE_CACHE_PURGE_API_TOKEN', default=''),
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
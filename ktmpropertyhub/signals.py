@@ -0,0 +1,289 @@
+"""
+Model signal handlers that keep derived data (indexes, alerts, caches) in
+sync with listings and the tables they depend on.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import ArchivedListingImage, District, Facility, PropertyImage, PropertyListing, SavedSearch, State
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from . import analytics, changes, duplicates, edge_cache, facility_bits, jobs, locations, reference_data, revocation, saved_searches, similarity, tasks
+from .authentication import invalidate_cached_user
+
+
+# --- Cached users for JWT authentication ---
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def drop_cached_user(sender, instance, **kwargs):
+    """
+    Covers profile edits, password changes and deactivation. Dropped again
+    on commit so a request that read the old row mid-transaction can't leave
+    it cached.
+    """
+    user_id = instance.pk
+    invalidate_cached_user(user_id)
+    transaction.on_commit(lambda: invalidate_cached_user(user_id))
+
+
+# --- Cached reference tables ---
+
+@receiver(post_save, sender=State)
+@receiver(post_delete, sender=State)
+@receiver(post_save, sender=District)
+@receiver(post_delete, sender=District)
+@receiver(post_save, sender=Facility)
+@receiver(post_delete, sender=Facility)
+def reference_data_changed(sender, **kwargs):
+    # Again on commit, like the user cache above.
+    reference_data.invalidate()
+    transaction.on_commit(reference_data.invalidate)
+
+
+# --- Edge cache ---
+
+@receiver(post_save, sender=State)
+@receiver(post_delete, sender=State)
+def purge_state(sender, instance, raw=False, **kwargs):
+    if not raw:
+        # Lists not filtered by location carry every state's key (see
+        # edge_cache.list_keys), so they must be tagged again.
+        edge_cache.purge(['states', 'listings', f'state-{instance.pk}'])
+
+
+@receiver(post_save, sender=District)
+@receiver(post_delete, sender=District)
+def purge_district(sender, instance, raw=False, **kwargs):
+    if not raw:
+        edge_cache.purge(['districts', f'district-{instance.pk}'])
+
+
+# --- Refresh token blacklist ---
+
+@receiver(post_save, sender=BlacklistedToken)
+def refresh_token_blacklisted(sender, instance, created, raw=False, **kwargs):
+    if raw or not created:
+        return
+    revocation.token_blacklisted(instance.token.jti)
+    transaction.on_commit(revocation.bump_version)
+
+
+# --- Saved searches ---
+
+@receiver(post_save, sender=SavedSearch)
+def saved_search_saved(sender, instance, **kwargs):
+    """
+    Update the index on commit, so other processes aren't told to rebuild
+    before they can read the change, nor at all for a rolled-back save.
+    """
+    search, is_active = saved_searches.index_entry(instance), instance.is_active
+    transaction.on_commit(lambda: saved_searches.saved_search_changed(search, is_active))
+
+
+@receiver(post_delete, sender=SavedSearch)
+def saved_search_deleted(sender, instance, **kwargs):
+    search_id = instance.pk
+    transaction.on_commit(lambda: saved_searches.saved_search_deleted(search_id))
+
+
+@receiver(post_save, sender=PropertyListing)
+def match_new_listing(sender, instance, created, raw=False, **kwargs):
+    """
+    Match a newly created listing against the saved searches once the
+    transaction that created it has committed.
+    """
+    if raw or not created or not instance.is_active:
+        return
+    transaction.on_commit(lambda: saved_searches.record_matches([instance]))
+
+
+# --- Similar listings feature matrix ---
+
+def _saves_any(update_fields, attnames):
+    """
+    Whether a save limited to `update_fields` (None for a full save) writes
+    any of the fields with the given attnames.
+    """
+    if update_fields is None:
+        return True
+    fields = {PropertyListing._meta.get_field(name).attname for name in update_fields}
+    return not fields.isdisjoint(attnames)
+
+
+@receiver(post_save, sender=PropertyListing)
+def update_similarity_row(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or not _saves_any(update_fields, similarity.FEATURE_FIELDS + ('is_active',)):
+        return
+    listing_id = instance.pk
+    transaction.on_commit(lambda: similarity.listing_changed(listing_id))
+
+
+@receiver(m2m_changed, sender=PropertyListing.facilities.through)
+def update_similarity_facilities(sender, instance, action, reverse, **kwargs):
+    if reverse or action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    listing_id = instance.pk
+    transaction.on_commit(lambda: similarity.listing_changed(listing_id))
+
+
+@receiver(post_delete, sender=PropertyListing)
+def remove_similarity_row(sender, instance, **kwargs):
+    similarity.listing_deleted(instance.pk)
+
+
+# --- Facility bitsets ---
+
+@receiver(post_save, sender=Facility)
+def assign_facility_bit(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        facility_bits.assign_bits()
+        instance.refresh_from_db(fields=['bit'])
+
+
+@receiver(post_delete, sender=Facility)
+def clear_facility_bit(sender, instance, **kwargs):
+    if instance.bit is not None:
+        facility_bits.clear_bit(instance.bit)
+
+
+@receiver(m2m_changed, sender=PropertyListing.facilities.through)
+def update_facility_bits(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # facility.propertylisting_set.clear() doesn't say which listings it
+        # touched, so remember them beforehand.
+        if action == 'pre_clear':
+            instance._cleared_listing_ids = list(instance.propertylisting_set.values_list('pk', flat=True))
+        elif action == 'post_clear':
+            facility_bits.refresh_listings(instance._cleared_listing_ids)
+        elif action in ('post_add', 'post_remove'):
+            facility_bits.refresh_listings(pk_set)
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        # Update the instance too, marking the bits as saved, so a later
+        # save() doesn't write them back.
+        instance.facility_bits = facility_bits.refresh_listings([instance.pk])[instance.pk]
+        instance._remember_loaded_values(['facility_bits'])
+
+
+# --- Location typeahead ---
+
+@receiver(post_save, sender=PropertyListing)
+def update_location_counts(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or not _saves_any(update_fields, locations.LISTING_FIELDS):
+        return
+    # save() hasn't replaced the loaded values yet, so they are the old ones.
+    old = None if created else locations.location_of(getattr(instance, '_loaded_values', {}))
+    new = locations.location_of({field: getattr(instance, field) for field in locations.LISTING_FIELDS})
+    transaction.on_commit(lambda: locations.listings_changed([(old, new)]))
+
+
+@receiver(post_delete, sender=PropertyListing)
+def remove_location_counts(sender, instance, **kwargs):
+    old = locations.location_of({field: getattr(instance, field) for field in locations.LISTING_FIELDS})
+    transaction.on_commit(lambda: locations.listings_changed([(old, None)]))
+
+
+# --- Near-duplicate detection ---
+
+@receiver(post_save, sender=PropertyListing)
+def index_listing_signature(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Recompute the listing's signature once the save commits, outside the
+    write's transaction. Requests run in autocommit, so that is still before
+    the response to a create, which can say whether it looks like a repost.
+    """
+    if raw or not _saves_any(update_fields, duplicates.LISTING_FIELDS):
+        return
+    transaction.on_commit(lambda: duplicates.index_listings([instance]))
+
+
+# --- Change feed ---
+
+@receiver(post_save, sender=PropertyListing)
+def log_listing_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if not raw:
+        changes.record([instance.pk], changes.CREATED if created else changes.UPDATED)
+        if _saves_any(update_fields, edge_cache.SHOWN_LISTING_FIELDS):
+            edge_cache.listings_changed([instance.pk], edge_cache.locations_of(instance))
+
+
+@receiver(post_delete, sender=PropertyListing)
+def log_listing_deleted(sender, instance, **kwargs):
+    changes.record([instance.pk], changes.DELETED)
+    edge_cache.listings_changed([instance.pk], edge_cache.locations_of(instance))
+
+
+@receiver(m2m_changed, sender=PropertyListing.facilities.through)
+def log_facilities_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        listing_ids = [instance.pk] if action in ('post_add', 'post_remove', 'post_clear') else []
+    elif action in ('post_add', 'post_remove'):
+        listing_ids = pk_set
+    elif action == 'post_clear':
+        # Remembered by update_facility_bits() in pre_clear.
+        listing_ids = getattr(instance, '_cleared_listing_ids', ())
+    else:
+        listing_ids = []
+    changes.record(listing_ids, changes.UPDATED)
+    edge_cache.listings_changed(listing_ids)
+
+
+@receiver(post_save, sender=PropertyImage)
+@receiver(post_delete, sender=PropertyImage)
+def log_images_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        changes.record([instance.property_listing_id], changes.UPDATED)
+        edge_cache.listings_changed([instance.property_listing_id])
+
+
+# --- Cloudinary cleanup ---
+
+@receiver(post_delete, sender=PropertyImage)
+@receiver(post_delete, sender=ArchivedListingImage)
+def delete_image_file(sender, instance, **kwargs):
+    """
+    Queue the deletion of the image's Cloudinary asset, unless another row
+    (e.g. the archived or restored copy of its listing) still refers to it.
+    """
+    public_id = getattr(instance.image, 'public_id', None)
+    if public_id and not tasks.image_in_use(public_id):
+        jobs.defer(tasks.delete_cloudinary_image, {'public_id': public_id})
+
+
+# --- Price per area summaries ---
+
+@receiver(pre_save, sender=PropertyListing)
+def remember_price_contribution(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Remember what the listing contributed to the summaries before this save,
+    so post_save can move it to where it belongs now.
+    """
+    instance._previous_price_contribution = None
+    if raw or instance.pk is None:
+        return
+    if _saves_any(update_fields, analytics.LISTING_FIELDS):
+        loaded = getattr(instance, '_loaded_values', {})
+        if all(field in loaded for field in analytics.LISTING_FIELDS):
+            # What was loaded is what is stored; no need to read it again.
+            instance._previous_price_contribution = analytics.contribution(loaded)
+        else:
+            instance._previous_price_contribution = analytics.stored_contribution(instance.pk)
+    else:
+        # The stored contribution can't change, so skip the query; post_save
+        # sees an unchanged contribution and does nothing.
+        instance._previous_price_contribution = analytics.listing_contribution(instance)
+
+
+@receiver(post_save, sender=PropertyListing)
+def update_price_summary(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, '_previous_price_contribution', None)
+    analytics.apply_change(old, analytics.listing_contribution(instance))
+
+
+@receiver(post_delete, sender=PropertyListing)
+def remove_from_price_summary(sender, instance, **kwargs):
+    analytics.apply_change(analytics.listing_contribution(instance), None)
@@ -0,0 +1,335 @@
+"""
+Precomputed feature matrix for the "similar listings" endpoint.
+
+Every active listing is turned into a fixed-length float32 vector:
+
+- numeric features (log area, log price, bedrooms, road size), standardized
+  with the mean/std of the data the matrix was built from; missing values
+  become 0, i.e. "average";
+- one-hot district and facing direction, and multi-hot facilities, scaled by
+  a weight so they count for about as much as one numeric feature.
+
+Vectors are kept in one matrix per (listing_purpose, property_type) partition,
+because a "similar" listing must always share those. A query is then a single
+vectorized distance computation over the partition plus an `argpartition`.
+
+The matrix lives in process memory. It is built on first use (from the file
+written by `manage.py build_similarity_matrix` if there is one, otherwise from
+the database), patched in place by the listing signal handlers, and rebuilt
+after `SIMILAR_LISTINGS_MAX_AGE` seconds so other processes' writes show up.
+"""
+import math
+import os
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from .models import PropertyListing, District, Facility
+
+NUMERIC_FEATURES = ('log_area', 'log_price', 'bedrooms', 'road_size_ft')
+
+DISTRICT_WEIGHT = 1.0
+FACING_WEIGHT = 0.5
+FACILITY_WEIGHT = 0.35
+
+FACING_VALUES = [value for value in PropertyListing.FacingDirection.values if value != 'ANY']
+
+FEATURE_FIELDS = (
+    'id', 'listing_purpose', 'property_type', 'district_id', 'total_land_area_sqft', 'price',
+    'master_bedrooms', 'common_bedrooms', 'road_size_ft', 'facing_direction',
+)
+
+
+def _numeric_values(row):
+    area = row['total_land_area_sqft']
+    price = row['price']
+    bedrooms = None
+    if row['master_bedrooms'] is not None or row['common_bedrooms'] is not None:
+        bedrooms = (row['master_bedrooms'] or 0) + (row['common_bedrooms'] or 0)
+    # Non-positive values are as good as missing (and log1p can't take them).
+    return (
+        math.log1p(area) if area and area > 0 else None,
+        math.log1p(float(price)) if price and price > 0 else None,
+        bedrooms,
+        row['road_size_ft'],
+    )
+
+
+class FeatureSpace:
+    """
+    Maps a listing (as a dict of `FEATURE_FIELDS` plus a `facilities` list of
+    ids) to its vector. The column layout and numeric scaling are fixed when
+    the space is created, so vectors stay comparable across incremental
+    updates until the next full rebuild.
+    """
+
+    def __init__(self, district_ids, facility_ids, means, stds):
+        self.district_columns = {d: i for i, d in enumerate(district_ids)}
+        self.facing_columns = {f: i for i, f in enumerate(FACING_VALUES)}
+        self.facility_columns = {f: i for i, f in enumerate(facility_ids)}
+        self.means = np.asarray(means, dtype=np.float32)
+        self.stds = np.asarray(stds, dtype=np.float32)
+
+        self.district_offset = len(NUMERIC_FEATURES)
+        self.facing_offset = self.district_offset + len(self.district_columns)
+        self.facility_offset = self.facing_offset + len(self.facing_columns)
+        self.width = self.facility_offset + len(self.facility_columns)
+
+    @classmethod
+    def fit(cls, rows):
+        """
+        Build a feature space whose numeric scaling comes from `rows`.
+        """
+        numeric = np.array(
+            [[np.nan if v is None else v for v in _numeric_values(row)] for row in rows] or [[np.nan] * len(NUMERIC_FEATURES)],
+            dtype=np.float64,
+        )
+        with np.errstate(all='ignore'):
+            means = np.nan_to_num(np.nanmean(numeric, axis=0))
+            stds = np.nan_to_num(np.nanstd(numeric, axis=0))
+        stds[stds == 0] = 1.0
+        district_ids = list(District.objects.order_by('pk').values_list('pk', flat=True))
+        facility_ids = list(Facility.objects.order_by('pk').values_list('pk', flat=True))
+        return cls(district_ids, facility_ids, means, stds)
+
+    def vector(self, row):
+        vec = np.zeros(self.width, dtype=np.float32)
+        for i, value in enumerate(_numeric_values(row)):
+            if value is not None:
+                vec[i] = (value - self.means[i]) / self.stds[i]
+        column = self.district_columns.get(row['district_id'])
+        if column is not None:
+            vec[self.district_offset + column] = DISTRICT_WEIGHT
+        column = self.facing_columns.get(row['facing_direction'])
+        if column is not None:
+            vec[self.facing_offset + column] = FACING_WEIGHT
+        for facility_id in row['facilities']:
+            column = self.facility_columns.get(facility_id)
+            if column is not None:
+                vec[self.facility_offset + column] = FACILITY_WEIGHT
+        return vec
+
+
+class Partition:
+    """
+    The vectors of one (purpose, type) partition. Rows are stored in a
+    matrix with spare capacity so appends are amortized O(1); removal swaps
+    the last row into the hole.
+    """
+
+    def __init__(self, width, capacity=64):
+        self.matrix = np.zeros((capacity, width), dtype=np.float32)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.rows = {}  # listing id -> row number
+        self.size = 0
+
+    def upsert(self, listing_id, vec):
+        row = self.rows.get(listing_id)
+        if row is None:
+            if self.size == len(self.ids):
+                self.matrix = np.concatenate([self.matrix, np.zeros_like(self.matrix)])
+                self.ids = np.concatenate([self.ids, np.zeros_like(self.ids)])
+            row = self.size
+            self.size += 1
+            self.rows[listing_id] = row
+            self.ids[row] = listing_id
+        self.matrix[row] = vec
+
+    def remove(self, listing_id):
+        row = self.rows.pop(listing_id, None)
+        if row is None:
+            return
+        last = self.size - 1
+        if row != last:
+            moved_id = int(self.ids[last])
+            self.matrix[row] = self.matrix[last]
+            self.ids[row] = moved_id
+            self.rows[moved_id] = row
+        self.size = last
+
+    def nearest(self, vec, k, exclude=None):
+        """
+        Return up to `k` (listing id, distance) pairs closest to `vec`.
+        """
+        if self.size == 0:
+            return []
+        diff = self.matrix[:self.size] - vec
+        distances = np.einsum('ij,ij->i', diff, diff)
+        if exclude is not None and exclude in self.rows:
+            distances[self.rows[exclude]] = np.inf
+        k = min(k, self.size)
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        return [(int(self.ids[i]), float(distances[i])) for i in top if np.isfinite(distances[i])]
+
+
+class SimilarityIndex:
+    """
+    All partitions, plus the bookkeeping to move a listing between them when
+    its purpose or type changes.
+    """
+
+    def __init__(self, space):
+        self.space = space
+        self.partitions = {}
+        self.partition_of = {}  # listing id -> partition key
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.partition_of)
+
+    def upsert(self, row):
+        key = (row['listing_purpose'], row['property_type'])
+        previous = self.partition_of.get(row['id'])
+        if previous is not None and previous != key:
+            self.partitions[previous].remove(row['id'])
+        partition = self.partitions.get(key)
+        if partition is None:
+            partition = self.partitions[key] = Partition(self.space.width)
+        partition.upsert(row['id'], self.space.vector(row))
+        self.partition_of[row['id']] = key
+
+    def remove(self, listing_id):
+        key = self.partition_of.pop(listing_id, None)
+        if key is not None:
+            self.partitions[key].remove(listing_id)
+
+    def similar(self, row, k):
+        partition = self.partitions.get((row['listing_purpose'], row['property_type']))
+        if partition is None:
+            return []
+        return partition.nearest(self.space.vector(row), k, exclude=row['id'])
+
+    # --- Persistence, used by the build_similarity_matrix command ---
+
+    def save(self, path):
+        arrays = {
+            'district_ids': np.array(list(self.space.district_columns), dtype=np.int64),
+            'facility_ids': np.array(list(self.space.facility_columns), dtype=np.int64),
+            'means': self.space.means,
+            'stds': self.space.stds,
+        }
+        for n, ((purpose, ptype), partition) in enumerate(self.partitions.items()):
+            arrays[f'key_{n}'] = np.array([purpose, ptype])
+            arrays[f'ids_{n}'] = partition.ids[:partition.size]
+            arrays[f'matrix_{n}'] = partition.matrix[:partition.size]
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            space = FeatureSpace(data['district_ids'].tolist(), data['facility_ids'].tolist(), data['means'], data['stds'])
+            index = cls(space)
+            n = 0
+            while f'key_{n}' in data:
+                purpose, ptype = data[f'key_{n}'].tolist()
+                ids, matrix = data[f'ids_{n}'], data[f'matrix_{n}']
+                partition = Partition(space.width, capacity=max(len(ids), 64))
+                partition.ids[:len(ids)] = ids
+                partition.matrix[:len(ids)] = matrix
+                partition.size = len(ids)
+                partition.rows = {int(i): r for r, i in enumerate(ids)}
+                index.partitions[(purpose, ptype)] = partition
+                index.partition_of.update((int(i), (purpose, ptype)) for i in ids)
+                n += 1
+        return index
+
+
+def listing_rows(queryset):
+    """
+    Yield feature dicts for the listings in `queryset`, fetching facility ids
+    with one extra query per chunk instead of one per listing.
+    """
+    through = PropertyListing.facilities.through
+    chunk = []
+    for row in queryset.values(*FEATURE_FIELDS).iterator(chunk_size=2000):
+        chunk.append(row)
+        if len(chunk) == 2000:
+            yield from _with_facilities(chunk, through)
+            chunk = []
+    if chunk:
+        yield from _with_facilities(chunk, through)
+
+
+def _with_facilities(chunk, through):
+    facilities = {row['id']: [] for row in chunk}
+    for listing_id, facility_id in through.objects.filter(propertylisting_id__in=facilities).values_list('propertylisting_id', 'facility_id'):
+        facilities[listing_id].append(facility_id)
+    for row in chunk:
+        row['facilities'] = facilities[row['id']]
+        yield row
+
+
+def build_index():
+    """
+    Build a fresh index of all active listings from the database.
+    """
+    rows = list(listing_rows(PropertyListing.objects.filter(is_active=True)))
+    index = SimilarityIndex(FeatureSpace.fit(rows))
+    for row in rows:
+        index.upsert(row)
+    return index
+
+
+# --- Process-wide index ---
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    max_age = getattr(settings, 'SIMILAR_LISTINGS_MAX_AGE', 3600)
+    path = getattr(settings, 'SIMILAR_LISTINGS_MATRIX_PATH', None)
+    with _index_lock:
+        if _index is None or time.monotonic() - _index.built_at > max_age:
+            index = None
+            if path and os.path.exists(path) and time.time() - os.path.getmtime(path) < max_age:
+                try:
+                    index = SimilarityIndex.load(path)
+                except (OSError, KeyError, ValueError):
+                    index = None
+            _index = index if index is not None else build_index()
+        return _index
+
+
+def listing_changed(listing_id):
+    """
+    Re-read one listing and patch the in-memory index, if it has been built.
+    """
+    listings_changed([listing_id])
+
+
+def listings_changed(listing_ids):
+    """
+    `listing_changed` for many listings, reading them in one go.
+    """
+    missing = set(listing_ids)
+    with _index_lock:
+        if _index is None:
+            return
+        for row in listing_rows(PropertyListing.objects.filter(pk__in=missing, is_active=True)):
+            _index.upsert(row)
+            missing.discard(row['id'])
+        for listing_id in missing:
+            _index.remove(listing_id)
+
+
+def listing_deleted(listing_id):
+    with _index_lock:
+        if _index is not None:
+            _index.remove(listing_id)
+
+
+def similar_listing_ids(listing, k=10):
+    """
+    Return the ids of the `k` active listings closest to `listing` in
+    feature space, nearest first.
+    """
+    row = {field: getattr(listing, field) for field in FEATURE_FIELDS}
+    row['facilities'] = [facility.pk for facility in listing.facilities.all()]
+    index = get_index()
+    with _index_lock:
+        return [listing_id for listing_id, _ in index.similar(row, k)]
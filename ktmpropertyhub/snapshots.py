@@ -0,0 +1,270 @@
+"""
+Prebuilt, precompressed JSON snapshots of the most requested listing slices.
+
+Most anonymous traffic asks for the same few lists: the active listings of
+one district (`/api/properties/?district=12`) or of one purpose and type
+(`?listing_purpose=SELL&property_type=LAND`). `manage.py build_snapshots`
+renders each of those slices exactly as the API would, and writes the result
+with its gzip and brotli variants under `LISTING_SNAPSHOT_ROOT`. File names
+contain a content hash, so the files never change and can be cached forever
+by browsers and the CDN. `manifest.json` maps each slice to its current file.
+
+`SnapshotMiddleware` serves the files with WhiteNoise, choosing the
+precompressed variant the client accepts. Anonymous list requests for a
+slice are redirected to its file (see `snapshot_url`) while the manifest is
+younger than `LISTING_SNAPSHOT_MAX_AGE`, so a stopped builder can't keep
+stale lists in front of users. Clients and the CDN can also read the
+manifest and fetch the files directly, without reaching Django at all.
+
+Rebuilds are incremental. The builder follows the listing change feed (see
+changes.py) from where it stopped, and only re-renders the slices that a
+changed listing belongs to now or belonged to before. To know the old
+slices, it keeps the listing ids of every slice in a private state file
+(`LISTING_SNAPSHOT_STATE_PATH`).
+"""
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+from django.utils import timezone
+from whitenoise.base import WhiteNoise
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import changes
+from .compression import brotli
+from .models import District, PropertyListing
+from .renderers import FastJSONRenderer
+
+MANIFEST_NAME = 'manifest.json'
+LISTINGS_DIR = 'listings'
+
+
+# --- Slices ---
+
+def slice_keys(values):
+    """
+    Keys of the slices a listing with these field values appears in.
+    """
+    if not values.get('is_active'):
+        return []
+    keys = [f"{values['listing_purpose']}-{values['property_type']}".lower()]
+    if values.get('district_id') is not None:
+        keys.append(f"district-{values['district_id']}")
+    return keys
+
+
+def slice_filters(key):
+    kind, _, value = key.partition('-')
+    if kind == 'district':
+        return {'district_id': int(value)}
+    return {'listing_purpose': kind.upper(), 'property_type': value.upper()}
+
+
+def all_slice_keys():
+    keys = [
+        f'{purpose}-{property_type}'.lower()
+        for purpose in PropertyListing.ListingPurpose.values
+        for property_type in PropertyListing.PropertyType.values
+    ]
+    keys.extend(f'district-{pk}' for pk in District.objects.order_by('pk').values_list('pk', flat=True))
+    return keys
+
+
+def request_slice_key(params):
+    """
+    The slice that list query parameters ask for exactly, or None.
+    """
+    names = set(params)
+    if names == {'district'} and params['district'].isdigit():
+        return f"district-{int(params['district'])}"
+    if names == {'listing_purpose', 'property_type'}:
+        purpose, property_type = params['listing_purpose'], params['property_type']
+        if purpose in PropertyListing.ListingPurpose.values and property_type in PropertyListing.PropertyType.values:
+            return f'{purpose}-{property_type}'.lower()
+    return None
+
+
+# --- Building ---
+
+def render(key):
+    """
+    The slice as the list endpoint would return it, and its listing ids.
+    """
+    from .serializers import PropertyListingCardSerializer, card_images_prefetch
+
+    listings = list(
+        PropertyListing.objects.filter(is_active=True, **slice_filters(key))
+        .select_related('user', 'state', 'district')
+        .prefetch_related('facilities', card_images_prefetch())
+    )
+    data = PropertyListingCardSerializer(listings, many=True).data
+    return FastJSONRenderer().render(data), [listing.pk for listing in listings]
+
+
+def _write_atomic(path, content):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(content)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+
+def write_snapshot(root, key, body):
+    """
+    Write `body` and its compressed variants under a content-hashed name.
+    Returns the name relative to `root`.
+    """
+    digest = hashlib.blake2b(body, digest_size=6).hexdigest()
+    name = f'{LISTINGS_DIR}/{key}.{digest}.json'
+    path = os.path.join(root, name)
+    if not os.path.exists(path):
+        # Compressed variants first, so they are never missing when the plain file exists.
+        _write_atomic(path + '.gz', gzip.compress(body, compresslevel=9, mtime=0))
+        if brotli is not None:
+            _write_atomic(path + '.br', brotli.compress(body, quality=11))
+        _write_atomic(path, body)
+    return name
+
+
+def load_state():
+    try:
+        with open(settings.LISTING_SNAPSHOT_STATE_PATH) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'cursor': None, 'slices': {}}
+
+
+def build(full=False):
+    """
+    Re-render the slices touched since the last build (all of them on the
+    first build, with `full`, or when the change feed no longer reaches back
+    to the last build). Returns the keys that were rendered.
+    """
+    root = settings.LISTING_SNAPSHOT_ROOT
+    os.makedirs(os.path.join(root, LISTINGS_DIR), exist_ok=True)
+    state = load_state()
+    cursor = state['cursor']
+    previous = {key: entry['file'] for key, entry in state['slices'].items()}
+
+    if full or cursor is None or changes.expired(cursor):
+        cursor = changes.head()
+        keys = set(all_slice_keys())
+        state['slices'] = {}
+    else:
+        keys = set()
+        changed = set()
+        has_more = True
+        while has_more:
+            rows, cursor, has_more = changes.read(cursor, 5000)
+            changed.update(listing_id for _, listing_id, _ in rows)
+        if changed:
+            for key, entry in state['slices'].items():
+                if not changed.isdisjoint(entry['ids']):
+                    keys.add(key)
+            rows = PropertyListing.objects.filter(pk__in=changed).values('is_active', 'listing_purpose', 'property_type', 'district_id')
+            for values in rows:
+                keys.update(slice_keys(values))
+
+    for key in sorted(keys):
+        body, ids = render(key)
+        state['slices'][key] = {'file': write_snapshot(root, key, body), 'ids': ids}
+    state['cursor'] = cursor
+
+    manifest = {
+        'built_at': timezone.now().isoformat(),
+        'cursor': cursor,
+        'slices': {
+            key: {'url': settings.LISTING_SNAPSHOT_URL + entry['file'], 'count': len(entry['ids'])}
+            for key, entry in state['slices'].items()
+        },
+    }
+    _write_atomic(settings.LISTING_SNAPSHOT_STATE_PATH, json.dumps(state).encode())
+    _write_atomic(os.path.join(root, MANIFEST_NAME), json.dumps(manifest).encode())
+
+    # Keep the previous files too: clients may still be following a redirect to them.
+    keep = {entry['file'] for entry in state['slices'].values()} | set(previous.values())
+    for filename in os.listdir(os.path.join(root, LISTINGS_DIR)):
+        name = f'{LISTINGS_DIR}/{filename}'
+        base = name[:-3] if name.endswith(('.gz', '.br')) else name
+        if base not in keep and not filename.startswith('.tmp-'):
+            os.remove(os.path.join(root, name))
+    return sorted(keys)
+
+
+# --- Serving ---
+
+class Manifest:
+    """
+    The parsed manifest, re-read whenever the builder replaces the file.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.data = None
+
+    def get(self):
+        path = os.path.join(settings.LISTING_SNAPSHOT_ROOT, MANIFEST_NAME)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self.lock:
+            if mtime != self.mtime:
+                with open(path) as f:
+                    self.data = json.load(f)
+                self.data['built_at'] = datetime.datetime.fromisoformat(self.data['built_at'])
+                self.mtime = mtime
+            return self.data
+
+
+manifest = Manifest()
+
+
+def snapshot_url(request):
+    """
+    URL of the snapshot holding exactly what this list request asks for, if
+    there is a fresh one.
+    """
+    if request.user.is_authenticated:
+        return None
+    key = request_slice_key(request.query_params)
+    if key is None:
+        return None
+    current = manifest.get()
+    if current is None:
+        return None
+    if (timezone.now() - current['built_at']).total_seconds() > getattr(settings, 'LISTING_SNAPSHOT_MAX_AGE', 300):
+        return None
+    entry = current['slices'].get(key)
+    return entry['url'] if entry else None
+
+
+class SnapshotMiddleware:
+    """
+    Serve files under `LISTING_SNAPSHOT_URL` from `LISTING_SNAPSHOT_ROOT`.
+    Unlike static files, snapshots appear while the process runs, so they
+    are looked up on disk per request rather than indexed at startup.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.LISTING_SNAPSHOT_URL
+        self.files = WhiteNoise(
+            None, root=settings.LISTING_SNAPSHOT_ROOT, prefix=self.prefix, autorefresh=True,
+            max_age=60, allow_all_origins=True,
+            # Everything but the manifest has a content hash in its name.
+            immutable_file_test=lambda path, url: not url.endswith('/' + MANIFEST_NAME),
+        )
+
+    def __call__(self, request):
+        if request.path_info.startswith(self.prefix):
+            static_file = self.files.find_file(request.path_info)
+            if static_file is not None:
+                return WhiteNoiseMiddleware.serve(static_file, request)
+        return self.get_response(request)
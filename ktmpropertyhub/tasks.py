@@ -0,0 +1,85 @@
+"""
+Background jobs (see jobs.py). Every job may run more than once, so each
+one checks what has already been done before doing it.
+"""
+import os
+
+import cloudinary.uploader
+from django.conf import settings
+from django.db import transaction
+
+from . import edge_cache, image_dedup
+from .jobs import task
+from .models import ArchivedListingImage, ImageAsset, PropertyImage, PropertyListing
+
+
+def spool_path(name):
+    return os.path.join(settings.JOB_SPOOL_DIR, name)
+
+
+def store_listing_image(listing_id, source, hashes, folder, public_id):
+    """
+    Attach an image to the listing: a stored image with the same content if
+    there is one (see image_dedup.py), otherwise `source` (a path or file)
+    uploaded to Cloudinary as `folder/public_id`.
+    """
+    asset = image_dedup.find_asset(hashes)
+    if asset is None or not image_dedup.attach(listing_id, asset, hashes.size):
+        # Nothing to reuse (or it was deleted meanwhile): store this one.
+        upload_result = cloudinary.uploader.upload(
+            source, folder=folder, public_id=public_id, overwrite=True, resource_type="image",
+        )
+        asset = image_dedup.record_asset(upload_result['public_id'], hashes)
+        image_dedup.attach(listing_id, asset, reused=False)
+
+
+@task('upload_listing_image')
+def upload_listing_image(listing_id, spooled_file, folder, public_id, sha256=None):
+    """
+    Attach an image saved by the admin to the listing (see
+    store_listing_image), then remove the local copy.
+    """
+    path = spool_path(spooled_file)
+    full_id = f'{folder}/{public_id}'
+    if not PropertyListing.objects.filter(pk=listing_id).exists():
+        # Deleted while waiting; nothing to attach the image to.
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    if not PropertyImage.objects.filter(image_dedup.stored_as(full_id), property_listing_id=listing_id).exists():
+        store_listing_image(listing_id, path, image_dedup.hash_file(path, sha256), folder, public_id)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def image_in_use(public_id):
+    """
+    Whether any listing, live or archived, refers to the Cloudinary image.
+    """
+    stored = image_dedup.stored_as(public_id)
+    return PropertyImage.objects.filter(stored).exists() or ArchivedListingImage.objects.filter(stored).exists()
+
+
+@task('delete_cloudinary_image')
+def delete_cloudinary_image(public_id):
+    """
+    Delete an image from Cloudinary once nothing refers to it any more.
+    """
+    with transaction.atomic():
+        # Locked, so the image can't be attached as a duplicate meanwhile.
+        assets = ImageAsset.objects.select_for_update().filter(public_id=public_id)
+        list(assets)
+        if image_in_use(public_id):
+            return
+        assets.delete()
+    cloudinary.uploader.destroy(public_id, resource_type="image", invalidate=True)
+
+
+@task('purge_edge_cache')
+def purge_edge_cache(keys):
+    """
+    Invalidate the CDN's cached responses tagged with any of `keys`.
+    """
+    client = edge_cache.get_client()
+    if client is not None:
+        client.purge(keys)
@@ -0,0 +1,1214 @@
+import datetime
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.admin.sites import site
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import CachedJWTAuthentication, generation_key, user_cache_key
+from .metrics import Histogram, WINDOW_SLOT_SECONDS, WINDOW_SLOTS, registry
+from .renderers import FastJSONRenderer
+from .serializers import PropertyListingCreateSerializer
+from . import analytics, archive, changes, compression, counters, duplicates, locations, edge_cache, overload, image_dedup, reference_data, revocation, saved_searches, similarity, snapshots, tasks
+from .models import (
+    ArchivedListing, District, Facility, ImageAsset, Job, ListingChange, ListingSignature, ListingStats, PricePerAreaSummary,
+    PropertyImage, PropertyListing, SavedSearch, State,
+)
+
+# Throttles are tested on their own; everywhere else they would only get in the way.
+NO_THROTTLES = {
+    **settings.REST_FRAMEWORK,
+    'DEFAULT_THROTTLE_RATES': {'anon_read': None, 'user_write': None, 'auth': None, 'contact': None},
+}
+
+
+@override_settings(REST_FRAMEWORK=NO_THROTTLES)
+class ListingTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('owner', password='x')
+        # States and districts are loaded by a migration.
+        cls.district = District.objects.select_related('state').order_by('pk').first()
+        cls.state = cls.district.state
+
+    def setUp(self):
+        # In-process indexes and buffers outlive each test's transaction; start from the database.
+        cache.clear()
+        counters.buffer.pending.clear()
+        saved_searches._index = None
+        similarity._index = None
+        locations._index = None
+
+    def create_listing(self, **fields):
+        values = {
+            'user': self.user, 'title': 'House in Baneshwor', 'listing_purpose': 'SELL',
+            'property_type': 'HOUSE', 'state': self.state, 'district': self.district, 'price': 10_000_000,
+            'built_up_area_sqft': 1000,
+        }
+        values.update(fields)
+        return PropertyListing.objects.create(**values)
+
+
+class BulkListingTests(ListingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_create(self):
+        items = [
+            {'listing_purpose': 'SELL', 'property_type': 'LAND', 'title': f'Plot {i}', 'state': self.state.pk, 'district': self.district.pk}
+            for i in range(3)
+        ]
+        response = self.client.post('/api/add-property/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(PropertyListing.objects.filter(user=self.user).count(), 3)
+
+    def test_bulk_create_is_all_or_nothing(self):
+        items = [
+            {'listing_purpose': 'SELL', 'property_type': 'LAND', 'title': 'Valid'},
+            {'listing_purpose': 'NOPE', 'property_type': 'LAND', 'title': 'Invalid'},
+        ]
+        response = self.client.post('/api/add-property/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('listing_purpose', response.data[1])
+        self.assertFalse(PropertyListing.objects.exists())
+
+    def test_bulk_update(self):
+        first, second = self.create_listing(), self.create_listing(title='Flat')
+        response = self.client.patch(
+            '/api/add-property/bulk/',
+            [{'id': first.pk, 'title': 'Renamed'}, {'id': second.pk, 'price': 5_000_000}],
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.title, 'Renamed')
+        self.assertEqual(second.price, 5_000_000)
+
+    def test_bulk_update_ignores_client_supplied_area(self):
+        listing = self.create_listing(ropani=1)
+        response = self.client.patch('/api/add-property/bulk/', [{'id': listing.pk, 'total_land_area_sqft': 7}], format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        listing.refresh_from_db()
+        self.assertEqual(listing.total_land_area_sqft, 5476)
+
+    def test_bulk_update_recalculates_area_and_sort_keys(self):
+        listing = self.create_listing(ropani=1, price=5_476_000)
+        response = self.client.patch('/api/add-property/bulk/', [{'id': listing.pk, 'ropani': 2}], format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        listing.refresh_from_db()
+        self.assertEqual((listing.total_land_area_sqft, listing.price_per_sqft), (10952, 500))
+
+    def test_bulk_update_logs_changes(self):
+        listing = self.create_listing()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch('/api/add-property/bulk/', [{'id': listing.pk, 'title': 'Renamed'}], format='json')
+        kinds = list(ListingChange.objects.filter(listing_id=listing.pk).values_list('kind', flat=True))
+        self.assertIn(ListingChange.Kind.UPDATED, kinds)
+
+    def test_bulk_update_rejects_other_users_listings(self):
+        other = get_user_model().objects.create_user('other', password='x')
+        listing = self.create_listing(user=other)
+        response = self.client.patch('/api/add-property/bulk/', [{'id': listing.pk, 'title': 'Mine now'}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {'id': ['Not found.']})
+
+
+class SavedSearchIndexTests(ListingTestCase):
+    def version(self):
+        return cache.get(saved_searches.INDEX_VERSION_CACHE_KEY, 0)
+
+    def test_index_changes_on_commit(self):
+        saved_searches.get_index()
+        with self.captureOnCommitCallbacks() as callbacks:
+            search = SavedSearch.objects.create(user=self.user, district=self.district)
+            # Other processes must not rebuild before they can see the row.
+            self.assertEqual(self.version(), 0)
+            self.assertNotIn(search.pk, saved_searches.get_index().keys)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.version(), 1)
+        self.assertIn(search.pk, saved_searches.get_index().keys)
+
+    def test_deactivated_and_deleted_searches_leave_the_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            active = SavedSearch.objects.create(user=self.user)
+            inactive = SavedSearch.objects.create(user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            inactive.is_active = False
+            inactive.save()
+            active.delete()
+        self.assertEqual(len(saved_searches.get_index()), 0)
+
+    def test_new_listings_are_matched(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            matching = SavedSearch.objects.create(user=self.user, district=self.district, max_price=12_000_000)
+            too_cheap = SavedSearch.objects.create(user=self.user, district=self.district, max_price=5_000_000)
+            other_type = SavedSearch.objects.create(user=self.user, property_type='LAND')
+        with self.captureOnCommitCallbacks(execute=True):
+            listing = self.create_listing()
+        self.assertEqual(list(listing.saved_search_matches.values_list('saved_search_id', flat=True)), [matching.pk])
+        self.assertFalse(too_cheap.matches.exists() or other_type.matches.exists())
+
+    def test_criteria(self):
+        # (criteria, whether the listing below satisfies them)
+        criteria = [
+            ({}, True),
+            ({'listing_purpose': 'RENT'}, False),
+            ({'property_type': 'HOUSE', 'state': self.state}, True),
+            ({'min_price': 10_000_000, 'max_price': 10_000_000}, True),
+            ({'max_price': 9_999_999}, False),
+            # The listing has no land area, so a bounded area never matches.
+            ({'min_sqft': 1}, False),
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            searches = [(SavedSearch.objects.create(user=self.user, **fields), match) for fields, match in criteria]
+        listing = self.create_listing()
+        expected = {search.pk for search, match in searches if match}
+        self.assertEqual(saved_searches.get_index().candidates(listing), expected)
+
+
+class PricePerAreaAnalyticsTests(ListingTestCase):
+    def test_rejects_non_integer_ids(self):
+        for param in ('district', 'state'):
+            response = self.client.get(f'/api/analytics/price-per-sqft/?{param}=abc')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(param, response.data)
+
+
+class PriceSummaryTests(ListingTestCase):
+    def summary(self, **fields):
+        lookup = {'district': self.district, 'property_type': 'HOUSE', 'listing_purpose': 'SELL', **fields}
+        return PricePerAreaSummary.objects.filter(**lookup).values_list('count', 'total').first()
+
+    def test_edit_moves_the_contribution(self):
+        # One ropani is 5476 sqft.
+        listing = self.create_listing(ropani=1, price=5_476_000)
+        self.assertEqual(self.summary(), (1, 1000.0))
+        listing.price = 10_952_000
+        listing.save()
+        self.assertEqual(self.summary(), (1, 2000.0))
+        listing.property_type = 'LAND'
+        listing.save()
+        self.assertEqual(self.summary(), (0, 0))
+        self.assertEqual(self.summary(property_type='LAND'), (1, 2000.0))
+
+    def test_deactivate_and_delete_remove_the_contribution(self):
+        first = self.create_listing(ropani=1, price=5_476_000)
+        second = self.create_listing(ropani=1, price=10_952_000)
+        self.assertEqual(self.summary(), (2, 3000.0))
+        first.is_active = False
+        first.save()
+        self.assertEqual(self.summary(), (1, 2000.0))
+        second.delete()
+        self.assertEqual(self.summary(), (0, 0))
+
+    def test_listings_without_an_area_are_left_out(self):
+        self.create_listing()
+        self.assertIsNone(self.summary())
+
+    def test_listings_without_a_positive_price_are_left_out(self):
+        listing = self.create_listing(ropani=1, price=-5)
+        self.create_listing(ropani=1, price=0)
+        self.assertIsNone(self.summary())
+        listing.price = 5_476_000
+        listing.save()
+        self.assertEqual(self.summary(), (1, 1000.0))
+        listing.price = -1
+        listing.save()
+        self.assertEqual(self.summary(), (0, 0))
+
+
+@override_settings(LISTING_CHANGES_LAG_SECONDS=0)
+class ChangeFeedTests(ListingTestCase):
+    url = '/api/properties/changes/'
+
+    def read(self, since):
+        response = self.client.get(self.url, {'since': since})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def test_cursor_follows_changes(self):
+        head = self.client.get(self.url).data['next']
+        with self.captureOnCommitCallbacks(execute=True):
+            listing = self.create_listing()
+        page = self.read(head)
+        self.assertEqual([(c['id'], c['action']) for c in page['changes']], [(listing.pk, 'created')])
+        self.assertEqual(page['changes'][0]['listing']['title'], 'House in Baneshwor')
+        self.assertFalse(page['has_more'])
+
+        self.assertEqual(self.read(page['next'])['changes'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.title = 'Renamed'
+            listing.save()
+        updated = self.read(page['next'])
+        self.assertEqual([(c['action'], c['listing']['title']) for c in updated['changes']], [('updated', 'Renamed')])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.delete()
+        deleted = self.read(updated['next'])
+        self.assertEqual([(c['action'], c['listing']) for c in deleted['changes']], [('deleted', None)])
+
+    def test_changes_within_a_page_are_coalesced(self):
+        head = self.client.get(self.url).data['next']
+        with self.captureOnCommitCallbacks(execute=True):
+            listing = self.create_listing()
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.title = 'Renamed'
+            listing.save()
+        page = self.read(head)
+        self.assertEqual([(c['id'], c['action']) for c in page['changes']], [(listing.pk, 'created')])
+
+    def test_bad_cursor(self):
+        response = self.client.get(self.url, {'since': 'abc'})
+        self.assertEqual((response.status_code, list(response.data)), (400, ['since']))
+
+    def test_bad_limit(self):
+        response = self.client.get(self.url, {'since': changes.head(), 'limit': 'abc'})
+        self.assertEqual((response.status_code, list(response.data)), (400, ['limit']))
+
+    def test_pruned_cursor_has_expired(self):
+        head = self.client.get(self.url).data['next']
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(3):
+                self.create_listing()
+        oldest = ListingChange.objects.order_by('id')[:2]
+        ListingChange.objects.filter(id__in=list(oldest.values_list('id', flat=True))).delete()
+        self.assertEqual(self.client.get(self.url, {'since': head}).status_code, 410)
+        self.assertFalse(changes.expired(changes.head()))
+
+
+class LandAreaTests(ListingTestCase):
+    def test_area_is_calculated_from_the_units(self):
+        listing = self.create_listing(ropani=1)
+        self.assertEqual(listing.total_land_area_sqft, 5476)
+
+    def test_client_supplied_area_is_ignored(self):
+        listing = self.create_listing(ropani=1, price=5_476_000)
+        self.client.force_authenticate(self.user)
+        response = self.client.patch(f'/api/add-property/{listing.pk}/', {'total_land_area_sqft': 1}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        listing.refresh_from_db()
+        self.assertEqual(listing.total_land_area_sqft, 5476)
+        self.assertEqual(listing.price_per_sqft, 1000)
+
+    def test_saving_only_the_area_recalculates_it(self):
+        listing = self.create_listing(ropani=1)
+        listing.total_land_area_sqft = 1
+        listing.save()
+        listing.refresh_from_db()
+        self.assertEqual(listing.total_land_area_sqft, 5476)
+
+
+@override_settings(SIMILAR_LISTINGS_MATRIX_PATH=None)
+class SimilarListingsTests(ListingTestCase):
+    def similar(self, listing):
+        response = self.client.get(f'/api/properties/{listing.pk}/similar/')
+        self.assertEqual(response.status_code, 200, response.content)
+        return [row['id'] for row in response.data]
+
+    def test_nearest_first(self):
+        listing = self.create_listing(ropani=4, price=20_000_000)
+        near = self.create_listing(ropani=4, price=21_000_000)
+        far = self.create_listing(ropani=40, price=400_000_000)
+        self.create_listing(ropani=4, price=20_000_000, listing_purpose='RENT')
+        self.assertEqual(self.similar(listing), [near.pk, far.pk])
+
+    def test_non_positive_prices_are_treated_as_missing(self):
+        listing = self.create_listing(ropani=4, price=20_000_000)
+        bad = self.create_listing(ropani=4, price=-100)
+        self.assertIn(bad.pk, self.similar(listing))
+        self.assertIn(listing.pk, self.similar(bad))
+
+    def test_index_follows_changes(self):
+        listing = self.create_listing()
+        other = self.create_listing()
+        self.assertEqual(self.similar(listing), [other.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            other.is_active = False
+            other.save()
+        self.assertEqual(self.similar(listing), [])
+
+
+class CounterTests(ListingTestCase):
+    def stats(self, listing):
+        return ListingStats.objects.filter(listing=listing).values_list('view_count', 'contact_count').first()
+
+    @override_settings(LISTING_COUNTERS_FLUSH_INTERVAL=3600)
+    def test_counts_are_buffered(self):
+        listing = self.create_listing()
+        self.client.get(f'/api/properties/{listing.pk}/')
+        self.client.post(f'/api/properties/{listing.pk}/contact/')
+        self.assertIsNone(self.stats(listing))
+        self.assertEqual(counters.counts([listing.pk])[listing.pk], {'view_count': 1, 'contact_count': 1})
+        counters.buffer.flush()
+        self.assertEqual(self.stats(listing), (1, 1))
+
+    @override_settings(LISTING_COUNTERS_FLUSH_INTERVAL=0)
+    def test_without_an_interval_every_count_is_written_at_once(self):
+        listing = self.create_listing()
+        self.client.get(f'/api/properties/{listing.pk}/')
+        self.client.get(f'/api/properties/{listing.pk}/')
+        self.assertEqual(self.stats(listing), (2, 0))
+
+    def test_deleted_listings_are_skipped(self):
+        listing = self.create_listing()
+        counters.buffer.incr(listing.pk, 'view_count')
+        listing.delete()
+        self.assertEqual(counters.buffer.flush(), 0)
+
+
+class CachedJWTAuthenticationTests(ListingTestCase):
+    def authenticate(self, token):
+        return CachedJWTAuthentication().get_user(CachedJWTAuthentication().get_validated_token(str(token)))
+
+    def test_cached_user_needs_no_query(self):
+        token = AccessToken.for_user(self.user)
+        self.authenticate(token)
+        with self.assertNumQueries(0):
+            user = self.authenticate(token)
+        self.assertEqual((user.pk, user.username, user.is_active, user.is_staff), (self.user.pk, 'owner', True, False))
+
+    def test_cache_holds_no_password_hash(self):
+        token = AccessToken.for_user(self.user)
+        self.authenticate(token)
+        key = user_cache_key(self.user.pk, cache.get(generation_key(self.user.pk), 0))
+        entry = cache.get(key)
+        self.assertNotIn('password', entry['fields'])
+        self.assertNotIn(self.user.password, repr(entry))
+
+    def test_other_fields_are_loaded_on_access(self):
+        self.user.email = 'owner@example.com'
+        self.user.save()
+        token = AccessToken.for_user(self.user)
+        self.authenticate(token)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate(token).email, 'owner@example.com')
+
+    def test_saving_the_user_invalidates_the_entry(self):
+        token = AccessToken.for_user(self.user)
+        self.authenticate(token)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    # simplejwt modules hold on to the settings object, so override_settings can't reach them.
+    @mock.patch.object(jwt_settings, 'CHECK_REVOKE_TOKEN', True)
+    def test_tokens_for_an_old_password_are_rejected(self):
+        token = AccessToken.for_user(self.user)
+        self.authenticate(token)
+        self.user.set_password('changed')
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+        self.assertEqual(self.authenticate(AccessToken.for_user(self.user)).pk, self.user.pk)
+
+
+class LoadControlTests(ListingTestCase):
+    @override_settings(MAX_CONCURRENT_REQUESTS={'properties': 1})
+    def test_requests_over_the_concurrency_limit_are_shed(self):
+        slot = overload.limiter.acquire('properties', 1)
+        response = self.client.get('/api/properties/')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        overload.limiter.release(slot)
+        self.assertEqual(self.client.get('/api/properties/').status_code, 200)
+
+    @override_settings(MAX_CONCURRENT_REQUESTS={'properties': 0})
+    def test_a_zero_limit_sheds_everything(self):
+        self.assertEqual(self.client.get('/api/properties/').status_code, 503)
+
+    @override_settings(MAX_CONCURRENT_REQUESTS={'properties': 1})
+    def test_slots_are_released(self):
+        codes = [self.client.get('/api/properties/').status_code for _ in range(3)]
+        self.assertEqual(codes, [200, 200, 200])
+
+    @override_settings(STATEMENT_TIMEOUTS={'properties': 5})
+    def test_writes_run_without_the_statement_timeout(self):
+        listing = self.create_listing()
+        # Posing as Postgres: SQLite has no set_config(), so any attempt to set the timeout fails.
+        with mock.patch.object(overload.connection, 'vendor', 'postgresql'):
+            self.assertEqual(self.client.post(f'/api/properties/{listing.pk}/contact/').status_code, 204)
+            with self.assertRaises(OperationalError):
+                self.client.get('/api/properties/')
+
+
+class ListingSaveTests(ListingTestCase):
+    def test_only_changed_fields_are_written(self):
+        listing = self.create_listing()
+        stale = PropertyListing.objects.get(pk=listing.pk)
+        listing.title = 'Renamed'
+        listing.save()
+        stale.price = 12_000_000
+        stale.save()
+        listing.refresh_from_db()
+        self.assertEqual((listing.title, listing.price), ('Renamed', 12_000_000))
+
+    def test_price_summary_uses_the_loaded_values(self):
+        listing = PropertyListing.objects.get(pk=self.create_listing(ropani=1, price=5_476_000).pk)
+        listing.price = 10_952_000
+        with mock.patch.object(analytics, 'stored_contribution') as stored:
+            listing.save()
+        stored.assert_not_called()
+        self.assertEqual(
+            PricePerAreaSummary.objects.filter(district=self.district).values_list('count', 'total').get(), (1, 2000.0),
+        )
+
+    def test_signature_is_indexed_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            listing = self.create_listing()
+            self.assertFalse(ListingSignature.objects.filter(listing=listing).exists())
+        for callback in callbacks:
+            callback()
+        self.assertTrue(ListingSignature.objects.filter(listing=listing).exists())
+
+    def test_repost_is_flagged_once_committed(self):
+        self.client.force_authenticate(self.user)
+        item = {
+            'listing_purpose': 'SELL', 'property_type': 'HOUSE', 'state': self.state.pk, 'district': self.district.pk,
+            'title': 'Five storey house with garden near Baneshwor chowk', 'ropani': 1,
+            'description': 'Newly built house, south facing, road access on two sides, car parking for two.',
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/add-property/', item, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/add-property/', item, format='json')
+        first, second = PropertyListing.objects.order_by('pk')
+        self.assertEqual(ListingSignature.objects.get(listing=second).duplicate_of_id, first.pk)
+
+
+class ArchiveTests(ListingTestCase):
+    def age(self, listing, days):
+        PropertyListing.objects.filter(pk=listing.pk).update(updated_at=timezone.now() - datetime.timedelta(days=days))
+
+    def test_archives_old_inactive_and_forgotten_listings(self):
+        inactive = self.create_listing(is_active=False)
+        forgotten = self.create_listing()
+        viewed = self.create_listing()
+        recent = self.create_listing(is_active=False)
+        for listing in (inactive, forgotten, viewed):
+            self.age(listing, 400)
+        ListingStats.objects.create(listing=viewed, view_count=3)
+
+        moved = archive.archive_listings()
+
+        self.assertEqual(moved, {ArchivedListing.Reason.INACTIVE: 1, ArchivedListing.Reason.STALE: 1})
+        self.assertEqual(
+            dict(ArchivedListing.objects.values_list('pk', 'reason')),
+            {inactive.pk: ArchivedListing.Reason.INACTIVE, forgotten.pk: ArchivedListing.Reason.STALE},
+        )
+        self.assertCountEqual(PropertyListing.objects.values_list('pk', flat=True), [viewed.pk, recent.pk])
+
+    def test_restore_brings_the_listing_back(self):
+        listing = self.create_listing(is_active=False, title='Flat in Jhamsikhel')
+        self.age(listing, 40)
+        listing.images.create(image='listings/a', is_thumbnail=True)
+        ListingStats.objects.create(listing=listing, view_count=7)
+        archive.archive_listings()
+        self.assertFalse(PropertyListing.objects.filter(pk=listing.pk).exists())
+
+        self.client.force_authenticate(self.user)
+        response = self.client.post(f'/api/archived-properties/{listing.pk}/restore/')
+
+        self.assertEqual(response.status_code, 201)
+        restored = PropertyListing.objects.get(pk=listing.pk)
+        self.assertEqual((restored.title, restored.created_at), ('Flat in Jhamsikhel', listing.created_at))
+        self.assertEqual(restored.images.get().is_thumbnail, True)
+        self.assertEqual(counters.counts([listing.pk])[listing.pk]['view_count'], 7)
+        self.assertFalse(ArchivedListing.objects.exists())
+
+
+class DuplicateListingTests(ListingTestCase):
+    TEXT = {
+        'title': 'Five storey house with garden near Baneshwor chowk',
+        'description': 'Newly built house, south facing, road access on two sides, car parking for two.',
+    }
+
+    def flagged(self, listing):
+        return ListingSignature.objects.get(listing=listing).duplicate_of_id
+
+    def test_reposts_point_at_the_original(self):
+        original, repost, other = self.create_listing(**self.TEXT), self.create_listing(**self.TEXT), self.create_listing()
+        duplicates.index_listings([original, repost, other])
+        third = self.create_listing(**self.TEXT)
+        duplicates.index_listings([third])
+        self.assertEqual(
+            [self.flagged(listing) for listing in (original, repost, other, third)],
+            [None, original.pk, None, original.pk],
+        )
+
+    def test_reindexing_never_points_at_a_later_listing(self):
+        original, repost = self.create_listing(**self.TEXT), self.create_listing(**self.TEXT)
+        duplicates.index_listings([original, repost])
+        original.local_area = 'Baneshwor'
+        duplicates.index_listings([original])
+        self.assertIsNone(self.flagged(original))
+        self.assertEqual(self.flagged(repost), original.pk)
+
+
+class RenderingTests(ListingTestCase):
+    def test_fast_renderer_matches_drf(self):
+        data = {
+            'price': Decimal('1500000.50'), 'at': datetime.datetime(2024, 5, 1, 6, 30, tzinfo=datetime.timezone.utc),
+            'label': gettext_lazy('Sell'), 'nested': [{1: None, 'ok': True}],
+        }
+        self.assertEqual(json.loads(FastJSONRenderer().render(data)), json.loads(JSONRenderer().render(data)))
+
+    def test_bad_json_is_a_400(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/api/add-property/', '{"title": ', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_large_responses_are_gzipped(self):
+        for n in range(20):
+            self.create_listing(title=f'House number {n} in Baneshwor')
+        plain = self.client.get('/api/properties/')
+        response = self.client.get('/api/properties/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+    @override_settings(COMPRESSION_MIN_SIZE=0)
+    def test_auth_responses_are_never_compressed(self):
+        self.create_listing()
+        response = self.client.post('/api/auth/login/', {'username': 'owner', 'password': 'wrong'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(self.client.get('/api/properties/', HTTP_ACCEPT_ENCODING='gzip')['Content-Encoding'], 'gzip')
+
+    def test_encoding_negotiation(self):
+        with mock.patch.object(compression, 'brotli', object()):
+            self.assertEqual(compression.choose_encoding('gzip, br'), 'br')
+            self.assertEqual(compression.choose_encoding('gzip;q=1, br;q=0.5'), 'gzip')
+            self.assertEqual(compression.choose_encoding('*;q=0.1, br;q=0'), 'gzip')
+        with mock.patch.object(compression, 'brotli', None):
+            self.assertEqual(compression.choose_encoding('br'), None)
+            self.assertEqual(compression.choose_encoding('identity, gzip;q=0'), None)
+
+
+class RequestTimingTests(ListingTestCase):
+    def setUp(self):
+        super().setUp()
+        registry.clear()
+
+    def test_server_timing_header(self):
+        listing = self.create_listing()
+        response = self.client.get(f'/api/properties/{listing.pk}/')
+        phases = [part.split(';')[0] for part in response['Server-Timing'].split(', ')]
+        self.assertEqual(phases, ['total', 'db', 'serialize', 'render'])
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+
+    def test_timings_are_labelled_by_view_and_action(self):
+        listing = self.create_listing()
+        self.client.get(f'/api/properties/{listing.pk}/')
+        labels = (('view', 'PropertyListingViewSet'), ('action', 'retrieve'))
+        self.assertGreater(registry.counters[('ktm_db_queries_total', labels)], 0)
+        for phase in ('total', 'db', 'serialize', 'render'):
+            self.assertEqual(sum(registry.histograms[('ktm_request_phase_seconds', labels + (('phase', phase),))].counts), 1)
+
+    def test_metrics_are_for_admins(self):
+        self.client.get('/api/states/')
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        admin = get_user_model().objects.create_user('admin', password='x', is_staff=True)
+        self.client.force_authenticate(admin)
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE ktm_request_phase_seconds histogram', response.content.decode())
+        self.assertIn('view="StateViewSet",action="list",phase="total",le="+Inf"', response.content.decode())
+
+    @override_settings(INSTRUMENTATION_SERVER_TIMING=False)
+    def test_server_timing_can_be_turned_off(self):
+        self.assertFalse(self.client.get('/api/states/').has_header('Server-Timing'))
+
+    def test_window_quantiles(self):
+        histogram = Histogram()
+        for value in [0.003] * 90 + [0.3] * 10:
+            histogram.observe(value, now=1000)
+        quantiles = histogram.window_quantiles(now=1000)
+        self.assertTrue(0.0025 < quantiles[0.5] <= 0.005)
+        self.assertTrue(0.25 < quantiles[0.99] <= 0.5)
+        self.assertEqual(histogram.window_quantiles(now=1000 + WINDOW_SLOTS * WINDOW_SLOT_SECONDS), {})
+
+
+class BlacklistFilterTests(ListingTestCase):
+    def setUp(self):
+        super().setUp()
+        # Pose as a shared cache, with a fresh filter for each test.
+        for target, attr, value in (
+            (revocation, 'cache_is_shared', lambda: True),
+            (revocation, 'blacklist_filter', revocation.BlacklistFilter()),
+        ):
+            patcher = mock.patch.object(target, attr, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_bloom_filter(self):
+        bloom = revocation.BloomFilter(1000)
+        members = [f'member-{n}' for n in range(1000)]
+        for item in members:
+            bloom.add(item)
+        self.assertTrue(all(item in bloom for item in members))
+        false_positives = sum(f'other-{n}' in bloom for n in range(10_000))
+        self.assertLess(false_positives, 300)
+
+    def test_rotated_refresh_tokens_are_rejected(self):
+        token = str(revocation.BloomCheckedRefreshToken.for_user(self.user))
+        first = self.client.post('/api/auth/token/refresh/', {'refresh': token})
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self.client.post('/api/auth/token/refresh/', {'refresh': token}).status_code, 401)
+        self.assertEqual(self.client.post('/api/auth/token/refresh/', {'refresh': first.data['refresh']}).status_code, 200)
+
+    def test_unlisted_tokens_skip_the_blacklist_query(self):
+        revocation.blacklist_filter.might_contain('warm-up')
+        token = revocation.BloomCheckedRefreshToken.for_user(self.user)
+        with self.assertNumQueries(0):
+            token.check_blacklist()
+
+    def test_other_processes_revocations_are_picked_up_after_a_version_bump(self):
+        revocation.blacklist_filter.might_contain('warm-up')
+        token = revocation.BloomCheckedRefreshToken.for_user(self.user)
+        # Blacklisted by "another process": this one's filter isn't told directly.
+        with mock.patch.object(revocation, 'token_blacklisted'), self.captureOnCommitCallbacks():
+            token.blacklist()
+        self.assertFalse(revocation.blacklist_filter.might_contain(token['jti']))
+        revocation.bump_version()
+        self.assertTrue(revocation.blacklist_filter.might_contain(token['jti']))
+        with self.assertRaises(TokenError):
+            token.check_blacklist()
+
+
+class FacilityBitsTests(ListingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.parking, self.garden, self.lift = (Facility.objects.create(name=name) for name in ('Parking', 'Garden', 'Lift'))
+
+    def bits(self, listing):
+        return PropertyListing.objects.values_list('facility_bits', flat=True).get(pk=listing.pk)
+
+    def search(self, *facilities):
+        response = self.client.get('/api/properties/', {'facilities': ','.join(str(f.pk) for f in facilities)})
+        return sorted(item['id'] for item in response.data)
+
+    def test_bits_follow_the_facilities(self):
+        listing = self.create_listing()
+        listing.facilities.set([self.parking, self.garden])
+        self.assertEqual(self.bits(listing), (1 << self.parking.bit) | (1 << self.garden.bit))
+        self.lift.propertylisting_set.add(listing)
+        self.parking.propertylisting_set.clear()
+        self.assertEqual(self.bits(listing), (1 << self.garden.bit) | (1 << self.lift.bit))
+        self.garden.delete()
+        self.assertEqual(self.bits(listing), 1 << self.lift.bit)
+
+    def test_filter_requires_every_facility(self):
+        both, parking_only, neither = self.create_listing(), self.create_listing(), self.create_listing()
+        both.facilities.set([self.parking, self.garden])
+        parking_only.facilities.set([self.parking])
+        self.assertEqual(self.search(self.parking), [both.pk, parking_only.pk])
+        self.assertEqual(self.search(self.parking, self.garden), [both.pk])
+        self.assertEqual(self.search(), [both.pk, parking_only.pk, neither.pk])
+        self.assertEqual(self.client.get('/api/properties/', {'facilities': '999999'}).data, [])
+
+    def test_facilities_without_a_bit_are_joined(self):
+        Facility.objects.filter(pk=self.lift.pk).update(bit=None)
+        with_lift, without = self.create_listing(), self.create_listing()
+        with_lift.facilities.set([self.parking, self.lift])
+        without.facilities.set([self.parking])
+        self.assertEqual(self.search(self.parking, self.lift), [with_lift.pk])
+
+
+class SortOrderTests(ListingTestCase):
+    def ordered(self, ordering, **params):
+        response = self.client.get('/api/properties/', {'ordering': ordering, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data]
+
+    def test_price_orders_break_ties_by_id(self):
+        cheap, dear, also_cheap = (self.create_listing(price=price) for price in (5_000_000, 9_000_000, 5_000_000))
+        self.assertEqual(self.ordered('price'), [cheap.pk, also_cheap.pk, dear.pk])
+        self.assertEqual(self.ordered('-price'), [dear.pk, also_cheap.pk, cheap.pk])
+
+    def test_newest_is_newest_first(self):
+        older, newer = self.create_listing(), self.create_listing()
+        PropertyListing.objects.filter(pk=older.pk).update(created_at=timezone.now() - datetime.timedelta(days=1))
+        self.assertEqual(self.ordered('newest'), [newer.pk, older.pk])
+        self.assertEqual(self.ordered('-newest'), [older.pk, newer.pk])
+
+    def test_rent_is_compared_per_month(self):
+        monthly = self.create_listing(listing_purpose='RENT', price=None, rent_amount=30_000, frequency='MONTHLY')
+        yearly = self.create_listing(listing_purpose='RENT', price=None, rent_amount=300_000, frequency='YEARLY')
+        self.create_listing()
+        self.assertEqual(yearly.monthly_rent, Decimal('25000.00'))
+        self.assertEqual(self.ordered('rent'), [yearly.pk, monthly.pk])
+
+    def test_sort_keys_follow_their_inputs(self):
+        small, large = self.create_listing(ropani=1, price=5_476_000), self.create_listing(ropani=4, price=10_952_000)
+        self.assertEqual(self.ordered('price_per_sqft'), [large.pk, small.pk])
+        listing = PropertyListing.objects.get(pk=small.pk)
+        listing.price = 1_000_000
+        listing.save()
+        self.assertEqual(PropertyListing.objects.get(pk=small.pk).price_per_sqft, 1_000_000 / 5476)
+        self.assertEqual(self.ordered('price_per_sqft'), [small.pk, large.pk])
+
+    def test_orders_leave_out_inactive_listings_and_combine_with_filters(self):
+        active, _ = self.create_listing(), self.create_listing(is_active=False)
+        self.create_listing(property_type='LAND')
+        self.assertEqual(self.ordered('area', property_type='HOUSE'), [])
+        self.assertEqual(self.ordered('price', property_type='HOUSE'), [active.pk])
+
+    def test_unknown_ordering(self):
+        self.assertEqual(self.client.get('/api/properties/', {'ordering': 'title'}).status_code, 400)
+
+
+class LocationSuggestTests(ListingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.kathmandu = District.objects.get(name='Kathmandu')
+
+    def suggest(self, q, **params):
+        response = self.client.get('/api/locations/suggest/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(item['type'], item['name'], item['listings']) for item in response.data]
+
+    def local_areas(self, q):
+        return [suggestion for suggestion in self.suggest(q) if suggestion[0] == 'local_area']
+
+    def test_whole_name_prefixes_rank_first_then_by_listings(self):
+        self.create_listing(district=self.kathmandu, state=self.kathmandu.state, local_area='Kapan')
+        # Equally busy places: the shorter name first.
+        self.assertEqual(
+            self.suggest('ka', limit=3),
+            [('local_area', 'Kapan', 1), ('district', 'Kathmandu', 1), ('district', 'Kaski', 0)],
+        )
+        self.assertEqual(self.suggest('west'), [('district', 'Rukum West', 0)])
+
+    def test_misspellings_find_fuzzy_matches(self):
+        self.create_listing(local_area='Budhanilkantha')
+        self.assertEqual(self.suggest('budanilkantha'), [('local_area', 'Budhanilkantha', 1)])
+
+    def test_counts_follow_listing_changes(self):
+        listing = self.create_listing(local_area='Jhamsikhel')
+        self.assertEqual(self.local_areas('jhams'), [('local_area', 'Jhamsikhel', 1)])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_listing(local_area=' jhamsikhel ')
+        self.assertEqual(self.local_areas('jhams'), [('local_area', 'Jhamsikhel', 2)])
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.is_active = False
+            listing.save()
+        self.assertEqual(self.local_areas('jhams'), [('local_area', 'Jhamsikhel', 1)])
+        with self.captureOnCommitCallbacks(execute=True):
+            PropertyListing.objects.get(local_area=' jhamsikhel ').delete()
+        self.assertEqual(self.local_areas('jhams'), [])
+
+
+@override_settings(LISTING_CHANGES_LAG_SECONDS=0)
+class SnapshotTests(ListingTestCase):
+    def setUp(self):
+        super().setUp()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        snapshot_settings = override_settings(
+            LISTING_SNAPSHOT_ROOT=root, LISTING_SNAPSHOT_STATE_PATH=os.path.join(root, 'state.json'),
+        )
+        snapshot_settings.enable()
+        self.addCleanup(snapshot_settings.disable)
+        patcher = mock.patch.object(snapshots, 'manifest', snapshots.Manifest())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.other_district = District.objects.exclude(pk=self.district.pk).order_by('pk').first()
+
+    def create_listing(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return super().create_listing(**fields)
+
+    def fetch(self, url, **headers):
+        response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_lists_redirect_to_a_snapshot_of_the_same_payload(self):
+        listing = self.create_listing()
+        self.create_listing(district=self.other_district)
+        self.client.force_authenticate(self.user)
+        live = self.client.get('/api/properties/', {'district': self.district.pk})
+        self.client.force_authenticate(None)
+        snapshots.build()
+
+        response = self.client.get('/api/properties/', {'district': self.district.pk})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual([item['id'] for item in json.loads(self.fetch(response.url))], [listing.pk])
+        self.assertEqual(json.loads(self.fetch(response.url)), json.loads(live.content))
+        compressed = self.fetch(response.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(json.loads(gzip.decompress(compressed)), json.loads(live.content))
+
+    def test_only_exact_slices_fresh_manifests_and_anonymous_requests_redirect(self):
+        self.create_listing()
+        snapshots.build()
+        self.assertEqual(self.client.get('/api/properties/', {'district': self.district.pk, 'min_price': 1}).status_code, 200)
+        self.assertEqual(self.client.get('/api/properties/', {'listing_purpose': 'SELL', 'property_type': 'HOUSE'}).status_code, 302)
+        with override_settings(LISTING_SNAPSHOT_MAX_AGE=-1):
+            self.assertEqual(self.client.get('/api/properties/', {'district': self.district.pk}).status_code, 200)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/properties/', {'district': self.district.pk}).status_code, 200)
+
+    def test_rebuilds_render_the_slices_a_listing_left_and_joined(self):
+        listing = self.create_listing()
+        snapshots.build()
+        self.assertEqual(snapshots.build(), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.district = self.other_district
+            listing.save()
+        # The listing is still in its purpose/type slice, whose payload changed too.
+        self.assertEqual(
+            snapshots.build(), sorted([f'district-{self.district.pk}', f'district-{self.other_district.pk}', 'sell-house']),
+        )
+        slices = snapshots.load_state()['slices']
+        self.assertEqual((slices[f'district-{self.district.pk}']['ids'], slices[f'district-{self.other_district.pk}']['ids']), ([], [listing.pk]))
+
+
+class ListingImagesTests(ListingTestCase):
+    def add_images(self, listing, count, thumbnail=None):
+        return [
+            listing.images.create(image=f'listings/{listing.pk}-{n}', is_thumbnail=(n == thumbnail))
+            for n in range(count)
+        ]
+
+    def card_images(self):
+        return {item['id']: [image['id'] for image in item['images']] for item in self.client.get('/api/properties/').data}
+
+    def test_cards_carry_the_thumbnail_or_first_image(self):
+        with_thumbnail, without_thumbnail, bare = self.create_listing(), self.create_listing(), self.create_listing()
+        thumbnail = self.add_images(with_thumbnail, 3, thumbnail=2)[2]
+        first = self.add_images(without_thumbnail, 2)[0]
+        self.assertEqual(
+            self.card_images(), {with_thumbnail.pk: [thumbnail.pk], without_thumbnail.pk: [first.pk], bare.pk: []},
+        )
+        detail = self.client.get(f'/api/properties/{with_thumbnail.pk}/')
+        self.assertEqual(len(detail.data['images']), 3)
+
+    def test_list_queries_dont_grow_with_the_page(self):
+        def list_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get('/api/properties/')
+            return len(queries)
+
+        self.add_images(self.create_listing(), 2)
+        list_queries()  # Warm the reference data caches.
+        few = list_queries()
+        for _ in range(4):
+            self.add_images(self.create_listing(), 2)
+        self.assertEqual(list_queries(), few)
+
+    def test_gallery_pages_start_with_the_thumbnail(self):
+        listing = self.create_listing()
+        images = self.add_images(listing, 5, thumbnail=3)
+        first = self.client.get(f'/api/properties/{listing.pk}/images/', {'page_size': 2})
+        self.assertEqual([image['id'] for image in first.data['results']], [images[3].pk, images[0].pk])
+        self.assertEqual(first.data['count'], 5)
+        last = self.client.get(f'/api/properties/{listing.pk}/images/', {'page_size': 2, 'page': 3})
+        self.assertEqual([image['id'] for image in last.data['results']], [images[4].pk])
+
+
+class ReferenceDataTests(ListingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.facilities = [Facility.objects.create(name=f'Facility {n}') for n in range(6)]
+
+    def payload(self, **fields):
+        return {
+            'listing_purpose': 'SELL', 'property_type': 'LAND', 'title': 'Plot in Kapan',
+            'state': self.state.pk, 'district': self.district.pk, 'facilities': [f.pk for f in self.facilities], **fields,
+        }
+
+    def test_validation_reads_ids_from_memory(self):
+        reference_data.get_tables()
+        serializer = PropertyListingCreateSerializer(data=self.payload())
+        with self.assertNumQueries(0):
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.validated_data['facilities'], self.facilities)
+
+    def test_unknown_ids_cost_one_query_per_table(self):
+        reference_data.get_tables()
+        serializer = PropertyListingCreateSerializer(data=self.payload(facilities=[self.facilities[0].pk, 999_998, 999_999]))
+        with self.assertNumQueries(1):
+            self.assertFalse(serializer.is_valid())
+        self.assertEqual(list(serializer.errors), ['facilities'])
+
+    def test_ids_added_by_another_process_are_found(self):
+        reference_data.get_tables()
+        # Written without the signals, as another process's write looks here.
+        added = Facility.objects.bulk_create([Facility(name='Solar water heater')])[0]
+        self.assertEqual(reference_data.get(Facility, added.pk), added)
+
+    def test_writes_reload_the_copy(self):
+        district = reference_data.get(District, self.district.pk)
+        District.objects.filter(pk=district.pk).update(name='Renamed')
+        self.assertEqual(reference_data.get(District, district.pk).name, district.name)
+        self.district.name = 'Renamed'
+        self.district.save()
+        self.assertEqual(reference_data.get(District, district.pk).name, 'Renamed')
+
+    def test_districts_must_be_in_the_state(self):
+        other_state = State.objects.exclude(pk=self.state.pk).first()
+        serializer = PropertyListingCreateSerializer(data=self.payload(state=other_state.pk))
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(list(serializer.errors), ['district'])
+
+
+class ThrottleTests(ListingTestCase):
+    RATES = {'anon_read': '2/min', 'anon_read.locations': '4/min', 'user_write': '2/min', 'auth': '2/min', 'contact': '2/min'}
+
+    def throttled(self, **rates):
+        return override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {**self.RATES, **rates}})
+
+    def test_anonymous_reads_are_throttled(self):
+        with self.throttled():
+            codes = [self.client.get('/api/states/').status_code for _ in range(3)]
+        self.assertEqual(codes, [200, 200, 429])
+
+    def test_endpoint_scope_has_its_own_rate_and_bucket(self):
+        with self.throttled():
+            self.client.get('/api/states/')
+            self.client.get('/api/states/')
+            codes = [self.client.get('/api/locations/suggest/?q=ka').status_code for _ in range(5)]
+        self.assertEqual(codes, [200, 200, 200, 200, 429])
+
+    def test_token_refresh_uses_the_auth_throttle(self):
+        with self.throttled():
+            codes = [self.client.post('/api/auth/token/refresh/', {'refresh': 'bogus'}, format='json').status_code for _ in range(3)]
+        self.assertNotEqual(codes[0], 429)
+        self.assertEqual(codes[2], 429)
+
+    def test_anonymous_contact_requests_are_throttled(self):
+        listing = self.create_listing()
+        with self.throttled():
+            codes = [self.client.post(f'/api/properties/{listing.pk}/contact/').status_code for _ in range(3)]
+        self.assertEqual(codes, [204, 204, 429])
+
+    def test_user_writes_are_throttled_per_user(self):
+        self.client.force_authenticate(self.user)
+        item = {'listing_purpose': 'SELL', 'property_type': 'LAND', 'title': 'Plot'}
+        with self.throttled():
+            codes = [self.client.post('/api/add-property/', item, format='json').status_code for _ in range(3)]
+            # Reads by the same user are not writes.
+            self.assertEqual(self.client.get('/api/add-property/').status_code, 200)
+        self.assertEqual(codes, [201, 201, 429])
+
+
+def jpeg(color, size=(64, 48), quality=90, reverse=False):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    image = Image.new('RGB', size, color)
+    # A gradient across the lower half, so the picture has some structure to hash.
+    for x in range(size[0]):
+        shade = (size[0] - 1 - x if reverse else x) * 255 // size[0]
+        image.paste((shade, shade, shade), (x, size[1] // 2, x + 1, size[1]))
+    image.save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def fake_upload(source, folder, public_id, **options):
+    return {'public_id': f'{folder}/{public_id}'}
+
+
+@override_settings(JOB_SPOOL_DIR='')
+class AdminImageUploadTests(ListingTestCase):
+    def save_with_images(self, listing, *files):
+        request = RequestFactory().post('/admin/', {'upload_new_images': list(files)})
+        request.user = self.user
+        model_admin = site._registry[PropertyListing]
+        model_admin.save_model(request, listing, form=None, change=True)
+
+    @mock.patch('cloudinary.uploader.upload', side_effect=fake_upload)
+    def test_uploads_inline_without_a_spool_dir(self, upload):
+        listing = self.create_listing()
+        self.save_with_images(listing, SimpleUploadedFile('front.jpg', jpeg((10, 120, 200)), 'image/jpeg'))
+        self.assertEqual(upload.call_count, 1)
+        self.assertEqual(listing.images.count(), 1)
+        self.assertEqual(ImageAsset.objects.count(), 1)
+
+    @mock.patch('cloudinary.uploader.upload', side_effect=fake_upload)
+    def test_same_file_is_not_uploaded_again(self, upload):
+        first, second = self.create_listing(), self.create_listing()
+        data = jpeg((10, 120, 200))
+        self.save_with_images(first, SimpleUploadedFile('front.jpg', data, 'image/jpeg'))
+        self.save_with_images(second, SimpleUploadedFile('copy.jpg', data, 'image/jpeg'))
+        self.assertEqual(upload.call_count, 1)
+        self.assertEqual(str(second.images.get().image), str(first.images.get().image))
+        self.assertEqual(ImageAsset.objects.get().reuse_count, 1)
+
+
+class StoredImageLookupTests(ListingTestCase):
+    def test_ids_match_exactly(self):
+        listing = self.create_listing()
+        PropertyImage.objects.create(property_listing=listing, image='property_images/1-house/front-12')
+        self.assertTrue(tasks.image_in_use('property_images/1-house/front-12'))
+        self.assertFalse(tasks.image_in_use('property_images/1-house/front-1'))
+        self.assertFalse(tasks.image_in_use('1-house/front-12'))
+
+    def test_full_form_matches(self):
+        listing = self.create_listing()
+        PropertyImage.objects.create(property_listing=listing, image='image/upload/v1712/property_images/1-house/front-12.jpg')
+        self.assertTrue(tasks.image_in_use('property_images/1-house/front-12'))
+        self.assertFalse(tasks.image_in_use('property_images/1-house/front-1'))
+
+    def test_attach_does_not_mistake_a_prefix_for_the_same_image(self):
+        listing = self.create_listing()
+        PropertyImage.objects.create(property_listing=listing, image='property_images/1-house/front-12')
+        hashes = image_dedup.Hashes('0' * 64, None, 100, None, None)
+        asset = image_dedup.record_asset('property_images/1-house/front-1', hashes)
+        self.assertTrue(image_dedup.attach(listing.pk, asset, 100))
+        self.assertEqual(listing.images.count(), 2)
+
+
+@override_settings(EDGE_CACHE_PURGE={'CLIENT': 'ktmpropertyhub.edge_cache.FakePurgeClient'}, JOB_WORKERS=True)
+class EdgeCachePurgeTests(ListingTestCase):
+    def purged(self):
+        return {key for job in Job.objects.filter(name='purge_edge_cache') for key in job.payload['keys']}
+
+    def test_listing_change_purges_its_location_not_every_list(self):
+        listing = self.create_listing()
+        Job.objects.all().delete()
+        listing.title = 'Renamed'
+        listing.save()
+        self.assertEqual(self.purged(), {
+            f'listing-{listing.pk}', f'listings-district-{self.district.pk}', f'listings-state-{self.state.pk}',
+        })
+
+    def test_move_purges_both_locations(self):
+        listing = self.create_listing()
+        other = District.objects.exclude(state=self.state).select_related('state').first()
+        Job.objects.all().delete()
+        listing.district, listing.state = other, other.state
+        listing.save()
+        self.assertTrue({
+            f'listings-district-{self.district.pk}', f'listings-district-{other.pk}',
+            f'listings-state-{self.state.pk}', f'listings-state-{other.state.pk}',
+        } <= self.purged())
+
+    def test_bulk_update_purges_the_listings_locations(self):
+        listing = self.create_listing()
+        Job.objects.all().delete()
+        self.client.force_authenticate(self.user)
+        self.client.patch('/api/add-property/bulk/', [{'id': listing.pk, 'title': 'Renamed'}], format='json')
+        self.assertEqual(self.purged(), {
+            f'listing-{listing.pk}', f'listings-district-{self.district.pk}', f'listings-state-{self.state.pk}',
+        })
+
+    @override_settings(JOB_WORKERS=False)
+    def test_without_workers_purges_are_sent_on_commit(self):
+        client = edge_cache.get_client()
+        client.purged.clear()
+        with self.captureOnCommitCallbacks() as callbacks:
+            listing = self.create_listing()
+        self.assertEqual(client.purged, [])
+        for callback in callbacks:
+            callback()
+        self.assertIn(f'listing-{listing.pk}', client.purged_keys())
+        self.assertFalse(Job.objects.exists())
+
+    def test_saves_of_hidden_fields_purge_nothing(self):
+        listing = self.create_listing()
+        Job.objects.all().delete()
+        listing.facility_bits = 1
+        listing.save(update_fields=['facility_bits'])
+        self.assertEqual(self.purged(), set())
+
+    def test_lists_carry_the_keys_of_the_locations_they_cover(self):
+        self.create_listing()
+        response = self.client.get(f'/api/properties/?district={self.district.pk}')
+        keys = response['Surrogate-Key'].split()
+        self.assertIn(f'listings-district-{self.district.pk}', keys)
+        self.assertNotIn(f'listings-state-{self.state.pk}', keys)
+        keys = self.client.get('/api/properties/')['Surrogate-Key'].split()
+        self.assertTrue({f'listings-state-{pk}' for pk in State.objects.values_list('pk', flat=True)} <= set(keys))
+
+
+class ImageDedupTests(ListingTestCase):
+    def store(self, listing, data, name):
+        hashes = image_dedup.hash_upload(SimpleUploadedFile(f'{name}.jpg', data, 'image/jpeg'))
+        tasks.store_listing_image(listing.pk, io.BytesIO(data), hashes, 'property_images', name)
+
+    @mock.patch('cloudinary.uploader.upload', side_effect=fake_upload)
+    def test_reencoded_copy_is_attached_without_uploading(self, upload):
+        first, second = self.create_listing(), self.create_listing()
+        self.store(first, jpeg((10, 120, 200), quality=95), 'front')
+        self.store(second, jpeg((10, 120, 200), quality=70), 'front-copy')
+        self.assertEqual(upload.call_count, 1)
+        self.assertEqual(str(second.images.get().image), 'property_images/front')
+
+    @mock.patch('cloudinary.uploader.upload', side_effect=fake_upload)
+    def test_different_pictures_are_both_uploaded(self, upload):
+        listing = self.create_listing()
+        self.store(listing, jpeg((10, 120, 200)), 'front')
+        self.store(listing, jpeg((10, 120, 200), reverse=True), 'back')
+        self.assertEqual(upload.call_count, 2)
+        self.assertEqual(listing.images.count(), 2)
+
+    def test_attach_is_idempotent(self):
+        listing = self.create_listing()
+        asset = image_dedup.record_asset('property_images/front', image_dedup.Hashes('0' * 64, None, 100, None, None))
+        self.assertTrue(image_dedup.attach(listing.pk, asset, 100))
+        self.assertTrue(image_dedup.attach(listing.pk, asset, 100))
+        self.assertEqual(listing.images.count(), 1)
+        asset.refresh_from_db()
+        self.assertEqual((asset.reuse_count, asset.bytes_saved), (1, 100))
+
+    def test_attach_fails_once_the_asset_is_deleted(self):
+        listing = self.create_listing()
+        asset = image_dedup.record_asset('property_images/front', image_dedup.Hashes('0' * 64, None, 100, None, None))
+        ImageAsset.objects.filter(pk=asset.pk).delete()
+        self.assertFalse(image_dedup.attach(listing.pk, asset, 100))
+        self.assertFalse(listing.images.exists())
+
+
+class ImageDeletionTests(ListingTestCase):
+    def delete_image(self):
+        listing = self.create_listing()
+        PropertyImage.objects.create(property_listing=listing, image='property_images/front')
+        with self.captureOnCommitCallbacks(execute=True):
+            PropertyImage.objects.get().delete()
+
+    @override_settings(JOB_WORKERS=False)
+    @mock.patch('cloudinary.uploader.destroy')
+    def test_without_workers_the_image_is_deleted_on_commit(self, destroy):
+        self.delete_image()
+        destroy.assert_called_once_with('property_images/front', resource_type='image', invalidate=True)
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(JOB_WORKERS=False)
+    @mock.patch('cloudinary.uploader.destroy', side_effect=OSError)
+    def test_without_workers_a_failed_deletion_is_queued(self, destroy):
+        self.delete_image()
+        self.assertEqual(Job.objects.get().name, 'delete_cloudinary_image')
+
+    @override_settings(JOB_WORKERS=True)
+    @mock.patch('cloudinary.uploader.destroy')
+    def test_with_workers_the_deletion_is_queued(self, destroy):
+        self.delete_image()
+        destroy.assert_not_called()
+        self.assertEqual(Job.objects.get().payload, {'public_id': 'property_images/front'})
@@ -0,0 +1,173 @@
+"""
+Token-bucket throttles whose state lives in the shared cache.
+
+DRF's built-in throttles keep a list of request timestamps per client and
+rewrite it with a non-atomic get/set on every request, which is both racy
+under concurrency and expensive for busy clients. Here each client gets a
+token bucket of `capacity` tokens refilled at `capacity / period` tokens per
+second, stored as a single counter updated with atomic `cache.incr`:
+
+Time is divided into epochs. Within an epoch the bucket has been granted
+`capacity + (now - epoch_start) * refill_rate` tokens in total, and the counter
+records how many were taken; a request is allowed while taken <= granted.
+If a client was idle long enough for the bucket to overflow, the counter is
+bumped so that at most `capacity` tokens are available - exactly a token
+bucket. A new epoch starts a new key (at full capacity), which also lets old
+keys simply expire.
+
+Rates use DRF's "N/period" syntax in `REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']`
+and are looked up per endpoint: a view with `throttle_scope = 'properties'`
+uses the 'anon_read.properties' rate if one is configured and falls back to
+'anon_read' otherwise, with a separate bucket per endpoint scope.
+"""
+import math
+import time
+
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from .metrics import registry
+
+EPOCH_SECONDS = 3600
+
+registry.describe('ktm_throttled_requests_total', "Requests rejected by a throttle, per scope.")
+
+
+def parse_rate(rate):
+    """
+    '120/min' -> (120, 60). Accepts the same periods as DRF: s, m, h, d.
+    """
+    num, period = rate.split('/')
+    return int(num), {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Base class. Subclasses set `scope` and implement `get_ident_key()`,
+    returning None for requests the throttle does not apply to.
+    """
+    scope = None
+    cache_alias = 'default'
+
+    def get_ident_key(self, request, view):
+        raise NotImplementedError
+
+    def get_rate(self, view):
+        rates = api_settings.DEFAULT_THROTTLE_RATES
+        endpoint_scope = getattr(view, 'throttle_scope', None)
+        if endpoint_scope and f'{self.scope}.{endpoint_scope}' in rates:
+            return f'{self.scope}.{endpoint_scope}', rates[f'{self.scope}.{endpoint_scope}']
+        try:
+            return self.scope, rates[self.scope]
+        except KeyError:
+            raise ImproperlyConfigured(f"No throttle rate set for scope '{self.scope}'.")
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        ident = self.get_ident_key(request, view)
+        if ident is None:
+            return True
+        scope, rate = self.get_rate(view)
+        if rate is None:
+            return True
+
+        capacity, period = parse_rate(rate)
+        refill = capacity / period
+        now = time.time()
+        epoch = int(now // EPOCH_SECONDS)
+        granted = capacity + int((now - epoch * EPOCH_SECONDS) * refill)
+
+        cache = caches[self.cache_alias]
+        key = f'throttle:{scope}:{ident}:{epoch}'
+        cache.add(key, 0, EPOCH_SECONDS + 60)
+        try:
+            taken = cache.incr(key)
+        except ValueError:
+            # The key expired between add() and incr(); start afresh.
+            cache.set(key, 1, EPOCH_SECONDS + 60)
+            taken = 1
+
+        # Tokens above capacity that accrued while the client was idle are
+        # lost. Only one request per second does the clamping, so concurrent
+        # requests can't each bump the counter and drain the bucket.
+        overflow = granted - capacity - taken + 1
+        if overflow > 0 and cache.add(f'{key}:clamp', 1, 1):
+            taken = cache.incr(key, overflow)
+
+        if taken <= granted:
+            return True
+
+        # Denied requests don't consume a token.
+        cache.decr(key)
+        self.wait_seconds = max(math.ceil((taken - granted) / refill), 1)
+        registry.inc('ktm_throttled_requests_total', (('scope', scope),))
+        return False
+
+    def wait(self):
+        return self.wait_seconds
+
+
+def is_auth_endpoint(view):
+    """
+    dj_rest_auth's views, and our own views standing in for them, which mark
+    themselves with `throttle_scope = 'auth'`.
+    """
+    return getattr(view, 'throttle_scope', None) == 'auth' or type(view).__module__.startswith('dj_rest_auth')
+
+
+class AnonReadThrottle(TokenBucketThrottle):
+    """
+    Reads (GET/HEAD/OPTIONS) by anonymous clients, keyed by IP address.
+    """
+    scope = 'anon_read'
+
+    def get_ident_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') or is_auth_endpoint(view):
+            return None
+        return self.get_ident(request)
+
+
+class UserWriteThrottle(TokenBucketThrottle):
+    """
+    Writes by authenticated users, keyed by user id.
+    """
+    scope = 'user_write'
+
+    def get_ident_key(self, request, view):
+        if not (request.user and request.user.is_authenticated):
+            return None
+        if request.method in ('GET', 'HEAD', 'OPTIONS') or is_auth_endpoint(view):
+            return None
+        return request.user.pk
+
+
+class AuthEndpointThrottle(TokenBucketThrottle):
+    """
+    Every request to the dj_rest_auth endpoints (login, registration,
+    password reset, token refresh, ...), keyed by IP address so that
+    credential stuffing can't get around it by switching accounts.
+    """
+    scope = 'auth'
+
+    def get_ident_key(self, request, view):
+        if not is_auth_endpoint(view):
+            return None
+        return self.get_ident(request)
+
+
+class ContactThrottle(TokenBucketThrottle):
+    """
+    Requests for a listing owner's contact details, which count towards the
+    listing's stats, keyed by user id or, for anonymous clients, IP address.
+    Set on the view itself, as the other throttles leave anonymous writes alone.
+    """
+    scope = 'contact'
+
+    def get_ident_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return self.get_ident(request)
@@ -1,7 +1,10 @@
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import PropertyListingViewSet, StateViewSet, DistrictViewSet, AddPropertyViewSet
+from .views import (
+    PropertyListingViewSet, StateViewSet, DistrictViewSet, AddPropertyViewSet, SavedSearchViewSet,
+    PricePerAreaAnalyticsView, MetricsView, TokenRefreshView, LocationSuggestView, ArchivedListingViewSet,
+)
 
 # --- API ROUTER CONFIGURATION ---
 # Create a router to automatically generate the API URLs.
@@ -14,17 +17,34 @@ router.register(r'districts', DistrictViewSet, basename='district')
 # It's for logged-in users to manage their own properties
 router.register(r'add-property', AddPropertyViewSet, basename='add-new-property')
 
+# Logged-in users' saved searches and their matches (alerts)
+router.register(r'saved-searches', SavedSearchViewSet, basename='saved-search')
+
+# Archived (inactive or stale) listings: read and restore your own, or any as an admin
+router.register(r'archived-properties', ArchivedListingViewSet, basename='archived-listing')
+
 # --- MAIN URL PATTERNS ---
 # This is the master list of URL patterns for your project.
 urlpatterns = [
     # 1. The URL for the Django Admin Panel
     path('admin/', admin.site.urls),
 
+    # Price per sqft analytics, served from the pre-aggregated summary table
+    path('api/analytics/price-per-sqft/', PricePerAreaAnalyticsView.as_view(), name='price-per-sqft-analytics'),
+
+    # Request timing metrics in Prometheus format (admin only)
+    path('api/metrics/', MetricsView.as_view(), name='metrics'),
+
+    # Search box typeahead for local areas, districts and states
+    path('api/locations/suggest/', LocationSuggestView.as_view(), name='location-suggest'),
+
     # 2. The URLs for your API, nested under the '/api/' path
     # This will include '/api/properties/', '/api/properties/<id>/', etc.
     path('api/', include(router.urls)),
 
     # --- SECURE AUTHENTICATION ENDPOINTS ---
+    # Overrides dj_rest_auth's refresh view, so it must come before its URLs.
+    path('api/auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/auth/', include('dj_rest_auth.urls')),
     path('api/auth/registration/', include('dj_rest_auth.registration.urls')),
 ]
\ No newline at end of file
@@ -1,17 +1,42 @@
-from rest_framework import viewsets, permissions, mixins
+from rest_framework import viewsets, permissions, mixins, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework.exceptions import ValidationError
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.settings import api_settings
+from rest_framework.pagination import PageNumberPagination
+from django.http import HttpResponse, HttpResponseRedirect
+from dj_rest_auth.jwt_auth import get_refresh_view
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import PropertyListing, State, District
-from .serializers import PropertyListingSerializer, StateSerializer, DistrictSerializer, PropertyListingCreateSerializer
+from .models import PropertyListing, State, District, SavedSearch, PricePerAreaSummary, ArchivedListing
+from . import analytics, archive, bulk, changes, counters, facility_bits, locations, similarity, snapshots
+from .metrics import registry
+from .edge_cache import EdgeCacheMixin, list_keys, listing_keys
+from .overload import LoadControlMixin
+from .throttling import ContactThrottle
+from .authentication import ClaimsOnlyJWTAuthentication
+from .serializers import (
+    PropertyListingSerializer, StateSerializer, DistrictSerializer, PropertyListingCreateSerializer,
+    SavedSearchSerializer, TokenRefreshSerializer, ArchivedListingSerializer,
+    PropertyListingCardSerializer, PropertyImageSerializer, card_images_prefetch,
+)
 from django_filters import rest_framework as filters
 
-class StateViewSet(viewsets.ReadOnlyModelViewSet):
+class StateViewSet(EdgeCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint that allows states to be viewed.
     """
     queryset = State.objects.all().order_by('name')
     serializer_class = StateSerializer
+    edge_cache_policy = 'reference'
+    surrogate_collection = 'states'
 
-class DistrictViewSet(viewsets.ReadOnlyModelViewSet):
+    def get_surrogate_keys(self, response):
+        rows = response.data if isinstance(response.data, list) else [response.data]
+        return [f"state-{row['id']}" for row in rows]
+
+class DistrictViewSet(EdgeCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint that allows districts to be viewed.
     Can be filtered by state_id, e.g., /api/districts/?state=1
@@ -20,16 +45,62 @@ class DistrictViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = DistrictSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['state'] # Enable filtering by the 'state' foreign key
+    edge_cache_policy = 'reference'
+    surrogate_collection = 'districts'
+
+    def get_surrogate_keys(self, response):
+        rows = response.data if isinstance(response.data, list) else [response.data]
+        return [f"district-{row['id']}" for row in rows]
+
+class ImagePagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    pass
 
 class PropertyFilter(filters.FilterSet):
     min_sqft = filters.NumberFilter(field_name="total_land_area_sqft", lookup_expr='gte')
     max_sqft = filters.NumberFilter(field_name="total_land_area_sqft", lookup_expr='lte')
+    min_price = filters.NumberFilter(field_name="price", lookup_expr='gte')
+    max_price = filters.NumberFilter(field_name="price", lookup_expr='lte')
+    # Listings having ALL the given facilities, e.g. ?facilities=1,4,7
+    facilities = NumberInFilter(method='filter_facilities')
+
+    # ?ordering=price, ?ordering=-rent, ... Each order is served by an index
+    # (see PropertyListing.Meta.indexes); the id tie-breaker keeps pages
+    # stable. Sorting by a value leaves out listings that don't have one,
+    # e.g. sale listings when sorting by rent.
+    ORDERINGS = {
+        'newest': 'created_at',
+        'price': 'price',
+        'area': 'total_land_area_sqft',
+        'rent': 'monthly_rent',
+        'price_per_sqft': 'price_per_sqft',
+    }
+    ordering = filters.ChoiceFilter(
+        method='order_listings',
+        choices=[(f'{sign}{name}', f'{sign}{name}') for name in ORDERINGS for sign in ('', '-')],
+    )
 
     class Meta:
         model = PropertyListing
-        fields = ['listing_purpose', 'property_type', 'state', 'district', 'min_sqft', 'max_sqft']
+        fields = ['listing_purpose', 'property_type', 'state', 'district', 'min_sqft', 'max_sqft', 'min_price', 'max_price', 'facilities']
+
+    def filter_facilities(self, queryset, name, value):
+        return facility_bits.filter_has_all(queryset, value)
 
-class PropertyListingViewSet(viewsets.ReadOnlyModelViewSet):
+    def order_listings(self, queryset, name, value):
+        descending = value.startswith('-')
+        field = self.ORDERINGS[value.lstrip('-')]
+        # "newest" reads naturally as newest first.
+        if value.lstrip('-') == 'newest':
+            descending = not descending
+        prefix = '-' if descending else ''
+        return queryset.filter(**{f'{field}__isnull': False}).order_by(f'{prefix}{field}', f'{prefix}id')
+
+class PropertyListingViewSet(EdgeCacheMixin, LoadControlMixin, viewsets.ReadOnlyModelViewSet):
     """
     A simple ViewSet for viewing property listings.
     
@@ -41,8 +112,20 @@ class PropertyListingViewSet(viewsets.ReadOnlyModelViewSet):
     /api/properties/?purpose=RENT
     /api/properties/?property_type=HOUSE
     """
-    queryset = PropertyListing.objects.filter(is_active=True).prefetch_related('facilities', 'images')
+    queryset = PropertyListing.objects.filter(is_active=True).select_related('user', 'state', 'district')
     serializer_class = PropertyListingSerializer
+
+    # Actions that return lists of listings, which carry only the card image.
+    CARD_ACTIONS = ('list', 'similar')
+
+    # Statement timeout and concurrency limit (see overload.py).
+    load_scope = 'properties'
+    expensive_actions = ('list', 'similar', 'change_feed')
+
+    # Edge caching (see edge_cache.py). Not `retrieve`, which counts views,
+    # nor the change feed, whose cursors must see new changes at once.
+    edge_cache_policy = 'listings'
+    edge_cache_actions = ('list', 'similar', 'gallery')
     
     # --- Filtering Configuration ---
     filter_backends = [DjangoFilterBackend]
@@ -51,6 +134,136 @@ class PropertyListingViewSet(viewsets.ReadOnlyModelViewSet):
     # Use our new custom filter class
     filterset_class = PropertyFilter # GET /api/properties/?min_sqft=1000&max_sqft=2000
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'gallery':
+            return queryset
+        if self.action in self.CARD_ACTIONS:
+            return queryset.prefetch_related('facilities', card_images_prefetch())
+        return queryset.prefetch_related('facilities', 'images')
+
+    def get_serializer_class(self):
+        if self.action in self.CARD_ACTIONS:
+            return PropertyListingCardSerializer
+        return super().get_serializer_class()
+
+    def get_surrogate_keys(self, response):
+        if self.action == 'gallery':
+            return [f"listing-{self.kwargs['pk']}"]
+        # Lists can gain any new listing in the locations they cover.
+        keys = ['listings']
+        if self.action == 'similar':
+            keys.append(f"listing-{self.kwargs['pk']}")
+            keys.extend(list_keys())
+        else:
+            params = self.request.query_params
+            keys.extend(list_keys(
+                int(params['district']) if params.get('district') else None,
+                int(params['state']) if params.get('state') else None,
+            ))
+        for listing in response.data:
+            keys.extend(listing_keys(listing))
+        return keys
+
+    def is_expensive(self, request):
+        # Redirects to a snapshot cost next to nothing.
+        if self.action == 'list' and snapshots.snapshot_url(request) is not None:
+            return False
+        return super().is_expensive(request)
+
+    def list(self, request, *args, **kwargs):
+        # The most common anonymous lists are prebuilt as static files.
+        url = snapshots.snapshot_url(request)
+        if url is not None:
+            return HttpResponseRedirect(url)
+        return super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        counters.record_view(response.data['id'])
+        return response
+
+    @action(detail=False, methods=['get'], url_path='changes')
+    def change_feed(self, request):
+        """
+        GET /api/properties/changes/?since=<cursor>&limit=500 - the listings
+        created, updated, deactivated or deleted after `since`, in commit
+        order, with the current payload of the live ones. Pass `next` back as
+        `since` until `has_more` is false. Without `since`, returns just the
+        current cursor, to continue from after a full download; 410 means
+        the cursor is too old and the listings must be downloaded again.
+        """
+        if 'since' not in request.query_params:
+            return Response({'next': changes.head(), 'has_more': False, 'changes': []})
+        try:
+            since = int(request.query_params['since'])
+        except ValueError:
+            raise ValidationError({'since': ["Expected an integer cursor."]})
+        try:
+            limit = min(max(int(request.query_params.get('limit', 500)), 1), 1000)
+        except ValueError:
+            raise ValidationError({'limit': ["Expected an integer."]})
+        if changes.expired(since):
+            return Response({'detail': "Cursor expired; download the listings again."}, status=status.HTTP_410_GONE)
+
+        rows, next_cursor, has_more = changes.read(since, limit)
+        ids = [listing_id for _, listing_id, kind in rows if kind != changes.DELETED]
+        live = {listing.pk: listing for listing in self.get_queryset().filter(pk__in=ids)}
+        inactive = set(PropertyListing.objects.filter(pk__in=set(ids) - set(live)).values_list('pk', flat=True))
+        payloads = {listing['id']: listing for listing in self.get_serializer(list(live.values()), many=True).data}
+
+        entries = []
+        for cursor, listing_id, kind in rows:
+            if listing_id in live:
+                action = 'created' if kind == changes.CREATED else 'updated'
+            else:
+                action = 'deactivated' if listing_id in inactive else 'deleted'
+            entries.append({'cursor': cursor, 'id': listing_id, 'action': action, 'listing': payloads.get(listing_id)})
+        return Response({'next': next_cursor, 'has_more': has_more, 'changes': entries})
+
+    @action(detail=True, methods=['get'], url_path='images')
+    def gallery(self, request, pk=None):
+        """
+        GET /api/properties/<id>/images/?page=2 - all of the listing's
+        images, thumbnail first, a page at a time.
+        """
+        listing = self.get_object()
+        images = listing.images.order_by('-is_thumbnail', 'id')
+        paginator = ImagePagination()
+        page = paginator.paginate_queryset(images, request, view=self)
+        serializer = PropertyImageSerializer(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['post'], throttle_classes=[ContactThrottle])
+    def contact(self, request, pk=None):
+        """
+        POST /api/properties/<id>/contact/ - record that someone asked for the
+        owner's contact details.
+        """
+        listing = self.get_object()
+        counters.record_contact(listing.pk)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """
+        GET /api/properties/<id>/similar/?k=10 - the active listings with the
+        same purpose and type that are closest to this one in feature space.
+        """
+        listing = self.get_object()
+        try:
+            k = min(max(int(request.query_params.get('k', 10)), 1), 50)
+        except ValueError:
+            k = 10
+
+        ids = similarity.similar_listing_ids(listing, k)
+        # The matrix may briefly lag behind other processes' writes, so
+        # re-apply the queryset's filters rather than trusting it blindly.
+        listings = {obj.pk: obj for obj in self.get_queryset().filter(pk__in=ids)}
+        ordered = [listings[i] for i in ids if i in listings]
+        serializer = self.get_serializer(ordered, many=True)
+        return Response(serializer.data)
+
 
 class AddPropertyViewSet(
     mixins.CreateModelMixin,   # Provides the .create() action
@@ -76,7 +289,7 @@ class AddPropertyViewSet(
         This is the magic. This view will ONLY ever show the listings
         that belong to the currently logged-in user.
         """
-        return PropertyListing.objects.filter(user=self.request.user)
+        return PropertyListing.objects.filter(user=self.request.user).select_related('signature')
 
     def get_serializer_context(self):
         """
@@ -84,4 +297,209 @@ class AddPropertyViewSet(
         Pass the request object to the serializer's context. This is crucial
         for the serializer to be able to access the logged-in user.
         """
-        return {'request': self.request}
\ No newline at end of file
+        return {'request': self.request}
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """
+        GET /api/add-property/stats/ - view and contact counts for each of
+        your listings.
+        """
+        listing_ids = self.get_queryset().values_list('pk', flat=True)
+        stats = counters.counts(list(listing_ids))
+        return Response([{'listing': listing_id, **counts} for listing_id, counts in stats.items()])
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request):
+        """
+        POST /api/add-property/bulk/ - create several listings from a JSON
+        array, all or nothing. Errors are returned per item, in order.
+        """
+        listings = bulk.create_listings(request.user, request.data, self.get_serializer_class(), self.get_serializer_context())
+        serializer = self.get_serializer(listings, many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @bulk_create.mapping.patch
+    def bulk_update(self, request):
+        """
+        PATCH /api/add-property/bulk/ - partially update several of your
+        listings; each item carries the listing's `id`.
+        """
+        listings = bulk.update_listings(self.get_queryset(), request.data, self.get_serializer_class(), self.get_serializer_context())
+        serializer = self.get_serializer(listings, many=True)
+        return Response(serializer.data)
+
+
+class ArchivedListingViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Listings moved out of the live table by `manage.py archive_listings`.
+    Owners see their own archived listings and admins see all of them;
+    either can put one back with the `restore` action.
+    """
+    serializer_class = ArchivedListingSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = ArchivedListing.objects.prefetch_related('images')
+        if self.request.user.is_staff:
+            return queryset
+        return queryset.filter(user=self.request.user)
+
+    @action(detail=True, methods=['post'])
+    def restore(self, request, pk=None):
+        """
+        POST /api/archived-properties/<id>/restore/ - move the listing back
+        to the live table under its original id.
+        """
+        listing = archive.restore_listing(self.get_object())
+        serializer = PropertyListingSerializer(listing, context=self.get_serializer_context())
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class SavedSearchViewSet(LoadControlMixin, viewsets.ModelViewSet):
+    """
+    Lets logged-in users save a set of `PropertyFilter` parameters and see the
+    listings that matched it since it was saved.
+    """
+    serializer_class = SavedSearchSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    # Only the user id is needed here, so skip loading the user entirely.
+    authentication_classes = [ClaimsOnlyJWTAuthentication]
+
+    load_scope = 'saved_searches'
+    expensive_actions = ('matches',)
+
+    def get_queryset(self):
+        return SavedSearch.objects.filter(user_id=self.request.user.pk)
+
+    def perform_create(self, serializer):
+        serializer.save(user_id=self.request.user.pk)
+
+    @action(detail=True, methods=['get'])
+    def matches(self, request, pk=None):
+        """
+        GET /api/saved-searches/<id>/matches/ - the active listings that matched this search.
+        """
+        search = self.get_object()
+        listings = (
+            PropertyListing.objects
+            .filter(is_active=True, saved_search_matches__saved_search=search)
+            .select_related('user', 'state', 'district')
+            .prefetch_related('facilities', card_images_prefetch())
+        )
+        page = self.paginate_queryset(listings)
+        if page is not None:
+            serializer = PropertyListingCardSerializer(page, many=True, context=self.get_serializer_context())
+            return self.get_paginated_response(serializer.data)
+        serializer = PropertyListingCardSerializer(listings, many=True, context=self.get_serializer_context())
+        return Response(serializer.data)
+
+
+class PricePerAreaAnalyticsView(EdgeCacheMixin, LoadControlMixin, APIView):
+    """
+    Price per sqft statistics for active listings, served from the
+    pre-aggregated summary table, e.g.:
+    /api/analytics/price-per-sqft/?district=27&property_type=LAND
+    /api/analytics/price-per-sqft/?listing_purpose=SELL&group_by=district&percentiles=10,50,90
+
+    Filters: state, district, property_type, listing_purpose. Slices are merged
+    to answer any combination, so the cost depends only on the number of
+    slices, never on the number of listings.
+    """
+    load_scope = 'analytics'
+    # Not purged: the figures move slowly, so they just expire.
+    edge_cache_policy = 'analytics'
+    GROUP_BY_FIELDS = {'district': 'district_id', 'property_type': 'property_type', 'listing_purpose': 'listing_purpose'}
+    DEFAULT_PERCENTILES = '25,50,75,90'
+
+    def get(self, request):
+        params = request.query_params
+        summaries = PricePerAreaSummary.objects.all()
+        for param, lookup in (('state', 'district__state_id'), ('district', 'district_id')):
+            if params.get(param):
+                try:
+                    summaries = summaries.filter(**{lookup: int(params[param])})
+                except ValueError:
+                    raise ValidationError({param: "Must be an integer id."})
+        for param in ('property_type', 'listing_purpose'):
+            if params.get(param):
+                summaries = summaries.filter(**{param: params[param]})
+
+        try:
+            percentiles = [float(p) for p in params.get('percentiles', self.DEFAULT_PERCENTILES).split(',') if p]
+        except ValueError:
+            raise ValidationError({'percentiles': "Must be a comma-separated list of numbers."})
+        if not percentiles or any(not 0 <= p <= 100 for p in percentiles):
+            raise ValidationError({'percentiles': "Each percentile must be between 0 and 100."})
+
+        group_by = params.get('group_by')
+        if group_by and group_by not in self.GROUP_BY_FIELDS:
+            raise ValidationError({'group_by': f"Must be one of: {', '.join(self.GROUP_BY_FIELDS)}."})
+
+        groups = {}
+        for summary in summaries:
+            key = getattr(summary, self.GROUP_BY_FIELDS[group_by]) if group_by else None
+            group = groups.setdefault(key, {'sketch': analytics.QuantileSketch(), 'count': 0, 'total': 0.0})
+            group['sketch'].merge(analytics.QuantileSketch(summary.sketch))
+            group['count'] += summary.count
+            group['total'] += summary.total
+
+        if not group_by:
+            groups.setdefault(None, {'sketch': analytics.QuantileSketch(), 'count': 0, 'total': 0.0})
+
+        results = []
+        for key, group in groups.items():
+            values = group['sketch'].quantiles([p / 100 for p in percentiles])
+            result = {
+                'count': group['count'],
+                'mean': group['total'] / group['count'] if group['count'] else None,
+                'median': group['sketch'].quantiles([0.5])[0],
+                'percentiles': {f"{p:g}": v for p, v in zip(percentiles, values)},
+            }
+            if group_by:
+                result = {group_by: key, **result}
+            results.append(result)
+
+        if not group_by:
+            return Response(results[0])
+        return Response(results)
+
+
+class LocationSuggestView(EdgeCacheMixin, APIView):
+    """
+    Typeahead for the search box: local areas, districts and states matching
+    what has been typed so far, e.g. /api/locations/suggest/?q=budh&limit=5
+    Served from an in-memory index (see locations.py).
+    """
+    throttle_scope = 'locations'
+    edge_cache_policy = 'locations'
+
+    def get(self, request):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 25)
+        except ValueError:
+            limit = 10
+        return Response(locations.suggest(request.query_params.get('q', ''), limit))
+
+
+class MetricsView(APIView):
+    """
+    Admin-only: this process's request timing metrics in the Prometheus text
+    format, for scraping. Also reachable with the Django admin session.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    authentication_classes = list(api_settings.DEFAULT_AUTHENTICATION_CLASSES) + [SessionAuthentication]
+
+    def get(self, request):
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class TokenRefreshView(get_refresh_view()):
+    """
+    dj_rest_auth's token refresh endpoint (with rotation and blacklisting),
+    using the Bloom-filtered blacklist check.
+    """
+    # Throttled like the dj_rest_auth endpoints it replaces (see throttling.py).
+    throttle_scope = 'auth'
+    serializer_class = TokenRefreshSerializer